@@ -9,27 +9,42 @@ public class ExampleIntegration {
     try {
       ProcessBuilder pb = new ProcessBuilder();
 
+      // --progress writes one JSON object per line to stdout; log messages go to stderr
       pb.command(
         "/usr/local/opt/python36/bin/python3.6",
         "app.py",
-        "--debug",
+        "--progress",
         "--simulate-tobii"
       );
 
       Process process = pb.start();
 
-			// blocked :(
-      BufferedReader outputReader = new BufferedReader(new InputStreamReader(process.getInputStream()));
+      // Drain stderr on its own thread, so neither pipe can fill up and block the app
       BufferedReader errorReader = new BufferedReader(new InputStreamReader(process.getErrorStream()));
+      Thread errorThread = new Thread(() -> {
+        try {
+          String errorLine;
+          while ((errorLine = errorReader.readLine()) != null) {
+            System.out.println("Log: " + errorLine);
+          }
+        } catch (IOException e) {
+          e.printStackTrace();
+        }
+      });
+      errorThread.start();
+
+      BufferedReader outputReader = new BufferedReader(new InputStreamReader(process.getInputStream()));
 
+      // Each line is an event such as
+      //   {"event": "phase", "tracker": "...", "phase": "calibrating", ...}
+      //   {"event": "point", "tracker": "...", "index": 2, "name": "LOWER_LEFT", "point": [0.1, 0.9], "successes": 4, ...}
+      // Use a JSON library to parse them; here they are only echoed
       String line;
       while ((line = outputReader.readLine()) != null) {
-          System.out.println("Output: " + line);
+          System.out.println("Progress: " + line);
       }
 
-      while ((line = errorReader.readLine()) != null) {
-          System.out.println("Error: " + line);
-      }
+      errorThread.join();
 
       int exitCode = process.waitFor();
       System.out.println("\nExited with error code : " + exitCode);
@@ -1,10 +1,15 @@
+# Time to first frame is measured from here, before anything heavy is imported
+import time
+launched = time.perf_counter()
+
 import argparse
+import logging
+import sys
 
-from calibration_app import CalibrationApp
+import startup
+startup.report.launched = launched
 
-# Flush output by default (it gets buffered otherwise)
-import functools
-print = functools.partial(print, flush=True)
+CalibrationApp = startup.report.timed_import('calibration_app').CalibrationApp
 
 parser = argparse.ArgumentParser()
 parser.add_argument(
@@ -17,15 +22,127 @@ parser.add_argument(
     action='store_true',
     help='Enables debug mode (increased, more detailed reporting)',
 )
+parser.add_argument(
+    '--headless',
+    nargs='?',
+    const='null',
+    choices=['null', 'logging', 'recording'],
+    help='Run without a display, sending progress to a null (default), logging or recording sink',
+)
+parser.add_argument(
+    '--seed',
+    type=int,
+    help='Seed for the mock Tobii API, making simulated sessions reproducible',
+)
+parser.add_argument(
+    '--virtual-time',
+    action='store_true',
+    help='Run the mock Tobii API on a virtual clock (a simulated session takes no wall time)',
+)
+parser.add_argument(
+    '--record',
+    metavar='DIRECTORY',
+    help='Record the raw user position guides and calibration results into this directory',
+)
+parser.add_argument(
+    '--replay',
+    metavar='DIRECTORY',
+    help='Replay a session recorded with --record instead of using a tracker',
+)
+parser.add_argument(
+    '--replay-at-recorded-speed',
+    action='store_true',
+    help='Replay with the original timing (by default, replays as fast as possible)',
+)
+parser.add_argument(
+    '--all-trackers',
+    action='store_true',
+    help='Calibrate every connected tracker at once, each on its own display',
+)
+parser.add_argument(
+    '--mock-trackers',
+    type=int,
+    default=1,
+    help='How many trackers the mock Tobii API exposes',
+)
+parser.add_argument(
+    '--trace-latency',
+    action='store_true',
+    help='Time each user position sample through every stage up to the screen (shown with --debug, dumped at exit)',
+)
+parser.add_argument(
+    '--progress',
+    action='store_true',
+    help='Write progress to stdout as newline-delimited JSON for a host application (log messages go to stderr)',
+)
+parser.add_argument(
+    '--verbose',
+    action='store_true',
+    help='Log every step, including each collect_data attempt',
+)
+parser.add_argument(
+    '--daemon',
+    action='store_true',
+    help='Stay running with everything loaded, and calibrate whenever a request arrives over TCP loopback (see daemon.py)',
+)
+parser.add_argument(
+    '--daemon-port',
+    type=int,
+    help='Port for --daemon to listen on (default: daemon_port from config.ini)',
+)
+parser.add_argument(
+    '--startup-report',
+    action='store_true',
+    help='Log how long imports took and when each startup milestone (trackers found, first frame...) was reached',
+)
+parser.add_argument(
+    '--calibration-cache',
+    action='store_true',
+    help='Reapply calibration data cached for this tracker (and --user-id) instead of calibrating, and cache new calibrations',
+)
+parser.add_argument(
+    '--user-id',
+    help='Who is being calibrated, so several users of one tracker each get their own cached calibration',
+)
 args = parser.parse_args()
 
-if args.simulate_tobii:
-    import mock_tobii_research as tobii_api
+if args.daemon and (args.progress or args.record):
+    parser.error("--daemon streams progress to each request's connection and cannot --record")
+
+if args.calibration_cache and (args.record or args.replay):
+    parser.error("--calibration-cache skips the data collection that --record and --replay depend on")
+
+logging.basicConfig(
+    stream=sys.stderr if args.progress else sys.stdout,
+    level=logging.DEBUG if args.verbose else logging.INFO,
+    format='%(message)s',
+)
+
+if args.replay:
+    tobii_api = startup.report.timed_import('replay_tobii_research')
+    tobii_api.configure(args.replay, recorded_speed=args.replay_at_recorded_speed)
+elif args.simulate_tobii:
+    tobii_api = startup.report.timed_import('mock_tobii_research')
+    tobii_api.configure(seed=args.seed, virtual_time=args.virtual_time, tracker_count=args.mock_trackers)
 else:
-    import tobii_research as tobii_api
+    tobii_api = startup.report.timed_import('tobii_research')
 
-app = CalibrationApp(api=tobii_api, debug=args.debug)
+app = CalibrationApp(
+    api=tobii_api,
+    debug=args.debug,
+    headless=args.headless,
+    record_path=args.record,
+    all_trackers=args.all_trackers,
+    trace_latency=args.trace_latency,
+    progress_stream=sys.stdout if args.progress else None,
+    daemon=args.daemon,
+    daemon_port=args.daemon_port,
+    launched=launched,
+    startup_report=args.startup_report,
+    calibration_cache=args.calibration_cache,
+    user_id=args.user_id,
+)
 app.start()
 
-print("Very final exit")
+logging.debug("Very final exit")
 exit(0)
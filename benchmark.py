@@ -0,0 +1,1002 @@
+import argparse
+import contextlib
+import io
+import json
+from random import Random
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+from calibration_cache import CalibrationCache
+from cancellation import CancellationToken
+from channels import LatestValueMailbox
+from clocks import VirtualClock
+from collection import collection_strategies
+import config
+from eyetrackers import TobiiEyeTracker
+from filters import head_filters
+from layouts import build_layout, layout_positions, path_length
+from models import PointLocation, UserPosition, UserPositionGuide, UserPositionGuideRing
+from progress import ProgressReporter, ProgressSink
+from scoring import UserPositionScorer, batch_score
+from sinks import CalibrationSink, CompositeSink, MailboxSink
+from stats import summarize
+from validation import GazeRingBuffer, measure
+import mock_tobii_research
+
+# Flush output by default (it gets buffered otherwise)
+import functools
+print = functools.partial(print, flush=True)
+
+class ReferenceUserPositionScorer(UserPositionScorer):
+    """
+    The original O(window) scorer: keeps every guide and re-scores the whole
+    window on each call. Kept here as the baseline the ring buffer is
+    measured (and checked) against.
+    """
+
+    def __init__(self, positions_range=None):
+        UserPositionScorer.__init__(self, positions_range)
+        self.recent_positions = []
+
+    def add_positions(self, guide):
+        if len(self.recent_positions) < self.positions_range:
+            self.recent_positions.append(guide)
+        else:
+            self.recent_positions.pop(0)
+            self.recent_positions.append(guide)
+
+    def calculate_total_score(self):
+        total_score = 0
+
+        for positions in self.recent_positions:
+            total_score += self.calculate_score_for_positions(positions)
+
+        return total_score / self.positions_range
+
+def generate_guides(count, seed):
+    """Random head walk around the target, similar to mock_tobii_research"""
+    random = Random(seed)
+
+    x, y, z = 0.5, 0.5, 0.5
+    guides = []
+
+    for _ in range(count):
+        x += random.randint(-1, 1) / 500
+        y += random.randint(-1, 1) / 500
+        z += random.randint(-1, 1) / 500
+
+        valid = random.random() > 0.02  # Occasionally lose track of the eyes
+
+        guides.append(UserPositionGuide(
+            UserPosition(x=x - 0.06, y=y, z=z, valid=valid),
+            UserPosition(x=x + 0.06, y=y, z=z, valid=valid),
+        ))
+
+    return guides
+
+def time_scorer(scorer, guides):
+    """Returns (seconds per sample, list of total scores)"""
+    totals = []
+
+    start = time.perf_counter()
+
+    for guide in guides:
+        scorer.add_positions(guide)
+        totals.append(scorer.calculate_total_score())
+
+    elapsed = time.perf_counter() - start
+
+    return elapsed / len(guides), totals
+
+def benchmark_scorer(args):
+    guides = generate_guides(args.samples, args.seed)
+
+    print(f"{'window':>8} {'reference (us)':>16} {'ring buffer (us)':>18} {'speedup':>9} {'max diff':>10}")
+
+    for window in args.windows:
+        reference_cost, reference_totals = time_scorer(ReferenceUserPositionScorer(window), guides)
+        ring_cost, ring_totals = time_scorer(UserPositionScorer(window), guides)
+
+        max_diff = max(abs(a - b) for a, b in zip(reference_totals, ring_totals))
+
+        print(
+            f"{window:>8} {reference_cost * 1e6:>16.2f} {ring_cost * 1e6:>18.2f} "
+            f"{reference_cost / ring_cost:>8.1f}x {max_diff:>10.1e}"
+        )
+
+        if max_diff > 1e-9:
+            raise Exception(f"Ring buffer scorer diverged from reference at window {window}")
+
+def guides_to_arrays(guides):
+    left_xyz = np.array([(g.left_position.x, g.left_position.y, g.left_position.z) for g in guides])
+    right_xyz = np.array([(g.right_position.x, g.right_position.y, g.right_position.z) for g in guides])
+    left_valid = np.array([g.left_position.valid for g in guides])
+    right_valid = np.array([g.right_position.valid for g in guides])
+
+    return left_xyz, right_xyz, left_valid, right_valid
+
+def benchmark_batch(args):
+    guides = generate_guides(args.samples, args.seed)
+    arrays = guides_to_arrays(guides)
+
+    print(f"{'window':>8} {'per-object (us)':>16} {'batch (us)':>12} {'speedup':>9} {'max diff':>10}")
+
+    for window in args.windows:
+        object_cost, object_totals = time_scorer(UserPositionScorer(window), guides)
+
+        start = time.perf_counter()
+        _, batch_totals = batch_score(*arrays, positions_range=window)
+        batch_cost = (time.perf_counter() - start) / len(guides)
+
+        max_diff = np.max(np.abs(np.array(object_totals) - batch_totals))
+
+        print(
+            f"{window:>8} {object_cost * 1e6:>16.3f} {batch_cost * 1e6:>12.3f} "
+            f"{object_cost / batch_cost:>8.1f}x {max_diff:>10.1e}"
+        )
+
+        if max_diff > 1e-9:
+            raise Exception(f"Batch scores diverged from UserPositionScorer at window {window}")
+
+def run_calibration_sessions(runs, seed, virtual_time, success_rate, head_drift,
+                             collection_strategy=None, weak_points=(), weak_success_rate=0.2, layout=None,
+                             gaze_frequency=600, gaze_error=0.01, position_noise=0.0, head_filter=None, score_window=None):
+    """Runs TobiiEyeTracker.calibrate on the mock tracker. Returns their CalibrationReports"""
+    reports = []
+
+    for run in range(runs):
+        mock_tobii_research.configure(
+            seed=seed + run,
+            virtual_time=virtual_time,
+            success_rate=success_rate,
+            head_drift=head_drift,
+            weak_points=weak_points,
+            weak_success_rate=weak_success_rate,
+            gaze_frequency=gaze_frequency,
+            gaze_error=gaze_error,
+            position_noise=position_noise,
+        )
+
+        eyetracker = TobiiEyeTracker(
+            api=mock_tobii_research,
+            collection_strategy=collection_strategy,
+            layout=layout,
+            head_filter=head_filter,
+            score_window=score_window,
+        )
+
+        # Logging is left unconfigured, so the tracker's progress messages are dropped
+        eyetracker.calibrate()
+
+        reports.append(eyetracker.report)
+
+    return reports
+
+def summarize_reports(reports):
+    points = [point for report in reports for point in report.points]
+
+    return {
+        'time_to_position': summarize([report.time_to_position for report in reports]),
+        'point_duration': summarize([point['duration'] for point in points]),
+        'point_attempts': summarize([point['attempts'] for point in points]),
+        'session_attempts': summarize([sum(point['attempts'] for point in report.points) for report in reports]),
+        'compute_and_apply_time': summarize([report.compute_and_apply_time for report in reports]),
+        'total_time': summarize([report.total_time for report in reports]),
+    }
+
+def current_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def benchmark_calibration(args):
+    results = []
+
+    print(
+        f"{'success':>8} {'drift':>12} {'position (s)':>13} {'point (s)':>10} "
+        f"{'attempts':>9} {'compute (s)':>12} {'total p50 (s)':>14} {'total p90 (s)':>14}"
+    )
+
+    for success_rate in args.success_rates:
+        for head_drift in args.head_drifts:
+            reports = run_calibration_sessions(
+                runs=args.runs,
+                seed=args.seed,
+                virtual_time=not args.real_time,
+                success_rate=success_rate,
+                head_drift=head_drift,
+            )
+
+            metrics = summarize_reports(reports)
+
+            results.append({
+                'success_rate': success_rate,
+                'head_drift': head_drift,
+                'runs': args.runs,
+                'metrics': metrics,
+            })
+
+            print(
+                f"{success_rate:>8.2f} {head_drift:>12} "
+                f"{metrics['time_to_position']['mean']:>13.3f} "
+                f"{metrics['point_duration']['mean']:>10.3f} "
+                f"{metrics['point_attempts']['mean']:>9.2f} "
+                f"{metrics['compute_and_apply_time']['mean']:>12.3f} "
+                f"{metrics['total_time']['p50']:>14.3f} "
+                f"{metrics['total_time']['p90']:>14.3f}"
+            )
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({
+                'commit': current_commit(),
+                'seed': args.seed,
+                'virtual_time': not args.real_time,
+                'results': results,
+            }, output_file, indent=2)
+
+        print(f"Wrote {args.output}")
+
+def collection_quality(reports, weak_points):
+    """
+    Fractions of weak points accepted and of good points given up on, in the
+    first pass, and of good points still given up on once recollected
+    """
+    points = [point for report in reports for point in report.points if point['recalibration_round'] == 0]
+
+    weak = [point for point in points if tuple(point['point']) in weak_points]
+    good = [point for point in points if tuple(point['point']) not in weak_points]
+
+    # Each point's last collection in each session
+    last_good = [
+        point
+        for report in reports
+        for point in {tuple(point['point']): point for point in report.points}.values()
+        if tuple(point['point']) not in weak_points
+    ]
+
+    def fraction(selected, outcome):
+        if not selected:
+            return None
+
+        return sum(1 for point in selected if point['outcome'] == outcome) / len(selected)
+
+    return {
+        'weak_accepted': fraction(weak, 'accepted'),
+        'good_given_up': fraction(good, 'gave_up'),
+        'good_finally_given_up': fraction(last_good, 'gave_up'),
+    }
+
+def benchmark_collection(args):
+    """Compares collection strategies on the same seeded sessions"""
+    weak_points = [location.value for location in PointLocation][-args.weak_points:] if args.weak_points else []
+
+    print(
+        f"{'success':>8} {'strategy':>10} {'attempts':>9} {'total p50 (s)':>14} {'total p90 (s)':>14} "
+        f"{'weak accepted':>14} {'good given up':>14} {'still given up':>15}"
+    )
+
+    def percent(fraction):
+        return "-" if fraction is None else f"{fraction * 100:0.1f}%"
+
+    results = []
+
+    for success_rate in args.success_rates:
+        for strategy in args.strategies:
+            reports = run_calibration_sessions(
+                runs=args.runs,
+                seed=args.seed,
+                virtual_time=True,
+                success_rate=success_rate,
+                head_drift=args.head_drift,
+                collection_strategy=strategy,
+                weak_points=weak_points,
+                weak_success_rate=args.weak_success_rate,
+            )
+
+            metrics = summarize_reports(reports)
+            quality = collection_quality(reports, weak_points)
+
+            results.append({
+                'success_rate': success_rate,
+                'strategy': strategy,
+                'runs': args.runs,
+                'metrics': metrics,
+                'quality': quality,
+            })
+
+            print(
+                f"{success_rate:>8.2f} {strategy:>10} "
+                f"{metrics['session_attempts']['mean']:>9.1f} "
+                f"{metrics['total_time']['p50']:>14.3f} "
+                f"{metrics['total_time']['p90']:>14.3f} "
+                f"{percent(quality['weak_accepted']):>14} "
+                f"{percent(quality['good_given_up']):>14} "
+                f"{percent(quality['good_finally_given_up']):>15}"
+            )
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({
+                'commit': current_commit(),
+                'seed': args.seed,
+                'weak_points': weak_points,
+                'weak_success_rate': args.weak_success_rate,
+                'results': results,
+            }, output_file, indent=2)
+
+        print(f"Wrote {args.output}")
+
+def run_recalibration_sessions(runs, seed, success_rate, head_drift, weak_points, weak_success_rate, targeted, max_rounds):
+    """
+    Sessions with weak points, fixed either by re-collecting just those
+    points (targeted) or by the operator rerunning the whole calibration.
+    Returns (total time, collect_data calls, still weak) for each run.
+    """
+    outcomes = []
+
+    for run in range(runs):
+        mock_tobii_research.configure(
+            seed=seed + run,
+            virtual_time=True,
+            success_rate=success_rate,
+            head_drift=head_drift,
+            weak_points=weak_points,
+            weak_success_rate=weak_success_rate,
+        )
+
+        eyetracker = TobiiEyeTracker(
+            api=mock_tobii_research,
+            max_recalibration_rounds=max_rounds if targeted else 0,
+        )
+
+        total_time = 0
+        attempts = 0
+
+        # A full rerun repeats the whole session, user positioning included
+        for session in range(1 if targeted else max_rounds + 1):
+            eyetracker.calibrate()
+
+            total_time += eyetracker.report.total_time
+            attempts += sum(point['attempts'] for point in eyetracker.report.points)
+
+            if not eyetracker.report.weak_points:
+                break
+
+        outcomes.append((total_time, attempts, bool(eyetracker.report.weak_points)))
+
+    return outcomes
+
+def benchmark_recalibration(args):
+    weak_points = [location.value for location in PointLocation][-args.weak_points:] if args.weak_points else []
+
+    print(f"{'success':>8} {'policy':>10} {'total p50 (s)':>14} {'total p90 (s)':>14} {'attempts':>9} {'still weak':>11}")
+
+    for success_rate in args.success_rates:
+        for policy in ['targeted', 'full rerun']:
+            outcomes = run_recalibration_sessions(
+                runs=args.runs,
+                seed=args.seed,
+                success_rate=success_rate,
+                head_drift=args.head_drift,
+                weak_points=weak_points,
+                weak_success_rate=args.weak_success_rate,
+                targeted=policy == 'targeted',
+                max_rounds=args.max_rounds,
+            )
+
+            total_time = summarize([total for total, _, _ in outcomes])
+            attempts = summarize([attempts for _, attempts, _ in outcomes])
+            still_weak = sum(1 for _, _, weak in outcomes if weak) / len(outcomes)
+
+            print(
+                f"{success_rate:>8.2f} {policy:>10} "
+                f"{total_time['p50']:>14.3f} {total_time['p90']:>14.3f} "
+                f"{attempts['mean']:>9.1f} {still_weak * 100:>10.1f}%"
+            )
+
+def benchmark_layouts(args):
+    """Session time and gaze travel of each calibration layout"""
+    print(
+        f"{'layout':>7} {'points':>7} {'success':>8} {'total p50 (s)':>14} {'total p90 (s)':>14} "
+        f"{'attempts':>9} {'travel':>7} {'unordered':>10}"
+    )
+
+    for layout_name in args.layouts:
+        layout = build_layout(layout_name, args.margin)
+
+        # The same points in the order they are listed, for comparison with the schedule
+        unordered_travel = path_length([position for _, position in layout_positions[layout_name](args.margin)])
+
+        for success_rate in args.success_rates:
+            reports = run_calibration_sessions(
+                runs=args.runs,
+                seed=args.seed,
+                virtual_time=True,
+                success_rate=success_rate,
+                head_drift=args.head_drift,
+                layout=layout,
+            )
+
+            total_time = summarize([report.total_time for report in reports])
+            attempts = summarize([sum(point['attempts'] for point in report.points) for report in reports])
+
+            print(
+                f"{layout_name:>7} {len(layout):>7} {success_rate:>8.2f} "
+                f"{total_time['p50']:>14.3f} {total_time['p90']:>14.3f} {attempts['mean']:>9.1f} "
+                f"{layout.gaze_travel():>7.2f} {unordered_travel:>10.2f}"
+            )
+
+def benchmark_validation(args):
+    """Time spent validating, and how often it passes, against gaze rate and calibration error"""
+    print(
+        f"{'rate (Hz)':>9} {'error':>6} {'measuring p50 (s)':>18} {'total p50 (s)':>14} "
+        f"{'passed':>7} {'recollected':>12}"
+    )
+
+    for gaze_frequency in args.gaze_frequencies:
+        for gaze_error in args.gaze_errors:
+            reports = run_calibration_sessions(
+                runs=args.runs,
+                seed=args.seed,
+                virtual_time=True,
+                success_rate=args.success_rate,
+                head_drift=args.head_drift,
+                gaze_frequency=gaze_frequency,
+                gaze_error=gaze_error,
+            )
+
+            validation_time = summarize([sum(target['duration'] for target in report.validation) for report in reports])
+            total_time = summarize([report.total_time for report in reports])
+            passed = sum(1 for report in reports if not report.validation_failures) / len(reports)
+            recollected = sum(1 for report in reports if report.recalibration_rounds) / len(reports)
+
+            print(
+                f"{gaze_frequency:>9} {gaze_error:>6.3f} {validation_time['p50']:>18.3f} {total_time['p50']:>14.3f} "
+                f"{passed * 100:>6.1f}% {recollected * 100:>11.1f}%"
+            )
+
+    # One measurement of a full window, as the calibrating thread takes them
+    gaze = GazeRingBuffer(args.window)
+    random = Random(args.seed)
+
+    for _ in range(args.window + 1):
+        gaze.append(random.gauss(0.5, 0.01), random.gauss(0.5, 0.01))
+
+    started = time.perf_counter()
+
+    for _ in range(args.measurements):
+        measure(gaze, (0.5, 0.5))
+
+    measure_time = (time.perf_counter() - started) / args.measurements
+
+    print(f"measure() over {args.window} samples: {measure_time * 1e6:.1f} us")
+
+def head_track(samples, seed, head_drift, position_noise):
+    """Noisy user position guide dicts from the mock, with the true left eye position behind each"""
+    guide_dicts = []
+    truths = []
+
+    def callback(guide_dict):
+        guide_dicts.append(guide_dict)
+        truths.append((worker.left_position.x, worker.left_position.y, worker.left_position.z))
+
+    worker = mock_tobii_research.MockUserPositionThread(
+        callback,
+        Random(seed),
+        VirtualClock(),
+        mock_tobii_research.head_drift_profiles[head_drift],
+        position_noise,
+    )
+
+    for _ in range(samples):
+        worker.step()
+
+    return guide_dicts, np.array(truths)
+
+def filter_track(filter_name, guide_dicts, lead_samples):
+    """Left eye (filtered, predicted lead_samples ahead) arrays, and seconds per update"""
+    head_filter = head_filters[filter_name](config.current())
+    interval = mock_tobii_research.USER_POSITION_GUIDE_INTERVAL
+    lead = lead_samples * interval
+
+    filtered = np.empty((len(guide_dicts), 3))
+    predicted = np.empty((len(guide_dicts), 3))
+    update_time = 0
+
+    for index, guide_dict in enumerate(guide_dicts):
+        guide = UserPositionGuide.from_dict(guide_dict)
+
+        started = time.perf_counter()
+        head_filter.update(guide, index * interval)
+        update_time += time.perf_counter() - started
+
+        left = guide.left_position
+        filtered[index] = (left.x, left.y, left.z)
+        predicted[index] = (left.x + left.vx * lead, left.y + left.vy * lead, left.z + left.vz * lead)
+
+    return filtered, predicted, update_time / len(guide_dicts)
+
+def benchmark_filters(args):
+    """How far each head filter is from the true head position, how much it jitters, and time to position"""
+    def rms(differences):
+        return float(np.sqrt(np.mean(np.sum(differences ** 2, axis=1))))
+
+    print(
+        f"{'noise':>6} {'filter':>12} {'error':>8} {'predicted':>10} {'jitter':>8} {'update (us)':>12}"
+        + "".join(f" {f'position p50 @{window}':>18}" for window in args.windows)
+    )
+
+    for position_noise in args.position_noises:
+        guide_dicts, truths = head_track(args.samples, args.seed, args.head_drift, position_noise)
+        lead_samples = args.lead_samples
+
+        for filter_name in args.filters:
+            filtered, predicted, update_time = filter_track(filter_name, guide_dicts, lead_samples)
+
+            error = rms(filtered - truths)
+            prediction_error = rms(predicted[:-lead_samples] - truths[lead_samples:])
+            jitter = rms(np.diff(filtered, axis=0))
+
+            times_to_position = []
+
+            for window in args.windows:
+                reports = run_calibration_sessions(
+                    runs=args.runs,
+                    seed=args.seed,
+                    virtual_time=True,
+                    success_rate=0.95,
+                    head_drift=args.head_drift,
+                    position_noise=position_noise,
+                    head_filter=filter_name,
+                    score_window=window,
+                )
+
+                times_to_position.append(summarize([report.time_to_position for report in reports])['p50'])
+
+            print(
+                f"{position_noise:>6.3f} {filter_name:>12} {error:>8.4f} {prediction_error:>10.4f} {jitter:>8.4f} "
+                f"{update_time * 1e6:>12.2f}"
+                + "".join(f" {time_to_position:>18.2f}" for time_to_position in times_to_position)
+            )
+
+def benchmark_cache(args):
+    """A returning user's first (full) session against their second, which reuses the cached calibration"""
+    print(f"{'success':>8} {'session':>8} {'total p50 (s)':>14} {'total p90 (s)':>14} {'reused':>7}")
+
+    for success_rate in args.success_rates:
+        first_times = []
+        second_times = []
+        reused = 0
+
+        with tempfile.TemporaryDirectory() as cache_path:
+            cache = CalibrationCache(cache_path, max_age=3600, max_size=10_000_000)
+
+            for run in range(args.runs):
+                mock_tobii_research.configure(
+                    seed=args.seed + run,
+                    virtual_time=True,
+                    success_rate=success_rate,
+                    head_drift=args.head_drift,
+                )
+
+                eyetracker = TobiiEyeTracker(api=mock_tobii_research, cache=cache, user_id=f"user {run}")
+
+                for times in [first_times, second_times]:
+                    eyetracker.calibrate()
+                    times.append(eyetracker.report.total_time)
+
+                reused += eyetracker.report.reused_cached_calibration
+
+        for session, times in [('first', first_times), ('second', second_times)]:
+            total_time = summarize(times)
+
+            print(
+                f"{success_rate:>8.2f} {session:>8} "
+                f"{total_time['p50']:>14.3f} {total_time['p90']:>14.3f} "
+                + (f"{reused / args.runs * 100:>6.1f}%" if session == 'second' else f"{'':>7}")
+            )
+
+class ReplayingEyeTracker:
+    """
+    Stands in for a device: feeds prepared guide dicts straight into the
+    user position callback, on the subscribing thread, tracing the
+    allocations made after the first warmup samples
+    """
+
+    def __init__(self, guide_dicts, warmup):
+        self.guide_dicts = guide_dicts
+        self.warmup = warmup
+        self.allocated = None  # (bytes held afterwards, peak bytes) over the traced samples
+
+    def subscribe_to(self, subscription_type, callback, as_dictionary=False):
+        for guide_dict in self.guide_dicts[:self.warmup]:
+            callback(guide_dict)
+
+        self.allocated = traced_allocations(callback, self.guide_dicts[self.warmup:])
+
+    def unsubscribe_from(self, subscription_type, callback=None):
+        pass
+
+def traced_allocations(function, arguments):
+    """
+    Bytes still held after calling function on each argument, and the peak
+    above the start, less what measuring itself allocates
+    """
+    def measured(function):
+        # Restarting resets the peak, which tracemalloc.reset_peak() would
+        # only do from Python 3.9
+        frames = tracemalloc.get_traceback_limit()
+        tracemalloc.stop()
+        tracemalloc.start(frames)
+        before = tracemalloc.get_traced_memory()[0]
+
+        for argument in arguments:
+            function(argument)
+
+        current, peak = tracemalloc.get_traced_memory()
+
+        return current - before, peak - before
+
+    held_overhead, peak_overhead = measured(lambda argument: None)
+    held, peak = measured(function)
+
+    return held - held_overhead, peak - peak_overhead
+
+@contextlib.contextmanager
+def position_requirement(requirement):
+    """A config snapshot with this user_position_score_requirement, while inside"""
+    snapshot = config.snapshot
+    config.snapshot = snapshot.replace(user_position_score_requirement=requirement)
+
+    try:
+        yield
+    finally:
+        config.snapshot = snapshot
+
+def unreachable_position_requirement():
+    """A config snapshot whose user_position_score_requirement no score reaches, while inside"""
+    return position_requirement(2.0)
+
+def tracking_allocations(guide_dicts, warmup, head_filter, in_position=False, sink=None):
+    """
+    (bytes held, peak bytes) allocated by the tracker's user position
+    callback after warmup samples, on its way to sink (by default a mailbox,
+    as the GUI's sink hands samples over) and the --progress stream.
+    in_position traces samples after the score has crossed the requirement,
+    and otherwise before it ever does. tracemalloc has to be tracing already
+    """
+    # No flushes while tracing: the reporter's thread allocates for its own output
+    reporter = ProgressReporter(io.StringIO(), interval=3600)
+
+    replaying = ReplayingEyeTracker(guide_dicts, warmup)
+    eyetracker = TobiiEyeTracker(
+        api=mock_tobii_research,
+        eyetracker=replaying,
+        sink=CompositeSink(sink or MailboxSink(LatestValueMailbox()), ProgressSink(reporter, 'benchmark')),
+        head_filter=head_filter,
+    )
+
+    # Crossed by the very first sample, or never
+    try:
+        with position_requirement(0.0 if in_position else 2.0):
+            eyetracker.calibrate_user_position(timeout=0)
+    finally:
+        reporter.close()
+
+    return replaying.allocated
+
+def benchmark_allocations(args):
+    """
+    Memory allocated per user position sample once tracking is under way.
+    Fails (exit status 1) if the tracker's callback allocates anything
+    """
+    guide_dicts, _ = head_track(args.warmup + args.samples, args.seed, args.head_drift, args.position_noise)
+
+    tracemalloc.start()
+
+    try:
+        ring = UserPositionGuideRing()
+        paths = [
+            ('from_dict', UserPositionGuide.from_dict),
+            ('ring load', ring.load),
+        ]
+
+        print(f"{'path':>12} {'held (B)':>9} {'peak (B)':>9}")
+
+        for name, function in paths:
+            traced_allocations(function, guide_dicts[:args.warmup])
+            held, peak = traced_allocations(function, guide_dicts[args.warmup:])
+            print(f"{name:>12} {held:>9} {peak:>9}")
+
+        allocated = 0
+
+        for name, in_position in [('positioning', False), ('in position', True)]:
+            held, peak = tracking_allocations(guide_dicts, args.warmup, args.head_filter, in_position)
+            print(f"{name:>12} {held:>9} {peak:>9}")
+
+            allocated = max(allocated, held, peak)
+    finally:
+        tracemalloc.stop()
+
+    if allocated:
+        print(f"Tracking allocated {allocated} bytes over {args.samples} samples")
+        raise SystemExit(1)
+
+    print(f"Tracking allocated nothing over {args.samples} samples")
+
+cancellation_phases = ['positioning', 'calibrating', 'finalizing', 'validating']
+
+class PhaseSink(CalibrationSink):
+    """Sets an event as the calibration enters each phase"""
+
+    def __init__(self):
+        self.entered = {phase: threading.Event() for phase in cancellation_phases}
+
+    def update_user_position(self, guide):
+        self.entered['positioning'].set()
+
+    def show_point(self, point, success_count=0, progress=0.0):
+        self.entered['calibrating'].set()
+
+    def finalizing_calibration(self):
+        self.entered['finalizing'].set()
+
+    def show_validation_point(self, point):
+        self.entered['validating'].set()
+
+def benchmark_cancellation(args):
+    """
+    How long calibrate() takes to return once cancelled in each phase, on
+    the mock tracker in real time, and whether it left nothing running
+    """
+    print(f"{'phase':>12} {'stop p50 (ms)':>14} {'stop max (ms)':>14} {'cancelled':>10} {'clean':>6}")
+
+    for phase in args.phases:
+        stop_times = []
+        cancelled = 0
+        clean = 0
+
+        for run in range(args.runs):
+            mock_tobii_research.configure(seed=args.seed + run, success_rate=args.success_rate, head_drift=args.head_drift)
+
+            sink = PhaseSink()
+            eyetracker = TobiiEyeTracker(api=mock_tobii_research, sink=sink, cancellation=CancellationToken())
+            worker = threading.Thread(target=eyetracker.calibrate)
+
+            # Positioning never ends by itself, so it can be cancelled at any point in it
+            with contextlib.ExitStack() as stack:
+                if phase == 'positioning':
+                    stack.enter_context(unreachable_position_requirement())
+
+                worker.start()
+
+                if not sink.entered[phase].wait(args.timeout):
+                    eyetracker.cancellation.cancel()
+                    worker.join()
+                    print(f"{phase:>12} not reached in run {run}")
+                    continue
+
+                time.sleep(Random(run).uniform(0, args.delay))
+
+                cancel_started = time.perf_counter()
+                eyetracker.cancellation.cancel()
+                worker.join()
+                stop_times.append(time.perf_counter() - cancel_started)
+
+            device = eyetracker.eyetracker
+            cancelled += eyetracker.report.cancelled
+            clean += not device.subscriptions and not device.in_calibration_mode
+
+        if not stop_times:
+            continue
+
+        stop_time = summarize(stop_times)
+
+        print(
+            f"{phase:>12} {stop_time['p50'] * 1000:>14.2f} {stop_time['max'] * 1000:>14.2f} "
+            f"{cancelled:>4}/{len(stop_times):<5} {clean:>2}/{len(stop_times)}"
+        )
+
+parser = argparse.ArgumentParser()
+subparsers = parser.add_subparsers(dest='benchmark')
+subparsers.required = True
+
+scorer_parser = subparsers.add_parser(
+    'scorer',
+    help='Per-sample cost of UserPositionScorer at several window sizes',
+)
+scorer_parser.add_argument('--samples', type=int, default=20_000)
+scorer_parser.add_argument('--windows', type=int, nargs='+', default=[10, 100, 1000, 5000])
+scorer_parser.add_argument('--seed', type=int, default=0)
+scorer_parser.set_defaults(run=benchmark_scorer)
+
+batch_parser = subparsers.add_parser(
+    'batch',
+    help='Vectorized batch scoring against the per-object UserPositionScorer',
+)
+batch_parser.add_argument('--samples', type=int, default=200_000)
+batch_parser.add_argument('--windows', type=int, nargs='+', default=[10, 100, 1000])
+batch_parser.add_argument('--seed', type=int, default=0)
+batch_parser.set_defaults(run=benchmark_batch)
+
+calibration_parser = subparsers.add_parser(
+    'calibration',
+    help='End-to-end TobiiEyeTracker.calibrate sessions on the mock tracker',
+)
+calibration_parser.add_argument('--runs', type=int, default=200)
+calibration_parser.add_argument('--seed', type=int, default=0)
+calibration_parser.add_argument('--success-rates', type=float, nargs='+', default=[0.5, 0.75, 0.95])
+calibration_parser.add_argument(
+    '--head-drifts',
+    nargs='+',
+    choices=sorted(mock_tobii_research.head_drift_profiles),
+    # random_walk is left out by default: it occasionally never settles
+    default=['wandering', 'settling', 'restless'],
+)
+calibration_parser.add_argument(
+    '--real-time',
+    action='store_true',
+    help='Run on the wall clock instead of the mock\'s virtual clock (slow)',
+)
+calibration_parser.add_argument('--output', help='Write the distributions as JSON to this file')
+calibration_parser.set_defaults(run=benchmark_calibration)
+
+collection_parser = subparsers.add_parser(
+    'collection',
+    help='collect_data calls, session time and point decisions of each collection strategy',
+)
+collection_parser.add_argument('--runs', type=int, default=200)
+collection_parser.add_argument('--seed', type=int, default=0)
+collection_parser.add_argument('--success-rates', type=float, nargs='+', default=[0.5, 0.75, 0.95])
+collection_parser.add_argument('--strategies', nargs='+', choices=sorted(collection_strategies), default=['fixed', 'adaptive'])
+collection_parser.add_argument(
+    '--head-drift',
+    choices=sorted(mock_tobii_research.head_drift_profiles),
+    default='wandering',
+)
+collection_parser.add_argument(
+    '--weak-points',
+    type=int,
+    default=1,
+    help='How many calibration points (counting from the last) the user can barely see',
+)
+collection_parser.add_argument('--weak-success-rate', type=float, default=0.2)
+collection_parser.add_argument('--output', help='Write the results as JSON to this file')
+collection_parser.set_defaults(run=benchmark_collection)
+
+recalibration_parser = subparsers.add_parser(
+    'recalibration',
+    help='Re-collecting only weak points against rerunning the whole calibration',
+)
+recalibration_parser.add_argument('--runs', type=int, default=200)
+recalibration_parser.add_argument('--seed', type=int, default=0)
+recalibration_parser.add_argument('--success-rates', type=float, nargs='+', default=[0.75, 0.95])
+recalibration_parser.add_argument(
+    '--head-drift',
+    choices=sorted(mock_tobii_research.head_drift_profiles),
+    default='wandering',
+)
+recalibration_parser.add_argument('--weak-points', type=int, default=1)
+recalibration_parser.add_argument('--weak-success-rate', type=float, default=0.2)
+recalibration_parser.add_argument(
+    '--max-rounds',
+    type=int,
+    default=2,
+    help='Recalibration rounds, or reruns of the whole session, allowed per run',
+)
+recalibration_parser.set_defaults(run=benchmark_recalibration)
+
+layouts_parser = subparsers.add_parser(
+    'layouts',
+    help='Session time against calibration layout density, and the gaze travel each schedule saves',
+)
+layouts_parser.add_argument('--runs', type=int, default=200)
+layouts_parser.add_argument('--seed', type=int, default=0)
+layouts_parser.add_argument('--layouts', nargs='+', choices=sorted(layout_positions, key=int), default=['5', '9', '13'])
+layouts_parser.add_argument('--margin', type=float, default=0.1)
+layouts_parser.add_argument('--success-rates', type=float, nargs='+', default=[0.5, 0.75, 0.95])
+layouts_parser.add_argument(
+    '--head-drift',
+    choices=sorted(mock_tobii_research.head_drift_profiles),
+    default='wandering',
+)
+layouts_parser.set_defaults(run=benchmark_layouts)
+
+validation_parser = subparsers.add_parser(
+    'validation',
+    help='Post-calibration validation on the mock gaze stream, across gaze rates and calibration errors',
+)
+validation_parser.add_argument('--runs', type=int, default=100)
+validation_parser.add_argument('--seed', type=int, default=0)
+validation_parser.add_argument('--success-rate', type=float, default=0.75)
+validation_parser.add_argument('--gaze-frequencies', type=int, nargs='+', default=[600, 1200])
+validation_parser.add_argument('--gaze-errors', type=float, nargs='+', default=[0.01, 0.025, 0.04])
+validation_parser.add_argument('--window', type=int, default=600, help='Ring buffer size for timing measure()')
+validation_parser.add_argument('--measurements', type=int, default=2000)
+validation_parser.add_argument(
+    '--head-drift',
+    choices=sorted(mock_tobii_research.head_drift_profiles),
+    default='wandering',
+)
+validation_parser.set_defaults(run=benchmark_validation)
+
+filters_parser = subparsers.add_parser(
+    'filters',
+    help='Accuracy, jitter and prediction of each head_filter, and time to position at several score windows',
+)
+filters_parser.add_argument('--samples', type=int, default=5000)
+filters_parser.add_argument('--runs', type=int, default=50)
+filters_parser.add_argument('--seed', type=int, default=0)
+filters_parser.add_argument('--filters', nargs='+', choices=sorted(head_filters), default=['none', 'exponential', 'kalman'])
+filters_parser.add_argument('--position-noises', type=float, nargs='+', default=[0.0, 0.005, 0.01])
+filters_parser.add_argument('--windows', type=int, nargs='+', default=[100, 25])
+filters_parser.add_argument(
+    '--lead-samples',
+    type=int,
+    default=2,
+    help='How many samples ahead to predict, against the true position then',
+)
+filters_parser.add_argument(
+    '--head-drift',
+    choices=sorted(mock_tobii_research.head_drift_profiles),
+    default='settling',
+)
+filters_parser.set_defaults(run=benchmark_filters)
+
+cache_parser = subparsers.add_parser(
+    'cache',
+    help='Session time of returning users with the calibration cache',
+)
+cache_parser.add_argument('--runs', type=int, default=200)
+cache_parser.add_argument('--seed', type=int, default=0)
+cache_parser.add_argument('--success-rates', type=float, nargs='+', default=[0.5, 0.75, 0.95])
+cache_parser.add_argument(
+    '--head-drift',
+    choices=sorted(mock_tobii_research.head_drift_profiles),
+    default='wandering',
+)
+cache_parser.set_defaults(run=benchmark_cache)
+
+allocations_parser = subparsers.add_parser(
+    'allocations',
+    help='Memory allocated per user position sample (tracemalloc); fails if tracking allocates',
+)
+allocations_parser.add_argument('--samples', type=int, default=10_000)
+allocations_parser.add_argument('--warmup', type=int, default=1000)
+allocations_parser.add_argument('--seed', type=int, default=0)
+allocations_parser.add_argument('--head-filter', choices=sorted(head_filters), default='kalman')
+allocations_parser.add_argument('--position-noise', type=float, default=0.005)
+allocations_parser.add_argument(
+    '--head-drift',
+    choices=sorted(mock_tobii_research.head_drift_profiles),
+    default='wandering',
+)
+allocations_parser.set_defaults(run=benchmark_allocations)
+
+cancellation_parser = subparsers.add_parser(
+    'cancellation',
+    help='Time for a calibration to stop once cancelled in each phase, on the mock tracker in real time',
+)
+cancellation_parser.add_argument('--runs', type=int, default=20)
+cancellation_parser.add_argument('--seed', type=int, default=0)
+cancellation_parser.add_argument('--phases', nargs='+', choices=cancellation_phases, default=cancellation_phases)
+cancellation_parser.add_argument('--success-rate', type=float, default=0.75)
+cancellation_parser.add_argument('--delay', type=float, default=0.2, help='Cancel up to this many seconds into the phase')
+cancellation_parser.add_argument('--timeout', type=float, default=30.0, help='Seconds to wait for each phase to start')
+cancellation_parser.add_argument(
+    '--head-drift',
+    choices=sorted(mock_tobii_research.head_drift_profiles),
+    default='wandering',
+)
+cancellation_parser.set_defaults(run=benchmark_cancellation)
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    args.run(args)
@@ -1,16 +1,17 @@
+import logging
+import os.path
 import threading
+import time
 
-import wx
-
+from cancellation import CancellationToken
+import config
 from models import *
-from gui import *
-from gui_events import CloseAppEvent
+from sinks import sinks_by_name, CompositeSink, RecordingSink
 
 from eyetrackers import TobiiEyeTracker
+import startup
 
-# Flush output by default (it gets buffered otherwise)
-import functools
-print = functools.partial(print, flush=True)
+logger = logging.getLogger(__name__)
 
 class CalibrationThread(threading.Thread):
     def __init__(self, app, parent, eyetracker):
@@ -18,49 +19,265 @@ class CalibrationThread(threading.Thread):
         self.parent = parent
         self.eyetracker = eyetracker
 
-        threading.Thread.__init__(self)
+        # Waited on instead of join(), which after a KeyboardInterrupt takes the thread for finished
+        self.finished = threading.Event()
+
+        # A daemon thread, so one stuck inside a tracker call cannot keep the process from exiting
+        threading.Thread.__init__(self, daemon=True)
 
     def run(self):
-        print("Initiating calibration")
+        startup.report.mark('calibration started')
+        logger.info("Initiating calibration")
         try:
             self.eyetracker.calibrate()
-            print("Calibration process concluded")
+            logger.info("Calibration process concluded")
         except Exception as e:
-            import traceback
-            print("Unable to initiate calibration:")
-            print(f"Error: {e}")
-            traceback.print_exc()
+            logger.exception(f"Unable to initiate calibration: {e}")
             exit(1)
+        finally:
+            self.finished.set()
 
 class CalibrationApp:
-    def __init__(self, api, debug=False):
+    def __init__(self, api, debug=False, headless=None, record_path=None, all_trackers=False, trace_latency=False, progress_stream=None,
+                 daemon=False, daemon_port=None, launched=None, startup_report=False, calibration_cache=False, user_id=None):
         self.api = api
         self.debug = debug
+        self.trace_latency = trace_latency  # Stamp user position samples at every pipeline stage
+        self.headless = headless  # Name of a sink in sinks.sinks_by_name, or None for the GUI
+        self.record_path = record_path  # Directory to record the session's raw tracker data into
+        self.all_trackers = all_trackers  # Calibrate every connected tracker at once, not just the first
+        self.progress_stream = progress_stream  # Where to write NDJSON progress events for a host application
+        self.progress = None  # progress.ProgressReporter, while a session runs with a progress stream
+        self.daemon = daemon  # Stay running and calibrate on request (see daemon.py)
+        self.daemon_port = daemon_port  # None for daemon_port from config.ini
+        self.launched = launched or startup.report.launched  # perf_counter() when the process started, for time to first frame
+        self.startup_report = startup_report  # Log startup.report once the session is over
+        self.calibration_cache = calibration_cache  # Reuse calibration data cached from earlier sessions
+        self.user_id = user_id  # Whose cached calibration data to use, if trackers are shared
+        self.cache = None  # calibration_cache.CalibrationCache, shared by every tracker once created
+
+    def find_devices(self):
+        """Discovers trackers once, for every calibration worker to share"""
+        devices = self.api.find_all_eyetrackers()
+
+        if len(devices) == 0:
+            raise Exception("No tracker available")
+
+        startup.report.mark('trackers found')
+
+        return devices if self.all_trackers else devices[:1]
+
+    def create_tracer(self):
+        if not self.trace_latency:
+            return None
+
+        from tracing import LatencyTracer
+
+        return LatencyTracer()
+
+    def create_progress(self):
+        if self.progress_stream is None:
+            return
+
+        from progress import ProgressReporter
+
+        self.progress = ProgressReporter(self.progress_stream)
+
+    def create_sink(self, sink, device):
+        """Also sends the tracker's progress to the progress stream, if there is one"""
+        if self.progress is None:
+            return sink
+
+        from progress import ProgressSink
+
+        return CompositeSink(sink, ProgressSink(self.progress, device.serial_number))
+
+    def create_eyetracker(self, sink, device, index, device_count, tracer=None, cancellation=None):
+        sink = self.create_sink(sink, device)
+
+        eyetracker = TobiiEyeTracker(
+            api=self.api,
+            sink=sink,
+            eyetracker=device,
+            tracer=tracer,
+            user_id=self.user_id,
+            cancellation=cancellation,
+        )
+
+        if self.calibration_cache:
+            eyetracker.cache = self.create_cache()
+
+        if self.record_path:
+            from recording import SessionRecorder
+
+            record_path = self.record_path
+
+            if device_count > 1:
+                record_path = os.path.join(record_path, f"tracker-{index}")
+
+            eyetracker.recorder = SessionRecorder(
+                record_path,
+                serial_number=device.serial_number,
+                clock=eyetracker.clock,
+            )
+
+        return eyetracker
+
+    def create_cache(self):
+        if self.cache is None:
+            from calibration_cache import CalibrationCache
+
+            settings = config.current()
+
+            self.cache = CalibrationCache(
+                os.path.join(os.path.dirname(__file__), settings.calibration_cache_directory),
+                max_age=settings.calibration_cache_max_age,
+                max_size=settings.calibration_cache_max_size,
+            )
+
+        return self.cache
+
+    def stop_workers(self, workers):
+        """
+        Cancels every calibration still running and waits for them to wind
+        down, for at most shutdown_timeout seconds in all
+        """
+        for worker in workers:
+            worker.eyetracker.cancellation.cancel()
+
+        deadline = time.monotonic() + config.current().shutdown_timeout
+
+        for worker in workers:
+            if not worker.finished.wait(max(deadline - time.monotonic(), 0)):
+                logger.warning(f"Calibration of {worker.eyetracker.eyetracker.serial_number} did not stop in time")
+
+    def finish(self, eyetrackers):
+        for eyetracker in eyetrackers:
+            logger.info(f"Tracker {eyetracker.eyetracker.serial_number}: {eyetracker.report.summary_text()}")
+
+            if eyetracker.tracer:
+                logger.info(eyetracker.tracer.report_text())
+
+            if eyetracker.recorder:
+                eyetracker.recorder.close()
+                logger.info(f"Recorded session to {eyetracker.recorder.path}")
+
+            if self.progress:
+                self.progress.emit('result', tracker=eyetracker.eyetracker.serial_number, **eyetracker.report.to_dict())
+
+        if self.progress:
+            self.progress.close()
+
+        if self.startup_report:
+            logger.info(startup.report.report_text())
 
     def start(self):
+        # Long-running sessions pick up config.ini changes without restarting
+        config.watch()
+
+        if self.daemon:
+            self.start_daemon()
+            return
+
+        self.create_progress()
+
+        if self.headless:
+            self.start_headless()
+        else:
+            self.start_gui()
+
+    def start_headless(self):
+        """Runs the whole calibration flow without wx or a display"""
+        devices = self.find_devices()
+
+        sinks = [sinks_by_name[self.headless]() for device in devices]
+
+        eyetrackers = [
+            self.create_eyetracker(sink, device, index, len(devices), self.create_tracer())
+            for index, (sink, device) in enumerate(zip(sinks, devices))
+        ]
+
+        workers = [CalibrationThread(None, None, eyetracker) for eyetracker in eyetrackers]
+
+        for worker in workers:
+            worker.start()
+
+        try:
+            for worker in workers:
+                worker.finished.wait()
+        except KeyboardInterrupt:
+            logger.info("Interrupted, cancelling calibration")
+            self.stop_workers(workers)
+
+        self.finish(eyetrackers)
+
+        for sink in sinks:
+            if isinstance(sink, RecordingSink):
+                logger.info(f"Recorded events: {sink.summary_text()}")
+
+    def start_daemon(self):
+        from daemon import CalibrationDaemon
+
+        CalibrationDaemon(self, port=self.daemon_port).start()
+
+    def log_time_to_first_frame(self, painted):
+        logger.info(f"Time to first frame: {painted - self.launched:.3f} s (cold start)")
+
+    def start_gui(self):
+        # wx is only imported when there is a GUI to show
+        wx = startup.report.timed_import('wx')
+        gui = startup.report.timed_import('gui')
+
         wx_app = wx.App(redirect=False)
 
-        frame = CalibrationFrame(debug=self.debug)
+        devices = self.find_devices()
+
+        eyetrackers = []
+        workers = []
 
-        eyetracker = TobiiEyeTracker(api=self.api, gui=frame)
+        for index, device in enumerate(devices):
+            tracer = self.create_tracer()
 
-        worker = CalibrationThread(wx_app, frame, eyetracker)
-        worker.start()
+            # Closing a frame mid-session cancels its calibration
+            cancellation = CancellationToken()
 
-        frame.ShowFullScreen(True)
-        frame.Show(True)
+            frame = gui.CalibrationFrame(
+                debug=self.debug,
+                display_index=index,
+                tracer=tracer,
+                on_first_paint=self.log_time_to_first_frame,
+                on_close=cancellation.cancel,
+            )
 
+            eyetracker = self.create_eyetracker(
+                gui.CalibrationFrameSink(frame),
+                device,
+                index,
+                len(devices),
+                tracer,
+                cancellation,
+            )
+            eyetrackers.append(eyetracker)
+            frame.clock = eyetracker.clock
+
+            worker = CalibrationThread(wx_app, frame, eyetracker)
+            workers.append(worker)
+            worker.start()
+
+        # Returns once every frame has been closed
         wx_app.MainLoop()
 
-        print("Exited main loop")
+        logger.debug("Exited main loop")
+
+        logger.debug("Stopping calibration threads")
+        self.stop_workers(workers)
+        logger.debug("Stopped calibration threads")
 
-        print("Killing calibration thread")
-        worker.join()
-        print("Killed calibration thread")
+        self.finish(eyetrackers)
 
-        print("Exiting wxPython")
+        logger.debug("Exiting wxPython")
         wx.Exit()
-        print("Exited wxPython")
+        logger.debug("Exited wxPython")
 
-        print("Exiting process with a success")
+        logger.debug("Exiting process with a success")
         exit(0)
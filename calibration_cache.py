@@ -0,0 +1,98 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class CalibrationCache:
+    """
+    Calibration data retrieved from trackers after a successful calibration,
+    kept on disk by tracker serial number and (optional) user ID, so a
+    returning user can have it reapplied instead of calibrating again.
+
+    Entries older than max_age seconds are dropped, and the oldest go first
+    whenever the cache grows beyond max_size bytes.
+    """
+
+    suffix = '.calibration'
+
+    def __init__(self, path, max_age, max_size):
+        os.makedirs(path, exist_ok=True)
+
+        self.path = path
+        self.max_age = max_age
+        self.max_size = max_size
+        self.lock = threading.Lock()  # Several trackers may store at once
+
+    def entry_path(self, serial_number, user_id=None):
+        # Hashed, so any serial number or user ID makes a safe file name
+        key = hashlib.sha256(f"{serial_number}\0{user_id or ''}".encode('utf-8')).hexdigest()
+
+        return os.path.join(self.path, key + self.suffix)
+
+    def load(self, serial_number, user_id=None):
+        """The cached calibration data, or None if there is none (or it has expired)"""
+        self.evict()
+
+        try:
+            with open(self.entry_path(serial_number, user_id), 'rb') as entry:
+                return entry.read()
+        except FileNotFoundError:
+            return None
+
+    def store(self, serial_number, user_id, data):
+        path = self.entry_path(serial_number, user_id)
+        temporary_path = f"{path}.{threading.get_ident()}.tmp"
+
+        # Written aside and renamed, so a reader never sees half an entry
+        with open(temporary_path, 'wb') as entry:
+            entry.write(data)
+
+        os.replace(temporary_path, path)
+
+        self.evict()
+
+    def remove(self, serial_number, user_id=None):
+        try:
+            os.remove(self.entry_path(serial_number, user_id))
+        except FileNotFoundError:
+            pass
+
+    def entries(self):
+        """(modified time, size, path) of every entry, oldest first"""
+        entries = []
+
+        for name in os.listdir(self.path):
+            if not name.endswith(self.suffix):
+                continue
+
+            path = os.path.join(self.path, name)
+
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue  # Evicted by another thread meanwhile
+
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        return sorted(entries)
+
+    def evict(self):
+        with self.lock:
+            entries = self.entries()
+            expired_before = time.time() - self.max_age
+            total_size = sum(size for _, size, _ in entries)
+
+            for modified, size, path in entries:
+                if modified >= expired_before and total_size <= self.max_size:
+                    break
+
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+                total_size -= size
+                logger.debug(f"Evicted {path} from the calibration cache")
@@ -0,0 +1,50 @@
+import contextlib
+import threading
+
+class Cancelled(Exception):
+    """Raised inside TobiiEyeTracker once its CancellationToken has been cancelled"""
+
+class CancellationToken:
+    """
+    Asks a calibration to stop, from any thread.
+
+    TobiiEyeTracker checks the token at every wait and collection step, and
+    does all its sleeping and waiting on events the token sets when
+    cancelled, so a cancelled calibration stops within one tracker call
+    instead of at the end of whatever it was waiting for.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.event = threading.Event()  # Set once cancelled
+        self.waiting = set()  # Events being waited on, to set when cancelled
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def cancel(self):
+        with self.lock:
+            self.event.set()
+
+            for event in self.waiting:
+                event.set()
+
+    def check(self):
+        if self.cancelled:
+            raise Cancelled()
+
+    @contextlib.contextmanager
+    def waking(self, event):
+        """While inside, cancelling also sets event, so waiting on it ends at once"""
+        with self.lock:
+            if self.cancelled:
+                event.set()
+
+            self.waiting.add(event)
+
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.waiting.discard(event)
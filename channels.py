@@ -0,0 +1,56 @@
+import threading
+
+class LatestValueMailbox:
+    """
+    Single-slot channel between a producer thread and the GUI.
+
+    The producer overwrites the slot as often as it likes; the consumer picks
+    up whatever is newest once per frame. Samples that are overwritten before
+    anyone reads them are counted as coalesced instead of queued.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()  # Only ever held for a few assignments
+        self.value = None
+        self.has_value = False
+
+        # Floats, as incrementing an int past 256 allocates a new one on every
+        # sample, and floats come from a free list
+        self.posted_count = 0.0
+        self.taken_count = 0.0
+        self.coalesced_count = 0.0
+
+    def put(self, value):
+        # Called for every sample, so without a with block: entering one
+        # allocates for the lock's __exit__
+        self.lock.acquire()
+
+        try:
+            if self.has_value:
+                self.coalesced_count += 1
+
+            self.value = value
+            self.has_value = True
+            self.posted_count += 1
+        finally:
+            self.lock.release()
+
+    def take(self):
+        """Returns the newest value posted since the last take, or None"""
+        with self.lock:
+            if not self.has_value:
+                return None
+
+            value = self.value
+            self.value = None
+            self.has_value = False
+            self.taken_count += 1
+
+            return value
+
+    def stats_text(self):
+        return (
+            f"posted {self.posted_count:.0f}, "
+            f"drawn {self.taken_count:.0f}, "
+            f"coalesced {self.coalesced_count:.0f}"
+        )
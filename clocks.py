@@ -0,0 +1,109 @@
+import heapq
+import itertools
+import time
+
+class RealClock:
+    """Wall-clock time. What TobiiEyeTracker uses unless the device brings its own clock"""
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def wait(self, event, timeout=None):
+        return event.wait(timeout)
+
+class VirtualTimer:
+    """Repeats every interval seconds, or fires once if interval is None"""
+
+    def __init__(self, due, interval, callback):
+        self.due = due
+        self.interval = interval
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class VirtualClock:
+    """
+    Simulated time for a single consumer thread.
+
+    Nothing happens on its own: time only moves when the consumer sleeps or
+    waits, and timers registered with call_every (e.g. a mock tracker's
+    sample stream) run synchronously in the consumer's thread as the clock
+    passes their due times. A simulated session therefore runs as fast as
+    the consumer can go, and the same inputs always happen in the same order.
+    """
+
+    def __init__(self, start=0.0):
+        self.now = start
+        self.timers = []  # Heap of (due, sequence, timer)
+        self.sequence = itertools.count()  # Breaks ties in registration order
+
+    def monotonic(self):
+        return self.now
+
+    def call_every(self, interval, callback):
+        timer = VirtualTimer(self.now + interval, interval, callback)
+        self.schedule(timer)
+
+        return timer
+
+    def call_at(self, due, callback):
+        """One-shot timer, run once the clock reaches due"""
+        timer = VirtualTimer(due, None, callback)
+        self.schedule(timer)
+
+        return timer
+
+    def schedule(self, timer):
+        heapq.heappush(self.timers, (timer.due, next(self.sequence), timer))
+
+    def next_due(self):
+        while self.timers and self.timers[0][2].cancelled:
+            heapq.heappop(self.timers)
+
+        return self.timers[0][0] if self.timers else None
+
+    def run_next_timer(self):
+        due, _, timer = heapq.heappop(self.timers)
+
+        self.now = max(self.now, due)
+        timer.callback()
+
+        if timer.interval is not None and not timer.cancelled:
+            timer.due = due + timer.interval
+            self.schedule(timer)
+
+    def sleep(self, seconds):
+        target = self.now + max(seconds, 0)
+
+        while True:
+            next_due = self.next_due()
+
+            if next_due is None or next_due > target:
+                break
+
+            self.run_next_timer()
+
+        self.now = max(self.now, target)
+
+    def wait(self, event, timeout=None):
+        deadline = None if timeout is None else self.now + timeout
+
+        while not event.is_set():
+            next_due = self.next_due()
+
+            if next_due is None or (deadline is not None and next_due > deadline):
+                if deadline is None:
+                    raise Exception("Waiting forever in virtual time: nothing is scheduled to happen")
+
+                self.now = max(self.now, deadline)
+                return event.is_set()
+
+            self.run_next_timer()
+
+        return True
@@ -0,0 +1,130 @@
+from enum import Enum, auto
+import math
+
+class PointOutcome(Enum):
+    COLLECTING = auto()
+    ACCEPTED = auto()
+    GAVE_UP = auto()
+
+def wilson_lower_bound(successes, attempts, z):
+    """Lower end of the Wilson score interval for a success rate"""
+    if attempts == 0:
+        return 0.0
+
+    rate = successes / attempts
+    z_squared = z * z
+
+    centre = rate + z_squared / (2 * attempts)
+    spread = z * math.sqrt(rate * (1 - rate) / attempts + z_squared / (4 * attempts * attempts))
+
+    return (centre - spread) / (1 + z_squared / attempts)
+
+class FixedCollection:
+    """
+    The original rule: collect until dot_result_successes_requirement
+    successes, however many attempts that takes. Only successes go into the
+    back-look window, so failures are never counted.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.results = []
+        self.attempts = 0
+        self.success_count = 0
+
+    def add_result(self, success):
+        self.attempts += 1
+
+        if success:
+            if len(self.results) > self.settings.dot_result_back_look:
+                self.results.pop(0)
+            self.results.append(success)
+
+        self.success_count = len(self.results)
+
+        if self.success_count >= self.settings.dot_result_successes_requirement:
+            return PointOutcome.ACCEPTED
+
+        return PointOutcome.COLLECTING
+
+    @property
+    def progress(self):
+        """How far the point is towards being accepted, from 0 to 1"""
+        return min(self.success_count / max(self.settings.dot_result_successes_requirement, 1), 1.0)
+
+class AdaptiveCollection:
+    """
+    Counts every success and failure at the point. The point is accepted as
+    soon as the Wilson lower bound on its success rate over all its attempts
+    reaches dot_result_minimum_success_rate (after at least
+    dot_result_minimum_successes successes). A window of the last few attempts
+    is too short for the bound to ever reach a useful rate. After dot_result_failure_budget
+    failures it is given up on, so one point the user cannot see does not
+    hold up the whole session.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.attempts = 0
+        self.success_count = 0
+        self.failure_count = 0
+
+    def add_result(self, success):
+        self.attempts += 1
+
+        if success:
+            self.success_count += 1
+        else:
+            self.failure_count += 1
+
+        settings = self.settings
+
+        if self.success_count >= settings.dot_result_minimum_successes:
+            lower_bound = wilson_lower_bound(self.success_count, self.attempts, settings.dot_result_confidence_z)
+
+            if lower_bound >= settings.dot_result_minimum_success_rate:
+                return PointOutcome.ACCEPTED
+
+        if self.failure_count >= settings.dot_result_failure_budget:
+            return PointOutcome.GAVE_UP
+
+        return PointOutcome.COLLECTING
+
+    @property
+    def progress(self):
+        """
+        How far the point is towards being accepted, from 0 to 1: the lesser
+        of its share of the successes needed and of the success rate needed
+        """
+        settings = self.settings
+
+        if not self.attempts:
+            return 0.0
+
+        lower_bound = wilson_lower_bound(self.success_count, self.attempts, settings.dot_result_confidence_z)
+
+        return min(
+            self.success_count / max(settings.dot_result_minimum_successes, 1),
+            lower_bound / settings.dot_result_minimum_success_rate if settings.dot_result_minimum_success_rate > 0 else 1.0,
+            1.0,
+        )
+
+def valid_sample_fraction(calibration_point, valid_and_used):
+    """Fraction of a CalibrationPoint's samples that both eyes' data was used from"""
+    samples = calibration_point.calibration_samples
+
+    if not samples:
+        return 0.0
+
+    used = sum(
+        1 for sample in samples
+        if sample.left_eye.validity == valid_and_used and sample.right_eye.validity == valid_and_used
+    )
+
+    return used / len(samples)
+
+# Values of collection_strategy in config.ini
+collection_strategies = {
+    'fixed': FixedCollection,
+    'adaptive': AdaptiveCollection,
+}
@@ -1,14 +1,32 @@
-import os.path
 import configparser
+import copy
+import logging
+import os
+import threading
 
-config_file_path = os.path.join(os.path.dirname(__file__), 'config.ini')
+from layouts import CalibrationLayout, build_layout, parse_points
+
+logger = logging.getLogger(__name__)
 
-config = configparser.ConfigParser()
+config_file_path = os.path.join(os.path.dirname(__file__), 'config.ini')
 
 constants_and_defaults = {
     # 1."0": perfect aligment,
     "USER_POSITION_SCORE_REQUIREMENT": 0.85,
 
+    # Smooths user position samples before they are scored and drawn (see
+    # filters.py): "none", "exponential" (each new sample weighs
+    # HEAD_FILTER_ALPHA) or "kalman" (constant velocity, with the head's
+    # velocity wandering by HEAD_FILTER_PROCESS_NOISE per second and samples
+    # off by HEAD_FILTER_MEASUREMENT_NOISE). With HEAD_FILTER_PREDICTION the
+    # face is drawn where it should be by the time the frame is on screen.
+    # Filtering changes how positions score, so it is opt-in
+    "HEAD_FILTER": "none",
+    "HEAD_FILTER_ALPHA": 0.3,
+    "HEAD_FILTER_PROCESS_NOISE": 0.05,
+    "HEAD_FILTER_MEASUREMENT_NOISE": 0.005,
+    "HEAD_FILTER_PREDICTION": True,
+
     # How many previous scores to sum up when calculating total score
     # Arbitrary threshold. TODO: Test
     "USER_POSITION_SCORE_BACK_LOOK": 100,
@@ -23,32 +41,222 @@ constants_and_defaults = {
     "Y_SCORE_EXPONENT": 10,
     "Z_SCORE_EXPONENT": 10,
 
-    "CIRCLE_MARGIN": 20,
     "CIRCLE_RADIUS": 20,
 
+    # Points to calibrate at (see layouts.py): "5", "9" or "13", set
+    # CALIBRATION_POINT_MARGIN in from the edges of the display, or "custom"
+    # for CALIBRATION_POINTS, given as normalized "x,y; x,y; ..."
+    "CALIBRATION_LAYOUT": "5",
+    "CALIBRATION_POINT_MARGIN": 0.1,
+    "CALIBRATION_POINTS": "",
+
+    # How long to keep collecting at each calibration point (see collection.py):
+    # "fixed" waits for DOT_RESULT_SUCCESSES_REQUIREMENT successes, "adaptive"
+    # stops once the point's success rate is known to be good enough. Points
+    # "adaptive" gives up on are collected again like weak ones
+    "COLLECTION_STRATEGY": "adaptive",
+
     "DOT_RESULT_BACK_LOOK": 10,
     "DOT_RESULT_SUCCESSES_REQUIREMENT": 7,
+
+    # Adaptive collection accepts a point once the lower confidence bound on
+    # its success rate over all its attempts reaches
+    # DOT_RESULT_MINIMUM_SUCCESS_RATE. 1.0 is a one-sided 84% bound
+    "DOT_RESULT_MINIMUM_SUCCESSES": 3,
+    "DOT_RESULT_MINIMUM_SUCCESS_RATE": 0.25,
+    "DOT_RESULT_CONFIDENCE_Z": 1.0,
+
+    # Adaptive collection gives up on a point after this many failures
+    "DOT_RESULT_FAILURE_BUDGET": 20,
+
+    # After compute_and_apply, points with fewer samples than this used from
+    # both eyes are discarded and collected again, at most this many times
+    "RECALIBRATION_MINIMUM_VALID_FRACTION": 0.5,
+    "RECALIBRATION_MAX_ROUNDS": 2,
+
+    # After calibrating, show targets at VALIDATION_POINTS (normalized
+    # "x,y; x,y; ...") and measure the gaze stream at each, after giving the
+    # eyes VALIDATION_SETTLE_TIME seconds to get there. A target passes once
+    # VALIDATION_MINIMUM_SAMPLES of the last VALIDATION_WINDOW samples are
+    # within the bounds, and fails after VALIDATION_TIMEOUT seconds. The
+    # points nearest failed targets are collected again, at most
+    # VALIDATION_MAX_ROUNDS times
+    "VALIDATION": True,
+    "VALIDATION_POINTS": "0.25,0.25; 0.75,0.25; 0.25,0.75; 0.75,0.75",
+    "VALIDATION_SETTLE_TIME": 0.3,
+    "VALIDATION_MINIMUM_SAMPLES": 60,
+    "VALIDATION_WINDOW": 600,
+    "VALIDATION_TIMEOUT": 2.0,
+    "VALIDATION_MAX_ROUNDS": 1,
+
+    # Bounds on accuracy (distance of the mean gaze from the target) and
+    # precision (RMS distance between samples), in screen heights. 0.035 is
+    # about 1 degree of visual angle on a 24" display seen from 60 cm
+    "VALIDATION_MAX_ACCURACY": 0.035,
+    "VALIDATION_MAX_PRECISION": 0.02,
+
+    # app.py --calibration-cache keeps each tracker's calibration data here
+    # (relative to this directory) by serial number and --user-id, and
+    # reapplies it instead of calibrating again. Entries older than
+    # CALIBRATION_CACHE_MAX_AGE seconds are dropped, and the oldest go first
+    # once the cache takes up more than CALIBRATION_CACHE_MAX_SIZE bytes
+    "CALIBRATION_CACHE_DIRECTORY": "calibration_cache",
+    "CALIBRATION_CACHE_MAX_AGE": 604800,
+    "CALIBRATION_CACHE_MAX_SIZE": 10000000,
+
+    # Before reusing cached calibration data, check the user gets into
+    # position within this many seconds, and calibrate from scratch if not
+    "CALIBRATION_CACHE_VALIDATION": True,
+    "CALIBRATION_CACHE_VALIDATION_TIMEOUT": 10.0,
+
+    # Minimum seconds between the starts of consecutive collect_data calls
+    "DOT_COLLECTION_INTERVAL": 0.05,
+
+    # Seconds between showing a calibration point and the first collect_data
+    # at it, for the eyes to get there from the previous point
+    "DOT_SETTLE_TIME": 0.3,
     "ERASE_BACKGROUND": False,
     "FPS": 60,
+
+    # Only repaint what changed since the last frame instead of the whole screen
+    "DAMAGE_DRIVEN_REPAINT": True,
+
+    # Render static content once per mode and blit it instead of redrawing it
+    "CACHE_STATIC_LAYERS": True,
+
+    # Decode the media images in the background instead of before the first frame
+    "ASYNC_MEDIA_LOADING": True,
+
+    # TCP port on 127.0.0.1 that app.py --daemon listens on for calibration requests
+    "DAEMON_PORT": 7781,
+
+    # Seconds app.py waits, once its frames are closed, for cancelled
+    # calibrations to wind down before exiting regardless
+    "SHUTDOWN_TIMEOUT": 0.5,
+
+    # Seconds between checks of config.ini for changes to apply live (0 to never reload)
+    "CONFIG_RELOAD_INTERVAL": 1.0,
 }
 
-if not os.path.exists(config_file_path):
-    raise Exception(f"Missing file: {config_file_path}. You may need to copy it from example_config.ini")
+class Config:
+    """
+    One snapshot of config.ini. Every constant is an attribute named in lower
+    case and converted to the type of its default, and the values derived
+    from them are precomputed.
+
+    Snapshots are never modified. Readers take current() once per sample or
+    frame and use that snapshot throughout, so a reload is never seen
+    half-applied.
+    """
+
+    def __init__(self, settings):
+        for constant_name, default in constants_and_defaults.items():
+            if type(default) is bool:
+                # bool("False") is True, so let configparser interpret the string
+                value = settings.getboolean(constant_name, default)
+            else:
+                value = type(default)(settings.get(constant_name, default))
+
+            setattr(self, constant_name.lower(), value)
+
+        self.derive()
+
+    def derive(self):
+        # (weight, exponent) of the x, y and z scores
+        self.score_terms = (
+            (self.x_score_weight, self.x_score_exponent),
+            (self.y_score_weight, self.y_score_exponent),
+            (self.z_score_weight, self.z_score_exponent),
+        )
+
+        # Built here, so a layout that fails to parse keeps the previous snapshot in place
+        self.layout = build_layout(self.calibration_layout, self.calibration_point_margin, self.calibration_points)
+        self.validation_layout = CalibrationLayout('validation', parse_points(self.validation_points))
+
+    def replace(self, **values):
+        """
+        A new snapshot with some constants changed (by lower case name), for
+        trying settings out offline. Values derived from them are rebuilt
+        """
+        snapshot = copy.copy(self)
+
+        for name, value in values.items():
+            constant_name = name.upper()
+
+            if constant_name not in constants_and_defaults:
+                raise ValueError(f"Unknown setting: {name}")
+
+            setattr(snapshot, name, type(constants_and_defaults[constant_name])(value))
+
+        snapshot.derive()
+
+        return snapshot
+
+    def items(self):
+        """(constant name, value) pairs, in config.ini order"""
+        return [(constant_name, getattr(self, constant_name.lower())) for constant_name in constants_and_defaults]
+
+def load(path=config_file_path):
+    if not os.path.exists(path):
+        raise Exception(f"Missing file: {path}. You may need to copy it from example_config.ini")
+
+    parser = configparser.ConfigParser()
+    parser.read(path)
+
+    return Config(parser['Settings'])
+
+snapshot = load()
+
+def current():
+    return snapshot
+
+def reload(path=config_file_path):
+    """Swaps in a new snapshot. A file that fails to parse leaves the current one in place"""
+    global snapshot
+
+    try:
+        snapshot = load(path)
+    except Exception as e:
+        logger.warning(f"Keeping the current configuration, {path} could not be loaded: {e}")
+        return False
+
+    logger.info(f"Reloaded {path}")
+    return True
+
+class ConfigWatcher(threading.Thread):
+    """Reloads config.ini whenever its modification time changes"""
+
+    def __init__(self, path=config_file_path, interval=None):
+        self.path = path
+        self.interval = interval or snapshot.config_reload_interval
+        self.stopped = threading.Event()
+        self.last_modified = self.modified()
+
+        threading.Thread.__init__(self, daemon=True)
+
+    def modified(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
 
-config.read(config_file_path)
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            modified = self.modified()
 
-for constant_name in constants_and_defaults:
-    settings = config['Settings']
+            if modified != self.last_modified:
+                self.last_modified = modified
+                reload(self.path)
 
-    default = constants_and_defaults[constant_name]
+    def stop(self):
+        self.stopped.set()
 
-    value = settings.get(constant_name, default)
+watcher = None
 
-    if type(default) is int:
-        value = int(value)
-    elif type(default) is float:
-        value = float(value)
-    elif type(default) is bool:
-        value = bool(value)
+def watch():
+    """Starts reloading config.ini in the background, unless CONFIG_RELOAD_INTERVAL is 0"""
+    global watcher
 
-    globals()[constant_name] = value
+    if watcher is None and snapshot.config_reload_interval > 0:
+        watcher = ConfigWatcher()
+        watcher.start()
@@ -0,0 +1 @@
+# Here so pytest puts this directory on sys.path, for tests/ to import the app's modules
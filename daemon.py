@@ -0,0 +1,247 @@
+import argparse
+import io
+import json
+import logging
+import socket
+import socketserver
+import threading
+import time
+
+from cancellation import CancellationToken
+import config
+from calibration_app import CalibrationThread
+from progress import ProgressReporter, ProgressSink
+from sinks import CompositeSink, sinks_by_name
+import startup
+
+logger = logging.getLogger(__name__)
+
+DISCONNECT_CHECK_INTERVAL = 0.1  # Seconds between checks, while calibrating, that the client is still there
+
+class CalibrationRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Reads one request, a line of JSON such as {"command": "calibrate"}, and
+    replies with newline-delimited JSON events, as app.py --progress writes them
+    """
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            request = {}
+
+        stream = io.TextIOWrapper(self.wfile, encoding='utf-8')
+
+        try:
+            # Valid JSON that is not an object gets the same reply as an unknown command
+            if isinstance(request, dict):
+                self.server.calibration_daemon.handle(request, stream)
+            else:
+                stream.write(json.dumps({'event': 'error', 'message': f"Unknown request: {request}"}) + "\n")
+        finally:
+            stream.flush()
+            stream.detach()  # The socket is closed by StreamRequestHandler
+
+class CalibrationServer(socketserver.TCPServer):
+    allow_reuse_address = True
+
+class CalibrationDaemon:
+    """
+    Keeps a CalibrationApp warm between calibrations: wx, the frames and their
+    bitmaps, config.ini and the tracker handles are all loaded once, and each
+    calibration requested over TCP loopback only shows the frames again.
+
+    Requests are served one at a time. Commands:
+      calibrate  runs a calibration, streaming progress and a result per tracker
+                 (with "user_id", reusing that user's cached calibration under --calibration-cache)
+      status     reports how long warming up took and how many calibrations ran
+      shutdown   stops the daemon
+    """
+
+    def __init__(self, app, port=None, host='127.0.0.1'):
+        self.app = app
+        self.server = CalibrationServer((host, port or config.current().daemon_port), CalibrationRequestHandler)
+        self.server.calibration_daemon = self
+
+        self.wx = None  # The wx module, when there is a GUI
+        self.frames = []  # Hidden CalibrationFrames, one per tracker, when there is a GUI
+        self.eyetrackers = []
+        self.sinks = []  # Each tracker's own sink, before progress is added for a request
+        self.workers = []  # CalibrationThreads of the latest request
+
+        self.first_paint_times = {}  # Frame index -> perf_counter() of its first paint
+        self.calibration_count = 0
+        self.warm_up_time = None
+
+        self.commands = {
+            'calibrate': self.calibrate,
+            'status': self.status,
+            'shutdown': self.shutdown,
+        }
+
+    def warm_up(self):
+        devices = self.app.find_devices()
+
+        if self.app.headless:
+            self.sinks = [sinks_by_name[self.app.headless]() for device in devices]
+        else:
+            wx = startup.report.timed_import('wx')
+            gui = startup.report.timed_import('gui')
+
+            self.wx = wx
+            self.wx_app = wx.App(redirect=False)
+
+            for index in range(len(devices)):
+                frame = gui.CalibrationFrame(
+                    debug=self.app.debug,
+                    display_index=index,
+                    keep_alive=True,
+                    show=False,
+                    on_first_paint=lambda painted, index=index: self.first_paint_times.__setitem__(index, painted),
+                    on_close=lambda index=index: self.eyetrackers[index].cancellation.cancel(),
+                )
+
+                self.frames.append(frame)
+                self.sinks.append(gui.CalibrationFrameSink(frame))
+
+        self.eyetrackers = [
+            self.app.create_eyetracker(sink, device, index, len(devices))
+            for index, (sink, device) in enumerate(zip(self.sinks, devices))
+        ]
+
+        for frame, eyetracker in zip(self.frames, self.eyetrackers):
+            frame.clock = eyetracker.clock
+
+        self.warm_up_time = time.perf_counter() - self.app.launched
+
+    def start(self):
+        self.warm_up()
+
+        host, port = self.server.server_address
+        logger.info(f"Calibration daemon listening on {host}:{port} (warm after {self.warm_up_time:.3f} s)")
+
+        if self.app.startup_report:
+            logger.info(startup.report.report_text())
+
+        if self.wx:
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+            self.wx_app.MainLoop()
+        else:
+            self.server.serve_forever()
+
+        self.server.server_close()
+        logger.info("Calibration daemon stopped")
+
+    def handle(self, request, stream):
+        command = self.commands.get(request.get('command'))
+
+        if command is None:
+            stream.write(json.dumps({'event': 'error', 'message': f"Unknown request: {request}"}) + "\n")
+            return
+
+        command(request, stream)
+
+    def calibrate(self, request, stream):
+        requested = time.perf_counter()
+
+        # A calibration abandoned by its client may still be inside a blocking
+        # tracker call, and would carry on with the new token below
+        for worker in self.workers:
+            worker.finished.wait()
+
+        cancellations = [CancellationToken() for eyetracker in self.eyetrackers]
+
+        def cancel():
+            for cancellation in cancellations:
+                cancellation.cancel()
+
+        # A client that goes away mid-calibration cancels it, instead of leaving the daemon busy
+        progress = ProgressReporter(stream, on_disconnect=cancel)
+
+        self.first_paint_times.clear()
+
+        for frame in self.frames:
+            self.wx.CallAfter(frame.ShowFrame)
+
+        for eyetracker, sink, cancellation in zip(self.eyetrackers, self.sinks, cancellations):
+            eyetracker.user_id = request.get('user_id', self.app.user_id)
+            eyetracker.cancellation = cancellation  # Closing the frame cancels only this calibration
+            eyetracker.sink = CompositeSink(sink, ProgressSink(progress, eyetracker.eyetracker.serial_number))
+
+        workers = [CalibrationThread(None, None, eyetracker) for eyetracker in self.eyetrackers]
+        self.workers = workers
+
+        for worker in workers:
+            worker.start()
+
+        for worker in workers:
+            while not worker.finished.wait(DISCONNECT_CHECK_INTERVAL) and not progress.disconnected:
+                pass
+
+        # Cancelled, so waiting on the calibrations is bounded like at shutdown
+        if progress.disconnected:
+            logger.warning("Client disconnected mid-calibration, cancelling it")
+            self.app.stop_workers(workers)
+
+        self.calibration_count += 1
+
+        for index, eyetracker in enumerate(self.eyetrackers):
+            time_to_first_frame = None
+
+            if index in self.first_paint_times:
+                time_to_first_frame = self.first_paint_times[index] - requested
+                logger.info(f"Time to first frame: {time_to_first_frame:.3f} s (warm)")
+
+            logger.info(f"Tracker {eyetracker.eyetracker.serial_number}: {eyetracker.report.summary_text()}")
+
+            progress.emit(
+                'result',
+                tracker=eyetracker.eyetracker.serial_number,
+                time_to_first_frame=time_to_first_frame,
+                **eyetracker.report.to_dict(),
+            )
+
+        progress.close()
+
+    def status(self, request, stream):
+        stream.write(json.dumps({
+            'event': 'status',
+            'trackers': [eyetracker.eyetracker.serial_number for eyetracker in self.eyetrackers],
+            'warm_up_time': self.warm_up_time,
+            'calibration_count': self.calibration_count,
+        }) + "\n")
+
+    def shutdown(self, request, stream):
+        stream.write(json.dumps({'event': 'shutdown'}) + "\n")
+
+        # serve_forever() has to return before shutdown() can, so wait for it elsewhere
+        threading.Thread(target=self.server.shutdown).start()
+
+        if self.wx:
+            self.wx.CallAfter(self.close_frames)
+
+    def close_frames(self):
+        for frame in self.frames:
+            frame.keep_alive = False
+            frame.Close()
+
+def request(command, port=None, host='127.0.0.1', **fields):
+    """Sends a command (with any other request fields) to a running daemon and yields the events it replies with"""
+    with socket.create_connection((host, port or config.current().daemon_port)) as connection:
+        connection.sendall((json.dumps({'command': command, **fields}) + "\n").encode('utf-8'))
+
+        with connection.makefile('r', encoding='utf-8') as replies:
+            for line in replies:
+                yield json.loads(line)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Send a request to a daemon started with app.py --daemon')
+    parser.add_argument('command', choices=['calibrate', 'status', 'shutdown'])
+    parser.add_argument('--port', type=int, help='Default: daemon_port from config.ini')
+    parser.add_argument('--user-id', help='With calibrate: whose cached calibration to reuse')
+    args = parser.parse_args()
+
+    fields = {'user_id': args.user_id} if args.user_id else {}
+
+    for event in request(args.command, port=args.port, **fields):
+        print(json.dumps(event), flush=True)
@@ -1,85 +1,123 @@
-from random import randint
-import time
-
-from config import *
+import logging
+import math
+import threading
+
+from cancellation import CancellationToken, Cancelled
+import config
+from clocks import RealClock
+from collection import PointOutcome, collection_strategies, valid_sample_fraction
+from filters import head_filters
+from layouts import gaze_distance
 from models import *
-from gui_events import *
+from scoring import UserPositionScorer
+from sinks import NullSink
 
-# Flush output by default (it gets buffered otherwise)
-import functools
-print = functools.partial(print, flush=True)
+logger = logging.getLogger(__name__)
 
-class UserPositionScorer:
-    def __init__(self):
-        self.recent_positions = []
-        self.positions_range = USER_POSITION_SCORE_BACK_LOOK
+VALIDATION_CHECK_INTERVAL = 0.05  # Seconds between measurements of the gaze at a validation target
 
-    def add_positions(self, guide):
-        if len(self.recent_positions) < self.positions_range:
-            self.recent_positions.append(guide)
-        else:
-            self.recent_positions.pop(0)
-            self.recent_positions.append(guide)
+class TobiiEyeTracker:
+    """
+    Interface to a real Tobii eye tracker device
+    """
 
-    def calculate_total_score(self):
-        total_score = 0
+    def __init__(self, api, sink=None, recorder=None, eyetracker=None, tracer=None, collection_strategy=None,
+                 max_recalibration_rounds=None, cache=None, user_id=None, layout=None, head_filter=None, score_window=None,
+                 cancellation=None):
+        self.api = api
+        self.sink = sink or NullSink()  # Where progress goes: the GUI, a log, or nowhere
+        self.recorder = recorder  # Optional recording.SessionRecorder
+        self.tracer = tracer  # Optional tracing.LatencyTracer
+        self.user_position_score = 0  # Tracks how well the user's head has been positioned
+        self.user_in_position = threading.Event()  # Set the moment the score crosses the requirement
+        self.report = CalibrationReport()  # Timings of the most recent calibrate()
 
-        for positions in self.recent_positions:
-            total_score += self.calculate_score_for_positions(positions)
+        # Name in collection.collection_strategies, or None for collection_strategy from config.ini
+        self.collection_strategy = collection_strategy
 
-        return total_score / self.positions_range
+        # Bound on rounds of re-collecting weak points, or None for recalibration_max_rounds from config.ini
+        self.max_recalibration_rounds = max_recalibration_rounds
 
-    def calculate_score_for_positions(self, positions):
-        left = positions.left_position
-        right = positions.right_position
+        # Name in filters.head_filters, or None for head_filter from config.ini
+        self.head_filter = head_filter
 
-        if not left.valid or not right.valid:
-            return 0
+        # User position scores averaged over, or None for user_position_score_back_look from config.ini
+        self.score_window = score_window
 
-        x_score = ((left.x + right.x) ** X_SCORE_EXPONENT) * X_SCORE_WEIGHT
-        y_score = ((left.y + right.y) ** Y_SCORE_EXPONENT) * Y_SCORE_WEIGHT
-        z_score = ((left.z + right.z) ** Z_SCORE_EXPONENT) * Z_SCORE_WEIGHT
+        # layouts.CalibrationLayout to calibrate at, or None for calibration_layout from config.ini
+        self.layout = layout
 
-        score_sum = x_score + y_score + z_score
+        self.cache = cache  # Optional calibration_cache.CalibrationCache
+        self.user_id = user_id  # Tells users of one tracker apart in the cache, if given
 
-        # print(f"{x_score} {y_score} {z_score}")
+        # Cancelled (from any thread) to stop calibrate() at its next wait or collection step
+        self.cancellation = cancellation or CancellationToken()
 
-        score = 1 - abs(1 - score_sum)
+        self.given_up_targets = set()  # Targets the collection strategy gave up on, until collected again
 
-        # TODO: Score should not fall out of 0.0-1.0 range. Fix math
-        if score > 1:
-            score = 1
-        elif score < 0:
-            score = 0
+        if eyetracker is None:
+            trackers = self.api.find_all_eyetrackers()
 
-        return score
+            if (len(trackers) == 0):
+                raise Exception("No tracker available")
 
-class TobiiEyeTracker:
-    """
-    Interface to a real Tobii eye tracker device
-    """
+            eyetracker = trackers[0]
 
-    def __init__(self, api, gui):
-        self.api = api
-        self.gui = gui
-        self.user_position_score = 0  # Tracks how well the user's head has been positioned
+        # Device handle, either discovered above or shared out by the caller
+        self.eyetracker = eyetracker
+
+        # Simulated devices may run on virtual time. Real ones use the wall clock
+        self.clock = getattr(self.eyetracker, 'clock', None) or RealClock()
 
-        trackers = self.api.find_all_eyetrackers()
+    def wait(self, event, timeout=None):
+        """
+        Waits on the clock until event is set or timeout seconds pass, but
+        raises Cancelled the moment the calibration is cancelled instead
+        """
+        with self.cancellation.waking(event):
+            happened = self.clock.wait(event, timeout)
 
-        if (len(trackers) == 0):
-            raise Exception("No tracker available")
+        self.cancellation.check()
 
-        self.eyetracker = trackers[0]
+        return happened
 
-    def post_event(self, event):
-        if self.gui:  # In case the GUI has been closed in the other thread
-            wx.PostEvent(self.gui, event)
+    def sleep(self, seconds):
+        self.wait(self.cancellation.event, max(seconds, 0))
 
-    def calibrate_user_position(self):
-        scorer = UserPositionScorer()
+    def calibrate_user_position(self, timeout=None):
+        """Waits until the user is in position. False if timeout seconds ran out first"""
+        scorer = UserPositionScorer(self.score_window)
+        head_filter = head_filters[self.head_filter or scorer.settings.head_filter](scorer.settings)
+        guides = UserPositionGuideRing()
+        self.user_in_position.clear()
+
+        tracer = self.tracer
 
         def callback(user_position_guide_dict):
-            guide = UserPositionGuide.from_dict(user_position_guide_dict)
+            if tracer:
+                received = tracer.now()
+
+            # One config snapshot per sample, so a reload lands between samples
+            settings = config.current()
+
+            if settings is not scorer.settings:
+                scorer.use_settings(settings)
+                head_filter.use_settings(settings)
+
+            if self.recorder:
+                self.recorder.record_user_position(user_position_guide_dict)
+
+            # Refilled in place, so tracking allocates nothing per sample
+            guide = guides.load(user_position_guide_dict)
+
+            if tracer:
+                tracer.start(guide, received)
+                tracer.stamp(guide, 'parse')
+
+            # Smoothed in place, for the scorer and the renderer alike
+            guide.time = self.clock.monotonic()
+            head_filter.update(guide, guide.time)
+
             scorer.add_positions(guide)
 
             score = scorer.calculate_total_score()
@@ -87,93 +125,413 @@ class TobiiEyeTracker:
             self.user_position_score = score
             guide.score = score
 
-            self.post_event(UpdateUserPositionEvent(guide))
+            if tracer:
+                tracer.stamp(guide, 'score')
+
+            self.sink.update_user_position(guide)
+
+            if tracer:
+                tracer.stamp(guide, 'post')
 
-        print("Subscribing to user position guide")
+            # Setting an already set Event still takes its lock and allocates
+            if score >= settings.user_position_score_requirement and not self.user_in_position.is_set():
+                self.user_in_position.set()
+
+        logger.debug("Subscribing to user position guide")
         self.eyetracker.subscribe_to(self.api.EYETRACKER_USER_POSITION_GUIDE, callback, as_dictionary=True)
 
-        while self.user_position_score < USER_POSITION_SCORE_REQUIREMENT:
-            time.sleep(0.02)
+        try:
+            in_position = self.wait(self.user_in_position, timeout)
+        finally:
+            self.eyetracker.unsubscribe_from(self.api.EYETRACKER_USER_POSITION_GUIDE, callback)
+            logger.debug("Unsubscribed from user position guide")
+
+        return in_position
 
-        self.eyetracker.unsubscribe_from(self.api.EYETRACKER_USER_POSITION_GUIDE, callback)
-        print("Unsubscribed from user position guide")
+    def wait_for_next_collection(self, last_collection_started):
+        """
+        Paces collect_data calls at most dot_collection_interval apart.
+
+        The first collection at a point starts as soon as collect_point has
+        waited out dot_settle_time, and time already spent inside
+        collect_data counts towards the interval, so a tracker whose
+        collect_data blocks for longer than that is never slept on.
+        """
+        if last_collection_started is None:
+            return
+
+        remaining = config.current().dot_collection_interval - (self.clock.monotonic() - last_collection_started)
+
+        self.sleep(remaining)
+
+    def recalibration_rounds(self):
+        if self.max_recalibration_rounds is not None:
+            return self.max_recalibration_rounds
+
+        return config.current().recalibration_max_rounds
+
+    def collect_point(self, calibration, target, recalibration_round=0):
+        """Shows a point and collects data at it until the collection strategy is done"""
+        point = target.position
+
+        logger.info("Show a point on screen at {0}.".format(point))
+
+        self.sink.show_point(target)
+
+        settings = config.current()
+        collection = collection_strategies[self.collection_strategy or settings.collection_strategy](settings)
+
+        point_started = self.clock.monotonic()
+        last_collection_started = None
+
+        # Samples from while the eyes were still on their way would go into the calibration
+        self.sleep(settings.dot_settle_time)
+
+        # Keep calibrating each dot until the strategy accepts it or gives up on it
+        while True:
+            self.cancellation.check()
+            self.wait_for_next_collection(last_collection_started)
+            last_collection_started = self.clock.monotonic()
+
+            logger.debug("Collecting data at {0}.".format(point))
+            result = calibration.collect_data(point[0], point[1])
+
+            if self.recorder:
+                self.recorder.record_collect_data(
+                    point[0],
+                    point[1],
+                    result,
+                    duration=self.clock.monotonic() - last_collection_started,
+                )
+
+            outcome = collection.add_result(result == self.api.CALIBRATION_STATUS_SUCCESS)
+
+            self.sink.show_point(target, collection.success_count, collection.progress)
+
+            if outcome != PointOutcome.COLLECTING:
+                break
+
+        # Points given up on are collected again along with the weak ones
+        if outcome == PointOutcome.GAVE_UP:
+            logger.info("Gave up on the point at {0} after {1} attempts.".format(point, collection.attempts))
+            self.given_up_targets.add(target)
+        else:
+            self.given_up_targets.discard(target)
+
+        self.report.add_point(
+            point=point,
+            attempts=collection.attempts,
+            successes=collection.success_count,
+            duration=self.clock.monotonic() - point_started,
+            outcome=outcome.name.lower(),
+            recalibration_round=recalibration_round,
+        )
+
+    def compute_and_apply(self, calibration):
+        self.cancellation.check()
+
+        logger.info("Computing and applying calibration.")
+        compute_started = self.clock.monotonic()
+        calibration_result = calibration.compute_and_apply()
+        compute_time = self.clock.monotonic() - compute_started
+
+        self.report.compute_and_apply_time = (self.report.compute_and_apply_time or 0) + compute_time
+
+        if self.recorder:
+            self.recorder.record_compute_and_apply(
+                calibration_result.status,
+                calibration_result.calibration_points,
+                duration=compute_time,
+                valid_and_used=self.api.VALIDITY_VALID_AND_USED,
+            )
+        logger.info("Compute and apply returned {0} and collected at {1} points.".
+                    format(calibration_result.status, len(calibration_result.calibration_points)))
+
+        return calibration_result
+
+    def calibration_point_at(self, calibration_result, point):
+        """The result's CalibrationPoint at the given (x, y), or None if it has no data there"""
+        for calibration_point in calibration_result.calibration_points:
+            x, y = calibration_point.position_on_display_area
+
+            if math.isclose(x, point[0], abs_tol=1e-6) and math.isclose(y, point[1], abs_tol=1e-6):
+                return calibration_point
+
+        return None
+
+    def find_weak_points(self, calibration_result, layout):
+        """
+        Points with no samples, or too few samples both eyes' data was used
+        from, and points the collection strategy last gave up on
+        """
+        minimum_fraction = config.current().recalibration_minimum_valid_fraction
+
+        weak_points = []
+
+        for target in layout:
+            calibration_point = self.calibration_point_at(calibration_result, target.position)
+
+            if calibration_point is None or target in self.given_up_targets:
+                weak_points.append(target)
+            elif valid_sample_fraction(calibration_point, self.api.VALIDITY_VALID_AND_USED) < minimum_fraction:
+                weak_points.append(target)
+
+        return weak_points
+
+    def recollect(self, calibration, calibration_result, targets, recalibration_round):
+        """Discards and collects the targets again, returning the new compute_and_apply result"""
+        self.report.recalibration_rounds = recalibration_round
+
+        for target in targets:
+            point = target.position
+
+            if self.calibration_point_at(calibration_result, point) is not None:
+                logger.info("Removing calibration point at {0}.".format(point))
+                calibration.discard_data(point[0], point[1])
+
+            self.collect_point(calibration, target, recalibration_round)
+
+        self.sink.finalizing_calibration()
+
+        return self.compute_and_apply(calibration)
+
+    def can_validate(self):
+        # Replays have no gaze stream to validate on
+        return config.current().validation and getattr(self.api, 'EYETRACKER_GAZE_DATA', None) is not None
+
+    def validate(self, validation_round=0):
+        """
+        Shows each validation target and measures the gaze stream at it,
+        moving on as soon as accuracy and precision are within bounds (or
+        validation_timeout runs out). Returns the targets that failed.
+        """
+        # NumPy is only loaded once a session gets this far
+        from validation import GazeRingBuffer, combined_gaze_point, measure
+
+        settings = config.current()
+        gaze = GazeRingBuffer(settings.validation_window)
+
+        def callback(gaze_data):
+            point = combined_gaze_point(gaze_data)
+
+            if point is not None:
+                gaze.append(*point)
+
+        # Simulated users have to be told where to look. Real ones see the target
+        look_at = getattr(self.eyetracker, 'look_at', None)
+
+        failed_targets = []
+
+        logger.debug("Subscribing to gaze data")
+        self.eyetracker.subscribe_to(self.api.EYETRACKER_GAZE_DATA, callback, as_dictionary=True)
+
+        try:
+            for target in settings.validation_layout:
+                logger.info("Show a validation point on screen at {0}.".format(target.position))
+                self.sink.show_validation_point(target)
+
+                if look_at:
+                    look_at(target.position)
+
+                # Samples from while the eyes were still on their way are dropped
+                self.sleep(settings.validation_settle_time)
+                gaze.clear()
+                target_started = self.clock.monotonic()
+
+                while True:
+                    self.sleep(VALIDATION_CHECK_INTERVAL)
+
+                    samples, accuracy, precision = measure(gaze, target.position)
+
+                    # Accuracy and precision are None with fewer than two samples
+                    passed = (
+                        samples >= settings.validation_minimum_samples
+                        and accuracy is not None
+                        and accuracy <= settings.validation_max_accuracy
+                        and precision <= settings.validation_max_precision
+                    )
+
+                    if passed or self.clock.monotonic() - target_started >= settings.validation_timeout:
+                        break
+
+                if not passed:
+                    logger.info("Validation failed at {0}: accuracy {1}, precision {2} from {3} samples.".format(
+                        target.position, accuracy, precision, samples))
+                    failed_targets.append(target)
+
+                self.report.add_validation_point(
+                    point=target.position,
+                    samples=samples,
+                    accuracy=accuracy,
+                    precision=precision,
+                    passed=passed,
+                    duration=self.clock.monotonic() - target_started,
+                    validation_round=validation_round,
+                )
+        finally:
+            self.eyetracker.unsubscribe_from(self.api.EYETRACKER_GAZE_DATA, callback)
+            logger.debug("Unsubscribed from gaze data")
+
+        self.report.validation_failures = [target.position for target in failed_targets]
+
+        return failed_targets
+
+    def nearest_targets(self, validation_targets, layout):
+        """The layout's targets nearest to each validation target, in layout order"""
+        nearest = {
+            min(layout, key=lambda target: gaze_distance(target.position, validation_target.position))
+            for validation_target in validation_targets
+        }
+
+        return [target for target in layout if target in nearest]
 
     def calibrate(self):
+        """Runs a whole calibration session. Returns early, with report.cancelled set, if cancelled"""
+        self.report = CalibrationReport()
+
+        try:
+            self.run_session()
+        except Cancelled:
+            self.report.cancelled = True
+            logger.info("Calibration of eye tracker with serial number {0} cancelled.".format(self.eyetracker.serial_number))
+
+    def run_session(self):
         eyetracker = self.eyetracker
 
-        self.calibrate_user_position()
+        session_started = self.clock.monotonic()
+
+        if self.cache and self.reuse_cached_calibration(session_started):
+            self.report.total_time = self.clock.monotonic() - session_started
+            self.sink.calibration_concluded()
+            return
+
+        # Unless the user got into position already, checking the cached calibration
+        if self.report.time_to_position is None:
+            self.calibrate_user_position()
+
+            self.report.time_to_position = self.clock.monotonic() - session_started
 
         calibration = self.api.ScreenBasedCalibration(eyetracker)
 
         calibration.enter_calibration_mode()
-        print("Entered calibration mode for eye tracker with serial number {0}.".format(eyetracker.serial_number))
-
-        # Define the points on screen we should calibrate at.
-        # The coordinates are normalized, i.e. (0.0, 0.0) is the upper left corner and (1.0, 1.0) is the lower right corner.
-        points_to_calibrate = [
-            PointLocation.CENTER,
-            PointLocation.UPPER_LEFT,
-            PointLocation.UPPER_RIGHT,
-            PointLocation.LOWER_LEFT,
-            PointLocation.LOWER_RIGHT,
-        ]
+        logger.info("Entered calibration mode for eye tracker with serial number {0}.".format(eyetracker.serial_number))
+
+        # Calibration mode is left even when cancelled, so the tracker is usable again
+        try:
+            calibration_result = self.calibrate_in_mode(calibration)
+        finally:
+            # The calibration is done. Leave calibration mode.
+            calibration.leave_calibration_mode()
+
+            logger.info("Left calibration mode.")
+
+        if self.cache and calibration_result.status == self.api.CALIBRATION_STATUS_SUCCESS \
+                and not self.report.weak_points and not self.report.validation_failures:
+            self.store_calibration()
+
+        self.report.total_time = self.clock.monotonic() - session_started
 
-        for point_enum in points_to_calibrate:
-            point = point_enum.value
+        self.sink.calibration_concluded()
 
-            print("Show a point on screen at {0}.".format(point))
+    def calibrate_in_mode(self, calibration):
+        """Collects, computes, recollects and validates, returning the final compute_and_apply result"""
+        # The points on screen we should calibrate at, in the order to show them.
+        # The same layout object positions them on screen in the GUI
+        layout = self.layout or config.current().layout
+        self.given_up_targets = set()
 
-            self.post_event(ShowPointEvent(point_enum))
+        for target in layout:
+            self.collect_point(calibration, target)
 
-            results = []
+        self.sink.finalizing_calibration()
+        calibration_result = self.compute_and_apply(calibration)
 
-            # Keep calibrating each dot until successful
-            while True:
-                time.sleep(0.05)
-                print("Collecting data at {0}.".format(point))
-                result = calibration.collect_data(point[0], point[1])
-                if result == self.api.CALIBRATION_STATUS_SUCCESS:
-                    if len(results) > DOT_RESULT_BACK_LOOK:
-                        results.pop(0)
-                    results.append(result)
+        # Instead of rerunning the whole session, discard and re-collect only
+        # the points that came back with poor or missing samples
+        for recalibration_round in range(1, self.recalibration_rounds() + 1):
+            weak_points = self.find_weak_points(calibration_result, layout)
 
-                successes = [r for r in results if r]
-                success_count = len(successes)
+            if not weak_points:
+                break
 
-                self.post_event(ShowPointEvent(point_enum, success_count))
+            calibration_result = self.recollect(calibration, calibration_result, weak_points, recalibration_round)
 
-                if success_count >= DOT_RESULT_SUCCESSES_REQUIREMENT:
+        # See that you're happy with the result: check accuracy and precision
+        # on the gaze stream, and re-collect the points nearest to any
+        # validation target that falls short
+        if self.can_validate():
+            max_rounds = config.current().validation_max_rounds
+
+            for validation_round in range(max_rounds + 1):
+                failed_targets = self.validate(validation_round)
+
+                if not failed_targets or validation_round == max_rounds:
                     break
 
-        self.post_event(FinalizingCalibrationEvent())
+                calibration_result = self.recollect(
+                    calibration,
+                    calibration_result,
+                    self.nearest_targets(failed_targets, layout),
+                    self.report.recalibration_rounds + 1,
+                )
 
-        print("Computing and applying calibration.")
-        calibration_result = calibration.compute_and_apply()
-        print("Compute and apply returned {0} and collected at {1} points.".
-              format(calibration_result.status, len(calibration_result.calibration_points)))
+        self.report.weak_points = [
+            target.position for target in self.find_weak_points(calibration_result, layout)
+        ]
 
+        return calibration_result
+
+    def reuse_cached_calibration(self, session_started):
+        """
+        Applies this tracker's cached calibration data for self.user_id, if
+        there is any. With calibration_cache_validation, the user has to get
+        into position first, within calibration_cache_validation_timeout, and
+        the applied calibration has to pass validation (if enabled).
+        False if the full calibration has to run after all.
         """
-        # Analyze the data and maybe remove points that weren't good.
-        recalibrate_point = (0.1, 0.1)
-        print("Removing calibration point at {0}.".format(recalibrate_point))
-        calibration.discard_data(recalibrate_point[0], recalibrate_point[1])
+        serial_number = self.eyetracker.serial_number
+        data = self.cache.load(serial_number, self.user_id)
 
-        # Redo collection at the discarded point
-        print("Show a point on screen at {0}.".format(recalibrate_point))
-        calibration.collect_data(recalibrate_point[0], recalibrate_point[1])
+        if data is None:
+            return False
 
-        # Compute and apply again.
-        print("Computing and applying calibration.")
-        calibration_result = calibration.compute_and_apply()
-        print("Compute and apply returned {0} and collected at {1} points.".
-              format(calibration_result.status, len(calibration_result.calibration_points)))
-        """
+        settings = config.current()
+
+        if settings.calibration_cache_validation:
+            if not self.calibrate_user_position(settings.calibration_cache_validation_timeout):
+                logger.info("User did not get into position in time, so calibrating from scratch.")
+                return False
+
+            self.report.time_to_position = self.clock.monotonic() - session_started
+
+        try:
+            self.eyetracker.apply_calibration_data(data)
+        except Exception:
+            logger.warning("Could not apply cached calibration data, so calibrating from scratch.", exc_info=True)
+            self.cache.remove(serial_number, self.user_id)
+            return False
+
+        if settings.calibration_cache_validation and self.can_validate() and self.validate():
+            logger.info("Cached calibration failed validation, so calibrating from scratch.")
+            self.cache.remove(serial_number, self.user_id)
+
+            self.report.validation = []
+            self.report.validation_failures = []
+            return False
+
+        self.report.reused_cached_calibration = True
+        logger.info("Applied cached calibration data to eye tracker with serial number {0}.".format(serial_number))
 
-        # See that you're happy with the result.
+        return True
 
-        # The calibration is done. Leave calibration mode.
-        calibration.leave_calibration_mode()
+    def store_calibration(self):
+        data = self.eyetracker.retrieve_calibration_data()
 
-        print("Left calibration mode.")
+        if not data:
+            return
 
-        self.post_event(CalibrationConcludedEvent())
+        try:
+            self.cache.store(self.eyetracker.serial_number, self.user_id, data)
+        except OSError:
+            # Only the next session is slower for it
+            logger.warning("Could not store calibration data in the cache.", exc_info=True)
@@ -0,0 +1,142 @@
+RESET_GAP = 0.5  # Seconds without a valid sample after which an eye's filter starts over
+
+class HeadFilter:
+    """
+    Smooths user position guides in place, before they are scored and drawn,
+    and estimates each coordinate's velocity (UserPosition.vx/vy/vz) so the
+    renderer can predict where the head will be when a frame is shown.
+
+    State lives in preallocated lists, one slot per eye and axis, so each
+    sample costs O(1) and allocates nothing. The base class passes samples
+    through unchanged.
+    """
+
+    def __init__(self, settings):
+        self.positions = [0.0] * 6  # Left x, y, z, then right x, y, z
+        self.velocities = [0.0] * 6
+        self.last_times = [None, None]  # Time of each eye's last valid sample
+
+        self.use_settings(settings)
+
+    def use_settings(self, settings):
+        pass
+
+    def update(self, guide, now):
+        # One eye at a time, as looping over a tuple of them would allocate
+        self.update_eye(0, guide.left_position, now)
+        self.update_eye(1, guide.right_position, now)
+
+    def update_eye(self, eye, position, now):
+        if not position.valid:
+            return
+
+        last_time = self.last_times[eye]
+        self.last_times[eye] = now
+        index = eye * 3
+
+        if last_time is None or now - last_time > RESET_GAP:
+            self.reset(index, position.x)
+            self.reset(index + 1, position.y)
+            self.reset(index + 2, position.z)
+            return
+
+        dt = now - last_time
+
+        if dt <= 0:
+            return
+
+        position.x = self.step(index, position.x, dt)
+        position.y = self.step(index + 1, position.y, dt)
+        position.z = self.step(index + 2, position.z, dt)
+
+        position.vx = self.velocities[index]
+        position.vy = self.velocities[index + 1]
+        position.vz = self.velocities[index + 2]
+
+    def reset(self, index, measurement):
+        self.positions[index] = measurement
+        self.velocities[index] = 0.0
+
+    def step(self, index, measurement, dt):
+        return measurement
+
+class ExponentialFilter(HeadFilter):
+    """
+    Exponential smoothing with a smoothed trend (Holt's linear method).
+    head_filter_alpha is the weight of each new sample, for both the
+    position and its velocity.
+    """
+
+    def use_settings(self, settings):
+        self.alpha = settings.head_filter_alpha
+
+    def step(self, index, measurement, dt):
+        alpha = self.alpha
+
+        predicted = self.positions[index] + self.velocities[index] * dt
+        position = alpha * measurement + (1 - alpha) * predicted
+
+        self.velocities[index] = alpha * (position - self.positions[index]) / dt + (1 - alpha) * self.velocities[index]
+        self.positions[index] = position
+
+        return position
+
+class KalmanFilter(HeadFilter):
+    """
+    Constant-velocity Kalman filter per coordinate. head_filter_process_noise
+    is how much the head's velocity is expected to wander (per second), and
+    head_filter_measurement_noise the standard deviation of a sample.
+    """
+
+    def __init__(self, settings):
+        # Covariance of each coordinate's (position, velocity) estimate
+        self.variances = [0.0] * 6
+        self.covariances = [0.0] * 6
+        self.velocity_variances = [0.0] * 6
+
+        HeadFilter.__init__(self, settings)
+
+    def use_settings(self, settings):
+        self.process_noise = settings.head_filter_process_noise
+        self.measurement_variance = settings.head_filter_measurement_noise ** 2
+
+    def reset(self, index, measurement):
+        HeadFilter.reset(self, index, measurement)
+
+        self.variances[index] = self.measurement_variance
+        self.covariances[index] = 0.0
+        self.velocity_variances[index] = 1.0  # Nothing is known about the velocity yet
+
+    def step(self, index, measurement, dt):
+        q = self.process_noise
+
+        # Predict
+        position = self.positions[index] + self.velocities[index] * dt
+        velocity = self.velocities[index]
+
+        velocity_variance = self.velocity_variances[index]
+        covariance = self.covariances[index] + dt * velocity_variance + q * dt * dt / 2
+        variance = self.variances[index] + dt * (2 * self.covariances[index] + dt * velocity_variance) + q * dt * dt * dt / 3
+        velocity_variance += q * dt
+
+        # Update with the measurement
+        innovation_variance = variance + self.measurement_variance
+        position_gain = variance / innovation_variance
+        velocity_gain = covariance / innovation_variance
+        innovation = measurement - position
+
+        self.positions[index] = position + position_gain * innovation
+        self.velocities[index] = velocity + velocity_gain * innovation
+
+        self.variances[index] = (1 - position_gain) * variance
+        self.covariances[index] = (1 - position_gain) * covariance
+        self.velocity_variances[index] = velocity_variance - velocity_gain * covariance
+
+        return self.positions[index]
+
+# Values of head_filter in config.ini
+head_filters = {
+    'none': HeadFilter,
+    'exponential': ExponentialFilter,
+    'kalman': KalmanFilter,
+}
@@ -1,20 +1,86 @@
 from enum import Enum, auto
+import logging
+import os.path
+import threading
+import time
 
 import wx
 
-from config import *
+import config
 from models import *
 from gui_events import *
+from channels import LatestValueMailbox
+from clocks import RealClock
+from sinks import MailboxSink
+from stats import RollingStats
+import startup
 
-# Flush output by default (it gets buffered otherwise)
-import functools
-print = functools.partial(print, flush=True)
+logger = logging.getLogger(__name__)
+
+MAX_PREDICTION = 0.1  # Seconds the face is ever drawn ahead of its latest sample
+
+# CalibrationFrame attribute -> image in the "media" folder
+media_files = {
+    'to_proceed_bitmap': 'Calibrate_Eye_Tracking_Proceed.png',
+    'seat_adjustment_bitmap': 'If_You_Cannot_See.png',
+    'stare_bitmap': 'Stare-at-each-dot-centered.png',
+    'finalizing_bitmap': 'Finalizing_Calibration.png',
+}
+
+def MediaPath(image_name):
+    return os.path.join(os.path.dirname(__file__), 'media', image_name)
 
 class CalibrationBitmap(wx.Bitmap):
     """Convenience class for getting Bitmaps from images stored in the "media" folder"""
     def __init__(self, image_name):
-        path = os.path.join(os.path.dirname(__file__), 'media', image_name)
-        wx.Bitmap.__init__(self, path)
+        wx.Bitmap.__init__(self, MediaPath(image_name))
+
+class MediaLoader(threading.Thread):
+    """
+    Decodes the media images off the GUI thread. Bitmaps can only be made on
+    the GUI thread, so that part is handed back to the frame with CallAfter
+    """
+
+    def __init__(self, frame):
+        self.frame = frame
+
+        threading.Thread.__init__(self, daemon=True)
+
+    def run(self):
+        images = {name: wx.Image(MediaPath(image_name)) for name, image_name in media_files.items()}
+
+        wx.CallAfter(self.Loaded, images)
+
+    def Loaded(self, images):
+        if self.frame:  # In case the frame was closed while loading
+            self.frame.SetMediaBitmaps({name: wx.Bitmap(image) for name, image in images.items()})
+
+class CalibrationFrameSink(MailboxSink):
+    """
+    Forwards TobiiEyeTracker progress to a CalibrationFrame from any thread.
+    User position guides go through the frame's mailbox, everything else as wx events
+    """
+
+    def __init__(self, frame):
+        self.frame = frame
+
+        MailboxSink.__init__(self, frame.user_position_mailbox)
+
+    def post_event(self, event):
+        if self.frame:  # In case the GUI has been closed in the other thread
+            wx.PostEvent(self.frame, event)
+
+    def show_point(self, point, success_count=0, progress=0.0):
+        self.post_event(ShowPointEvent(point, progress))
+
+    def show_validation_point(self, point):
+        self.post_event(ShowPointEvent(point))
+
+    def finalizing_calibration(self):
+        self.post_event(FinalizingCalibrationEvent())
+
+    def calibration_concluded(self):
+        self.post_event(CalibrationConcludedEvent())
 
 class CalibrationMode(Enum):
     POSITIONING_USER = auto()
@@ -23,23 +89,72 @@ class CalibrationMode(Enum):
     CALIBRATION_CONCLUDED = auto()
 
 class CalibrationFrame(wx.Frame):
-    def __init__(self, parent=None, title='Eye-Tracking Calibration', debug=False):
+    def __init__(self, parent=None, title='Eye-Tracking Calibration', debug=False, display_index=0, tracer=None,
+                 keep_alive=False, show=True, on_first_paint=None, on_close=None):
         self.debug = debug
+        self.tracer = tracer  # Optional tracing.LatencyTracer, shared with the tracker
         self.mode = None
 
+        # A daemon keeps the frame (and its bitmaps) between calibrations:
+        # closing it only hides it until the next ShowFrame()
+        self.keep_alive = keep_alive
+
+        # Called with the perf_counter() time of the first paint after the frame is shown
+        self.on_first_paint = on_first_paint
+        self.awaiting_first_paint = False
+
+        # Called when the frame is closed (or, kept alive, hidden) before its
+        # calibration concluded, to cancel that calibration
+        self.on_close = on_close
+
+        # Config snapshot in use. NextFrame switches to a reloaded one between frames
+        self.settings = config.current()
+
+        # With several trackers, each frame goes full screen on its own display
+        self.display_index = display_index % wx.Display.GetCount()
+
         wx.Frame.__init__(self, parent, title=title, size=(200, 100))
 
-        self.to_proceed_bitmap = CalibrationBitmap('Calibrate_Eye_Tracking_Proceed.png')
-        self.seat_adjustment_bitmap = CalibrationBitmap('If_You_Cannot_See.png')
-        self.stare_bitmap = CalibrationBitmap('Stare-at-each-dot-centered.png')
-        self.finalizing_bitmap = CalibrationBitmap('Finalizing_Calibration.png')
+        self.SetPosition(wx.Display(self.display_index).GetGeometry().GetTopLeft())
+
+        self.to_proceed_bitmap = None
+        self.seat_adjustment_bitmap = None
+        self.stare_bitmap = None
+        self.finalizing_bitmap = None
 
         self.current_point = None
+        self.progress = 0.0  # Of the current point towards being accepted
         self.user_position_guide = None
+        self.clock = None  # The tracker's clock, which its guides are timed on. Set once the tracker is created
+        self.drawn_user_position_guide = None  # The guide as predicted for when the frame is shown
 
-        self.timer = wx.Timer(self)
-        self.fps = FPS
-        self.timer.Start(1000.0/self.fps)
+        # The tracker refills the guides it hands over in place, so each is
+        # copied into whichever of these the frame is not holding on to
+        self.user_position_guides = (UserPositionGuide.empty(), UserPositionGuide.empty())
+
+        # With damage-driven repaints, only what changed since the last frame
+        # is invalidated, and idle frames are skipped entirely
+        self.damage_driven = self.settings.damage_driven_repaint
+        self.dirty_all = True
+        self.dirty_rects = []
+
+        # Static content (background, instructions, targets, config text) is
+        # rendered once per mode and blitted, so each frame only draws the
+        # moving parts on top
+        self.cache_static_layers = self.settings.cache_static_layers
+        self.background_layers = {}
+        self.config_debug_text = None
+
+        self.pens = {}
+        self.brushes = {}
+
+        self.paint_times = RollingStats(size=self.settings.fps * 5)
+
+        # Written by the tracker thread on every sample, read once per frame
+        self.user_position_mailbox = LatestValueMailbox()
+
+        self.timer = wx.Timer(self)  # Runs while the frame is shown
+        self.fps = self.settings.fps
 
         self.Bind(wx.EVT_TIMER, self.NextFrame)
         self.Bind(wx.EVT_ERASE_BACKGROUND, lambda e: None)  # Avoid flicker
@@ -48,63 +163,299 @@ class CalibrationFrame(wx.Frame):
         self.Bind(wx.EVT_LEFT_UP, self.CloseFrame)
         self.Bind(EVT_CALIBRATION, self.OnCalibration)
         self.Bind(EVT_CLOSE_APP, self.CloseFrame)
+        self.Bind(wx.EVT_CLOSE, self.OnClose)
+        self.Bind(wx.EVT_SIZE, self.OnSize)
 
-        self.ShowFullScreen(True)
-        self.Show(True)
+        # Without the images the first frames are plain, but they show up at once
+        if self.settings.async_media_loading:
+            MediaLoader(self).start()
+        else:
+            self.SetMediaBitmaps({name: CalibrationBitmap(image_name) for name, image_name in media_files.items()})
 
-        self.point_mapping = {
-            PointLocation.CENTER: self.DrawCenterCircle,
-            PointLocation.UPPER_LEFT: self.DrawUpperLeftCircle,
-            PointLocation.UPPER_RIGHT: self.DrawUpperRightCircle,
-            PointLocation.LOWER_LEFT: self.DrawLowerLeftCircle,
-            PointLocation.LOWER_RIGHT: self.DrawLowerRightCircle,
-        }
+        if show:
+            self.ShowFrame()
 
     def OnCalibration(self, event):
         if event.calibration_event_type == CALIBRATION_CONCLUDED:
-            self.mode = CalibrationMode.CALIBRATION_CONCLUDED
+            self.SetMode(CalibrationMode.CALIBRATION_CONCLUDED)
             self.Close()
         elif event.calibration_event_type == FINALIZING_CALIBRATION:
-            self.mode = CalibrationMode.FINALIZING_CALIBRATION
+            self.SetMode(CalibrationMode.FINALIZING_CALIBRATION)
         elif event.calibration_event_type == SHOW_POINT:
-            self.mode = CalibrationMode.CALIBRATING_EYES
-            self.current_point = event.point
-            self.success_count = event.success_count
+            self.SetMode(CalibrationMode.CALIBRATING_EYES)
+            self.SetCalibrationPoint(event.point, event.progress)
         elif event.calibration_event_type == UPDATE_USER_POSITION:
-            self.mode = CalibrationMode.POSITIONING_USER
-            self.user_position_guide = event.user_position_guide
+            self.SetMode(CalibrationMode.POSITIONING_USER)
+            self.SetUserPositionGuide(self.OwnUserPositionGuide(event.user_position_guide))
+
+    def ShowFrame(self):
+        """Shows the frame full screen, starting from a fresh calibration"""
+        self.mode = None
+        self.current_point = None
+        self.progress = 0.0
+        self.user_position_guide = None
+        self.clock = None  # The tracker's clock, which its guides are timed on. Set once the tracker is created
+        self.drawn_user_position_guide = None
+        self.user_position_mailbox.take()  # Drop any sample left over from the last calibration
+        self.InvalidateAll()
+
+        self.awaiting_first_paint = True
+        self.timer.Start(1000.0/self.fps)
+
+        self.ShowFullScreen(True)
+        self.Show(True)
+
+    def HideFrame(self):
+        self.timer.Stop()
+        self.ShowFullScreen(False)
+        self.Hide()
+
+    def SetMediaBitmaps(self, bitmaps):
+        for name, bitmap in bitmaps.items():
+            setattr(self, name, bitmap)
+
+        self.background_layers = {}  # Rendered before the images arrived
+        self.InvalidateAll()
+
+        startup.report.mark('media loaded')
+
+    def ApplySettings(self, settings):
+        """Switches to a reloaded config snapshot, redrawing everything with it"""
+        self.settings = settings
+
+        self.damage_driven = settings.damage_driven_repaint
+        self.cache_static_layers = settings.cache_static_layers
+        self.background_layers = {}
+        self.config_debug_text = None
+
+        if settings.fps != self.fps:
+            self.fps = settings.fps
+
+            if self.timer.IsRunning():
+                self.timer.Start(1000.0/self.fps)
+
+        self.InvalidateAll()
+
+    def SetMode(self, mode):
+        if mode != self.mode:
+            self.mode = mode
+            self.InvalidateAll()
+
+    def SetCalibrationPoint(self, point, progress):
+        if point == self.current_point and progress == self.progress:
+            return
+
+        display_width, display_height = self.DisplaySize()
+
+        self.InvalidateRect(self.CalibrationPointRect(self.current_point, display_width, display_height))
+
+        self.current_point = point
+        self.progress = progress
+
+        self.InvalidateRect(self.CalibrationPointRect(self.current_point, display_width, display_height))
+
+    def SetUserPositionGuide(self, user_position_guide):
+        display_width, display_height = self.DisplaySize()
+        drawn_user_position_guide = self.PredictUserPositionGuide(user_position_guide)
+
+        # Erase the face where it was, and draw it where it is now
+        self.InvalidateRect(self.UserFaceRect(self.drawn_user_position_guide, display_width, display_height))
+        self.InvalidateRect(self.UserFaceRect(drawn_user_position_guide, display_width, display_height))
+
+        self.InvalidateRect(self.UserFaceScoreRect(display_width, display_height))
+
+        if self.debug:
+            self.InvalidateRect(self.UserFaceDebugInfoRect())
+
+        self.user_position_guide = user_position_guide
+        self.drawn_user_position_guide = drawn_user_position_guide
+
+    def OwnUserPositionGuide(self, user_position_guide):
+        """A copy of a guide from the tracker, which stays as it is while the frame holds it"""
+        first, second = self.user_position_guides
+        own = second if self.user_position_guide is first else first
+
+        return own.copy_from(user_position_guide)
+
+    def PredictUserPositionGuide(self, user_position_guide):
+        """
+        Extrapolates the (filtered) guide to about when this frame reaches the
+        screen, half a frame after it is painted, to hide the pipeline latency
+        """
+        if not self.settings.head_filter_prediction or user_position_guide.time is None:
+            return user_position_guide
+
+        # Simulated and replayed trackers may run on virtual time, which says
+        # nothing about when the frame reaches the screen
+        if not isinstance(self.clock, RealClock):
+            return user_position_guide
+
+        lead = self.clock.monotonic() + 0.5 / self.fps - user_position_guide.time
+
+        return user_position_guide.predicted(min(max(lead, 0), MAX_PREDICTION))
+
+    def InvalidateAll(self):
+        self.dirty_all = True
+
+    def InvalidateRect(self, rect):
+        if rect and not rect.IsEmpty():
+            self.dirty_rects.append(rect)
+
+    def DisplaySize(self):
+        return wx.Display(self.display_index).GetGeometry().GetSize()
+
+    def OnSize(self, event):
+        self.background_layers.clear()
+        self.InvalidateAll()
+        event.Skip()
+
+    def GetPen(self, colour, width=1, style=wx.PENSTYLE_SOLID):
+        key = (colour, width, style)
+
+        if key not in self.pens:
+            self.pens[key] = wx.Pen(colour, width=width, style=style)
+
+        return self.pens[key]
+
+    def GetBrush(self, colour, style=wx.BRUSHSTYLE_SOLID):
+        key = (colour, style)
+
+        if key not in self.brushes:
+            self.brushes[key] = wx.Brush(colour, style=style)
+
+        return self.brushes[key]
 
     def NextFrame(self, event):
-        # Force a redraw
-        self.Refresh(eraseBackground=ERASE_BACKGROUND)
+        settings = config.current()
+
+        if settings is not self.settings:
+            self.ApplySettings(settings)
+
+        user_position_guide = self.user_position_mailbox.take()
+
+        if user_position_guide:
+            if self.tracer:
+                self.tracer.stamp(user_position_guide, 'queue')
+
+            user_position_guide = self.OwnUserPositionGuide(user_position_guide)
+
+        # A sample arriving after the first point is shown must not drag the
+        # frame back into positioning mode
+        if user_position_guide and self.mode in (None, CalibrationMode.POSITIONING_USER):
+            self.SetMode(CalibrationMode.POSITIONING_USER)
+            self.SetUserPositionGuide(user_position_guide)
+
+        if not self.damage_driven:
+            # Force a redraw
+            self.Refresh(eraseBackground=self.settings.erase_background)
+            self.Update()
+            return
+
+        if self.dirty_all:
+            self.Refresh(eraseBackground=self.settings.erase_background)
+        elif self.dirty_rects:
+            if self.debug:
+                self.dirty_rects.append(self.FrameTimeDebugInfoRect())
+
+            for rect in self.dirty_rects:
+                self.RefreshRect(rect, eraseBackground=self.settings.erase_background)
+        else:
+            return  # Nothing changed on screen since the last frame
+
+        self.dirty_all = False
+        self.dirty_rects = []
+
         self.Update()
 
     def CloseFrame(self, event):
-        print(f"Closing Frame ({self.__class__.__name__})")
+        logger.debug(f"Closing Frame ({self.__class__.__name__})")
         self.Close()
 
+    def OnClose(self, event):
+        if self.on_close and self.mode != CalibrationMode.CALIBRATION_CONCLUDED:
+            self.on_close()
+
+        if self.keep_alive and event.CanVeto():
+            event.Veto()
+            self.HideFrame()
+            return
+
+        logger.info(f"User position samples: {self.user_position_mailbox.stats_text()}")
+        logger.info(f"Paint time: {self.paint_times.summary_text()}")
+        event.Skip()
+
     def OnPaint(self, event):
+        paint_start = time.perf_counter()
+
         dc = wx.PaintDC(self)
 
-        brush_black = wx.Brush("black")
+        display_width, display_height = self.DisplaySize()
 
-        dc.SetBackground(brush_black)
-        dc.Clear()
+        if self.cache_static_layers:
+            layer = self.GetBackgroundLayer(display_width, display_height)
+            dc.DrawBitmap(bitmap=layer, x=0, y=0, useMask=False)
+        else:
+            self.DrawBackground(dc, display_width, display_height)
+
+        self.DrawForeground(dc, display_width, display_height)
+
+        self.paint_times.add(time.perf_counter() - paint_start)
+
+        if self.awaiting_first_paint:
+            self.awaiting_first_paint = False
+            startup.report.mark('first frame', paint_start)
+
+            if self.on_first_paint:
+                self.on_first_paint(paint_start)
+
+        if self.tracer and self.mode == CalibrationMode.POSITIONING_USER:
+            self.tracer.stamp(self.user_position_guide, 'paint')
+
+    def GetBackgroundLayer(self, display_width, display_height):
+        """Pre-rendered static content for the current mode (dropped on resize)"""
+        layer = self.background_layers.get(self.mode)
 
-        display_width, display_height = wx.DisplaySize()
+        if layer is None:
+            layer = wx.Bitmap(display_width, display_height)
+
+            dc = wx.MemoryDC(layer)
+            self.DrawBackground(dc, display_width, display_height)
+            dc.SelectObject(wx.NullBitmap)
+
+            self.background_layers[self.mode] = layer
+
+        return layer
+
+    def DrawBackground(self, dc, display_width, display_height):
+        """Everything that stays put while the mode does not change"""
+        dc.SetBackground(self.GetBrush("black"))
+        dc.Clear()
 
         if self.mode == CalibrationMode.POSITIONING_USER:
             self.DrawUserPositionInstructions(dc, display_width, display_height)
-            self.DrawUserPositionGuide(dc, display_width, display_height)
+            self.DrawUserFaceTarget(Display(dc, display_width, display_height))
         elif self.mode == CalibrationMode.CALIBRATING_EYES:
-            self.DrawCalibrationPoints(dc, display_width, display_height, self.success_count)
+            self.DrawStareInstructions(dc, display_width, display_height)
         elif self.mode == CalibrationMode.FINALIZING_CALIBRATION:
             self.DrawFinalizingCalibration(dc, display_width, display_height)
 
         if self.debug:
             self.DrawConfigDebugInfo(dc, display_width, display_height)
 
+    def DrawForeground(self, dc, display_width, display_height):
+        """Everything that moves from one frame to the next"""
+        if self.mode == CalibrationMode.POSITIONING_USER:
+            self.DrawUserPositionGuide(dc, display_width, display_height)
+        elif self.mode == CalibrationMode.CALIBRATING_EYES:
+            self.DrawCalibrationPoints(dc, display_width, display_height, self.progress)
+
+        if self.debug:
+            self.DrawFrameTimeDebugInfo(dc, display_width, display_height)
+
     def DrawFinalizingCalibration(self, dc, display_width, display_height):
+        if self.finalizing_bitmap is None:
+            return  # Still loading
+
         finalizing_x = (display_width / 2) - (self.finalizing_bitmap.GetWidth() / 2)
         finalizing_y = (display_height / 2) - (self.finalizing_bitmap.GetHeight() / 2)
 
@@ -118,6 +469,9 @@ class CalibrationFrame(wx.Frame):
     def DrawUserPositionInstructions(self, dc, display_width, display_height):
         instruction_margin = 40
 
+        if self.to_proceed_bitmap is None or self.seat_adjustment_bitmap is None:
+            return  # Still loading
+
         dc.DrawBitmap(
             bitmap=self.to_proceed_bitmap,
             x=instruction_margin,
@@ -142,9 +496,7 @@ class CalibrationFrame(wx.Frame):
             height=display_height,
         )
 
-        self.DrawUserFaceTarget(display)
-
-        self.DrawUserFace(display, self.user_position_guide)
+        self.DrawUserFace(display, self.drawn_user_position_guide)
 
         self.DrawUserFaceScore(display, self.user_position_guide.score)
 
@@ -155,10 +507,10 @@ class CalibrationFrame(wx.Frame):
         thickness = 8  # Arbitrary but promising guess
         radius = 50  # Arbitrary but promising guess
 
-        pen = wx.Pen("white", width=thickness, style=wx.PENSTYLE_SHORT_DASH)
+        pen = self.GetPen("white", width=thickness, style=wx.PENSTYLE_SHORT_DASH)
 
         display.context.SetPen(pen)
-        display.context.SetBrush(wx.Brush("white", wx.TRANSPARENT))
+        display.context.SetBrush(self.GetBrush("white", wx.TRANSPARENT))
 
         center_x = display.width / 2
         center_y = display.height / 2
@@ -180,10 +532,10 @@ class CalibrationFrame(wx.Frame):
         self.DrawUserEye(display, left_user_position)
         self.DrawUserEye(display, right_user_position)
 
-        pen = wx.Pen("green", width=3, style=wx.PENSTYLE_SOLID)
+        pen = self.GetPen("green", width=3, style=wx.PENSTYLE_SOLID)
 
         display.context.SetPen(pen)
-        display.context.SetBrush(wx.Brush("green", wx.TRANSPARENT))
+        display.context.SetBrush(self.GetBrush("green", wx.TRANSPARENT))
 
         if left_user_position.valid and right_user_position.valid:
             x = (left_user_position.x + right_user_position.x) / 2
@@ -198,8 +550,8 @@ class CalibrationFrame(wx.Frame):
             display.context.DrawCircle(x, y, radius)
 
     def DrawUserEye(self, display, user_position):
-        display.context.SetPen(wx.Pen("green", 3))
-        display.context.SetBrush(wx.Brush("green", wx.TRANSPARENT))
+        display.context.SetPen(self.GetPen("green", 3))
+        display.context.SetBrush(self.GetBrush("green", wx.TRANSPARENT))
 
         if user_position.valid:
             x = display.width * user_position.x
@@ -221,8 +573,8 @@ class CalibrationFrame(wx.Frame):
         # TODO: Purposefully draw the progress bar as the mouth?
 
         # Progress bar
-        display.context.SetPen(wx.Pen("white"))
-        display.context.SetBrush(wx.Brush("green"))
+        display.context.SetPen(self.GetPen("white"))
+        display.context.SetBrush(self.GetBrush("green"))
 
         progress_height = bar_height
         progress_width = bar_width * score
@@ -237,8 +589,8 @@ class CalibrationFrame(wx.Frame):
         )
 
         # Frame around progress bar
-        display.context.SetPen(wx.Pen("white", 3))
-        display.context.SetBrush(wx.Brush("black", style=wx.TRANSPARENT))
+        display.context.SetPen(self.GetPen("white", 3))
+        display.context.SetBrush(self.GetBrush("black", style=wx.TRANSPARENT))
 
         display.context.DrawRectangle(bar_x, bar_y, bar_width, bar_height)
 
@@ -253,12 +605,17 @@ class CalibrationFrame(wx.Frame):
         left_text = f"L: ({left.x:0.4f}) ({left.y:0.4f}) ({left.z:0.4f})"
         right_text = f"L: ({right.x:0.4f}) ({right.y:0.4f}) ({right.z:0.4f})"
 
-        text = "\n".join([score_text, left_text, right_text])
+        samples_text = f"Samples: {self.user_position_mailbox.stats_text()}"
+
+        text = "\n".join([score_text, left_text, right_text, samples_text])
 
         display.context.SetTextForeground("white")
         display.context.DrawText(text=text, x=10, y=10)
 
-    def DrawCalibrationPoints(self, dc, display_width, display_height, success_count):
+    def DrawStareInstructions(self, dc, display_width, display_height):
+        if self.stare_bitmap is None:
+            return  # Still loading
+
         stare_x = (display_width / 2) - (self.stare_bitmap.GetWidth() / 2)
         stare_y = (display_height / 2) - (self.stare_bitmap.GetHeight() / 2) - 120
 
@@ -269,56 +626,101 @@ class CalibrationFrame(wx.Frame):
             useMask=False,
         )
 
-        dc.SetBrush(wx.Brush("blue"))
+    def DrawCalibrationPoints(self, dc, display_width, display_height, progress):
+        dc.SetPen(self.GetPen("black"))
+        dc.SetBrush(self.GetBrush("blue"))
 
-        if self.current_point in self.point_mapping:
-            # Shrink the circle as successes accumulate
-            radius = CIRCLE_RADIUS * (1 - (success_count / DOT_RESULT_SUCCESSES_REQUIREMENT))
+        if self.current_point:
+            # Shrink the circle as the point gets closer to being accepted, by
+            # whatever measure the collection strategy has of that
+            radius = self.settings.circle_radius * (1 - min(max(progress, 0.0), 1.0))
 
-            self.point_mapping[self.current_point](
-                dc,
-                display_width,
-                display_height,
-                radius
-            )
+            x, y = self.current_point.screen_position(display_width, display_height)
 
-    def DrawCenterCircle(self, dc, display_width, display_height, radius):
-        x = display_width / 2
-        y = display_height / 2
+            dc.DrawCircle(x, y, radius)
 
-        dc.DrawCircle(x, y, radius)
+    def CalibrationPointRect(self, point, display_width, display_height):
+        if not point:
+            return None
 
-    def DrawUpperLeftCircle(self, dc, display_width, display_height, radius):
-        x = CIRCLE_MARGIN + CIRCLE_RADIUS
-        y = CIRCLE_MARGIN + CIRCLE_RADIUS
+        x, y = point.screen_position(display_width, display_height)
 
-        dc.DrawCircle(x, y, radius)
+        return CircleRect(x, y, self.settings.circle_radius, pen_width=1)
 
-    def DrawUpperRightCircle(self, dc, display_width, display_height, radius):
-        x = display_width - CIRCLE_MARGIN - CIRCLE_RADIUS
-        y = CIRCLE_MARGIN + CIRCLE_RADIUS
+    def UserFaceRect(self, user_position_guide, display_width, display_height):
+        """Bounding box of everything DrawUserFace draws for this guide"""
+        if not user_position_guide:
+            return None
 
-        dc.DrawCircle(x, y, radius)
+        left = user_position_guide.left_position
+        right = user_position_guide.right_position
 
-    def DrawLowerLeftCircle(self, dc, display_width, display_height, radius):
-        x = CIRCLE_MARGIN + CIRCLE_RADIUS
-        y = display_height - CIRCLE_MARGIN - CIRCLE_RADIUS
+        rect = wx.Rect()
 
-        dc.DrawCircle(x, y, radius)
+        for position in (left, right):
+            if position.valid:
+                rect = rect.Union(CircleRect(
+                    display_width * position.x,
+                    display_height * position.y,
+                    100 * (1 - position.z),
+                    pen_width=3,
+                ))
 
-    def DrawLowerRightCircle(self, dc, display_width, display_height, radius):
-        x = display_width - CIRCLE_MARGIN - CIRCLE_RADIUS
-        y = display_height - CIRCLE_MARGIN - CIRCLE_RADIUS
+        if left.valid and right.valid:
+            rect = rect.Union(CircleRect(
+                display_width * (left.x + right.x) / 2,
+                display_height * (left.y + right.y) / 2,
+                450 * (1 - (left.z + right.z) / 2),
+                pen_width=3,
+            ))
 
-        dc.DrawCircle(x, y, radius)
+        return rect
+
+    def UserFaceScoreRect(self, display_width, display_height):
+        bar_width = 100
+        bar_height = 20
+        pen_width = 3
+
+        bar_x = (display_width / 2) - (bar_width / 2)
+        bar_y = (display_height / 2) + 300
+
+        return wx.Rect(
+            int(bar_x) - pen_width,
+            int(bar_y) - pen_width,
+            bar_width + pen_width * 2,
+            bar_height + pen_width * 2,
+        )
+
+    def UserFaceDebugInfoRect(self):
+        # Generously covers the score and coordinate lines drawn at (10, 10)
+        return wx.Rect(0, 0, 500, 150)
+
+    def FrameTimeDebugInfoRect(self):
+        display_width, display_height = self.DisplaySize()
+
+        return wx.Rect(0, display_height - self.FrameTimeDebugInfoHeight(), 600, self.FrameTimeDebugInfoHeight())
+
+    def FrameTimeDebugInfoHeight(self):
+        # Room for the latency lines too when tracing
+        return 160 if self.tracer else 40
+
+    def DrawFrameTimeDebugInfo(self, dc, display_width, display_height):
+        text = f"Paint time: {self.paint_times.summary_text()}"
+
+        if self.tracer:
+            text += "\nSample latency by stage:\n" + self.tracer.overlay_text()
+
+        dc.SetTextForeground("white")
+        dc.DrawText(text=text, x=10, y=display_height - self.FrameTimeDebugInfoHeight() + 10)
 
     def DrawConfigDebugInfo(self, dc, display_width, display_height):
-        config_text = ''
+        if self.config_debug_text is None:
+            self.config_debug_text = ''
 
-        for config_name in constants_and_defaults:
-            config_text += f"{config_name} = {globals()[config_name]}\n"
+            for config_name, value in self.settings.items():
+                self.config_debug_text += f"{config_name} = {value}\n"
 
-        config_text += f"Current Mode: {self.mode}"
+        config_text = self.config_debug_text + f"Current Mode: {self.mode}"
 
         # TODO: Why is the text width so large?
         text_width, text_height = dc.GetTextExtent(config_text)
@@ -330,3 +732,14 @@ class CalibrationFrame(wx.Frame):
 
         dc.SetTextForeground("white")
         dc.DrawText(text=config_text, x=x, y=y)
+
+def CircleRect(x, y, radius, pen_width):
+    """Integer rectangle covering a circle drawn with the given pen width"""
+    reach = abs(radius) + pen_width + 1
+
+    return wx.Rect(
+        int(x - reach),
+        int(y - reach),
+        int(reach * 2) + 1,
+        int(reach * 2) + 1,
+    )
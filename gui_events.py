@@ -28,11 +28,11 @@ class CloseAppEvent(wx.PyCommandEvent):
         wx.PyCommandEvent.__init__(self, EVT_TYPE_CLOSE_APP, -1)
 
 class ShowPointEvent(CalibrationEvent):
-    def __init__(self, point, success_count=0):
+    def __init__(self, point, progress=0.0):
         CalibrationEvent.__init__(self)
         self.calibration_event_type = SHOW_POINT
         self.point = point
-        self.success_count = success_count
+        self.progress = progress
 
 class UpdateUserPositionEvent(CalibrationEvent):
     def __init__(self, user_position_guide):
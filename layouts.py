@@ -0,0 +1,163 @@
+import math
+
+from models import PointLocation
+
+# Gaze travel is measured on a widescreen display, where moving across is
+# farther than moving down by the same normalized distance
+ASPECT_RATIO = 16 / 9
+
+class CalibrationTarget:
+    """One point of a CalibrationLayout"""
+
+    def __init__(self, layout, name, position):
+        self.layout = layout
+        self.name = name
+        self.position = position  # Normalized: (0.0, 0.0) is the upper left corner, (1.0, 1.0) the lower right
+
+    def screen_position(self, display_width, display_height):
+        return self.layout.screen_positions(display_width, display_height)[self]
+
+class CalibrationLayout:
+    """
+    The points to calibrate at, in the order to show them: starting from the
+    one nearest the centre (where the user has just been looking), then along
+    the shortest gaze path found through the rest.
+
+    Pixel positions are worked out once per display size, and shared by
+    everything drawing the points.
+    """
+
+    def __init__(self, name, named_positions):
+        self.name = name
+
+        targets = [CalibrationTarget(self, point_name, position) for point_name, position in named_positions]
+        self.targets = tuple(schedule(targets))
+
+        self.positions_by_size = {}  # (width, height) -> {target: (x, y) in pixels}
+
+    def __iter__(self):
+        return iter(self.targets)
+
+    def __len__(self):
+        return len(self.targets)
+
+    def screen_positions(self, display_width, display_height):
+        size = (display_width, display_height)
+        positions = self.positions_by_size.get(size)
+
+        if positions is None:
+            positions = {
+                target: (round(target.position[0] * display_width), round(target.position[1] * display_height))
+                for target in self.targets
+            }
+            self.positions_by_size[size] = positions
+
+        return positions
+
+    def gaze_travel(self):
+        """Distance the eyes move from point to point, in screen heights"""
+        return path_length([target.position for target in self.targets])
+
+def gaze_distance(a, b):
+    return math.hypot((a[0] - b[0]) * ASPECT_RATIO, a[1] - b[1])
+
+def path_length(positions):
+    return sum(gaze_distance(a, b) for a, b in zip(positions, positions[1:]))
+
+def schedule(targets):
+    """
+    Orders targets to keep gaze travel short: nearest neighbour from the one
+    nearest the centre, then 2-opt (reversing stretches of the path while
+    that shortens it). Layouts are small, so this is near optimal and cheap.
+    """
+    if len(targets) < 3:
+        return targets
+
+    remaining = list(targets)
+    path = [min(remaining, key=lambda target: gaze_distance(target.position, (0.5, 0.5)))]
+    remaining.remove(path[0])
+
+    while remaining:
+        nearest = min(remaining, key=lambda target: gaze_distance(target.position, path[-1].position))
+        path.append(nearest)
+        remaining.remove(nearest)
+
+    def distance(i, j):
+        return gaze_distance(path[i].position, path[j].position)
+
+    improved = True
+
+    while improved:
+        improved = False
+
+        # The first point stays first, and the path is open at the end
+        for i in range(1, len(path) - 1):
+            for j in range(i + 1, len(path)):
+                before = distance(i - 1, i) + (distance(j, j + 1) if j + 1 < len(path) else 0)
+                after = distance(i - 1, j) + (distance(i, j + 1) if j + 1 < len(path) else 0)
+
+                if after < before - 1e-9:
+                    path[i:j + 1] = reversed(path[i:j + 1])
+                    improved = True
+
+    return path
+
+def grid_positions(margin):
+    """The nine points of a 3x3 grid, margin in from the edges"""
+    rows = [('UPPER', margin), ('MIDDLE', 0.5), ('LOWER', 1 - margin)]
+    columns = [('LEFT', margin), ('CENTER', 0.5), ('RIGHT', 1 - margin)]
+
+    return [
+        ('CENTER' if (row, column) == ('MIDDLE', 'CENTER') else f"{row}_{column}", (x, y))
+        for row, y in rows
+        for column, x in columns
+    ]
+
+def five_point_positions(margin):
+    """The centre and the corners of the grid (PointLocation)"""
+    return [(name, position) for name, position in grid_positions(margin) if name in PointLocation.__members__]
+
+def thirteen_point_positions(margin):
+    """The 3x3 grid, plus the centre of each quadrant between its points"""
+    inner_low = (margin + 0.5) / 2
+    inner_high = 1 - inner_low
+
+    return grid_positions(margin) + [
+        ('INNER_UPPER_LEFT', (inner_low, inner_low)),
+        ('INNER_UPPER_RIGHT', (inner_high, inner_low)),
+        ('INNER_LOWER_LEFT', (inner_low, inner_high)),
+        ('INNER_LOWER_RIGHT', (inner_high, inner_high)),
+    ]
+
+def parse_points(text):
+    """Custom points as in config.ini: "x,y; x,y; ...", normalized"""
+    positions = []
+
+    for index, point in enumerate(point for point in text.split(';') if point.strip()):
+        x, y = (float(coordinate) for coordinate in point.split(','))
+
+        if not (0 <= x <= 1 and 0 <= y <= 1):
+            raise ValueError(f"Calibration point {point.strip()} is off the display area")
+
+        positions.append((f"POINT_{index + 1}", (x, y)))
+
+    if not positions:
+        raise ValueError("No calibration points given")
+
+    return positions
+
+# Values of calibration_layout in config.ini, other than "custom"
+layout_positions = {
+    '5': five_point_positions,
+    '9': grid_positions,
+    '13': thirteen_point_positions,
+}
+
+def build_layout(name, margin, custom_points=''):
+    if name == 'custom':
+        return CalibrationLayout(name, parse_points(custom_points))
+
+    if name not in layout_positions:
+        raise ValueError(f"Unknown calibration layout: {name}")
+
+    return CalibrationLayout(name, layout_positions[name](margin))
@@ -1,45 +1,160 @@
+import json
 import math
-from random import randint
+from random import Random
 import threading
-import time
 
+from clocks import RealClock, VirtualClock
+from layouts import ASPECT_RATIO
 from models import UserPosition
 
 EYETRACKER_USER_POSITION_GUIDE = "eyetracker_user_position_guide"
+EYETRACKER_GAZE_DATA = "eyetracker_gaze_data"
 CALIBRATION_STATUS_SUCCESS = "calibration_status_success"
+CALIBRATION_STATUS_FAILURE = "calibration_status_failure"
+
+VALIDITY_INVALID_AND_NOT_USED = "validity_invalid_and_not_used"
+VALIDITY_VALID_BUT_NOT_USED = "validity_valid_but_not_used"
+VALIDITY_VALID_AND_USED = "validity_valid_and_used"
+
+USER_POSITION_GUIDE_INTERVAL = 0.02  # Seconds between simulated samples
+
+CALIBRATION_SAMPLES_PER_COLLECTION = 5  # Gaze samples kept by each successful collect_data
+CALIBRATION_SAMPLE_VALIDITY = 0.95  # Chance of each eye's sample being used, at a point that is not weak
+
+APPLY_CALIBRATION_DATA_TIME = 0.2  # Seconds apply_calibration_data takes
+
+GAZE_DATA_BURST_INTERVAL = 0.01  # Seconds between bursts of simulated gaze samples
+GAZE_NOISE = 0.004  # Standard deviation of each eye's gaze point, per axis, in screen heights
+GAZE_SAMPLE_VALIDITY = 0.95  # Chance of each eye's gaze point being valid
+UNCALIBRATED_GAZE_ERROR = 0.1  # How far off the gaze is, in screen heights, before any calibration
+
+class HeadDrift:
+    """How a simulated head moves between user position guide samples"""
+
+    def __init__(self, start_offset=(0, 0, 0), step_scale=1, pull=0):
+        self.start_offset = start_offset  # Initial (x, y, z) offset from the ideal position
+        self.step_scale = step_scale  # Multiplies the random step of 1/500 per axis
+        self.pull = pull  # Fraction of the distance to the ideal position recovered each sample
+
+head_drift_profiles = {
+    # Wanders freely, starting in position (the original mock behaviour).
+    # Unbounded, so now and then it never settles within the score requirement
+    'random_walk': HeadDrift(),
+    # Wanders like random_walk, but drifts back towards the ideal position
+    'wandering': HeadDrift(pull=0.01),
+    # Sits down off to the side and too far back, then settles in
+    'settling': HeadDrift(start_offset=(0.05, -0.04, 0.05), pull=0.02),
+    # Keeps fidgeting around the ideal position
+    'restless': HeadDrift(step_scale=2, pull=0.1),
+}
+
+class MockSettings:
+    """How find_all_eyetrackers() builds its mock devices. Change with configure()"""
+
+    def __init__(self, seed=None, virtual_time=False, success_rate=0.75, head_drift='random_walk', tracker_count=1,
+                 weak_points=(), weak_success_rate=0.2, gaze_frequency=600, gaze_error=0.01, position_noise=0.0):
+        self.seed = seed
+        self.virtual_time = virtual_time
+        self.success_rate = success_rate
+        self.head_drift = head_drift
+        self.tracker_count = tracker_count
+        self.weak_points = weak_points
+        self.weak_success_rate = weak_success_rate
+        self.gaze_frequency = gaze_frequency
+        self.gaze_error = gaze_error
+        self.position_noise = position_noise
+
+settings = MockSettings()
+
+def configure(seed=None, virtual_time=False, success_rate=0.75, head_drift='random_walk', tracker_count=1,
+              weak_points=(), weak_success_rate=0.2, gaze_frequency=600, gaze_error=0.01, position_noise=0.0):
+    """
+    seed makes head movement and collect_data outcomes reproducible.
+
+    virtual_time gives each device a VirtualClock: samples, sleeps and
+    compute_and_apply take no wall time, and a seeded session has the same
+    outcome and the same simulated durations every run.
+
+    success_rate is the chance of each collect_data succeeding, and
+    head_drift names one of head_drift_profiles, and position_noise is the
+    standard deviation of the sensor noise on each reported eye position
+    coordinate (the head itself moves smoothly).
+
+    tracker_count is how many independent devices are discovered.
+
+    weak_points are (x, y) calibration points where collect_data only
+    succeeds with weak_success_rate, and where few gaze samples are usable,
+    as if the user could not see them well. Once a compute_and_apply has
+    shown them up, they behave like every other point.
+
+    gaze_frequency is the rate of the gaze data stream (real trackers run at
+    60 to 1200 Hz). gaze_error is how far off, in screen heights, the gaze
+    is near a calibration point where every sample was used. The fewer were,
+    the farther off it is.
+    """
+    settings.seed = seed
+    settings.virtual_time = virtual_time
+    settings.success_rate = success_rate
+    settings.head_drift = head_drift
+    settings.tracker_count = tracker_count
+    settings.weak_points = weak_points
+    settings.weak_success_rate = weak_success_rate
+    settings.gaze_frequency = gaze_frequency
+    settings.gaze_error = gaze_error
+    settings.position_noise = position_noise
 
 class MockUserPositionThread(threading.Thread):
-    def __init__(self, callback):
+    def __init__(self, callback, random, clock, head_drift=head_drift_profiles['random_walk'], position_noise=0.0):
         self.callback = callback
+        self.random = random
+        self.clock = clock
+        self.head_drift = head_drift
+        self.position_noise = position_noise
         self.keep_running = True
 
+        x_offset, y_offset, z_offset = head_drift.start_offset
+
+        self.left_position = UserPosition(x=0.44 + x_offset, y=0.5 + y_offset, z=0.5 + z_offset, valid=True)
+        self.right_position = UserPosition(x=0.56 + x_offset, y=0.5 + y_offset, z=0.5 + z_offset, valid=True)
+
         threading.Thread.__init__(self)
 
     def run(self):
-        left_position = UserPosition(x=0.44, y=0.5, z=0.5, valid=True)
-        right_position = UserPosition(x=0.56, y=0.5, z=0.5, valid=True)
-
         for _ in range(100_000_000):
             if not self.keep_running:
                 return
 
-            left_position, right_position = \
-                self.apply_random_head_step(left_position, right_position)
+            self.step()
+            self.clock.sleep(USER_POSITION_GUIDE_INTERVAL)
+
+    def step(self):
+        left_position, right_position = \
+            self.apply_random_head_step(self.left_position, self.right_position)
+
+        mock_guide_dict = {
+            'left_user_position_validity': 1,
+            'left_user_position': self.measure(left_position),
+            'right_user_position_validity': 1,
+            'right_user_position': self.measure(right_position),
+        }
 
-            mock_guide_dict = {
-                'left_user_position_validity': 1,
-                'left_user_position': (left_position.x, left_position.y, left_position.z),
-                'right_user_position_validity': 1,
-               'right_user_position': (right_position.x, right_position.y, right_position.z),
-            }
+        self.callback(mock_guide_dict)
 
-            self.callback(mock_guide_dict)
-            time.sleep(0.02)
+    def measure(self, position):
+        """The position as the sensor reports it"""
+        if not self.position_noise:
+            return (position.x, position.y, position.z)  # Leaves the random stream as it always was
+
+        return tuple(coordinate + self.random.gauss(0, self.position_noise) for coordinate in (position.x, position.y, position.z))
 
     def apply_random_head_step(self, left_position, right_position):
-        x_adjust = randint(-1, 1) / 500
-        y_adjust = randint(-1, 1) / 500
-        z_adjust = randint(-1, 1) / 500
+        step = self.head_drift.step_scale / 500
+        pull = self.head_drift.pull
+
+        # The ideal head position centres the eyes at 0.44/0.56, 0.5, 0.5
+        x_adjust = self.random.randint(-1, 1) * step + pull * (0.44 - left_position.x)
+        y_adjust = self.random.randint(-1, 1) * step + pull * (0.5 - left_position.y)
+        z_adjust = self.random.randint(-1, 1) * step + pull * (0.5 - left_position.z)
 
         left_position.x += x_adjust
         left_position.y += y_adjust
@@ -51,45 +166,258 @@ class MockUserPositionThread(threading.Thread):
 
         return (left_position, right_position)
 
+class MockGazeThread(threading.Thread):
+    """Gaze data at the eyetracker's gaze_frequency, in bursts, at wherever the simulated user looks"""
+
+    def __init__(self, callback, eyetracker):
+        self.callback = callback
+        self.eyetracker = eyetracker
+        self.keep_running = True
+        self.samples_sent = 0
+
+        threading.Thread.__init__(self)
+
+    def run(self):
+        while self.keep_running:
+            self.step()
+            self.eyetracker.clock.sleep(GAZE_DATA_BURST_INTERVAL)
+
+    def step(self):
+        eyetracker = self.eyetracker
+        random = eyetracker.gaze_random
+
+        now = eyetracker.clock.monotonic()
+        target_x, target_y = eyetracker.gaze_target
+        offset_x, offset_y = eyetracker.gaze_offset(eyetracker.gaze_target)
+
+        # However many samples are due by now, as the stream would have sent them
+        due = int(now * eyetracker.gaze_frequency)
+        count = due - self.samples_sent if self.samples_sent else round(GAZE_DATA_BURST_INTERVAL * eyetracker.gaze_frequency)
+        self.samples_sent = due
+
+        def gaze_point():
+            valid = random.random() < GAZE_SAMPLE_VALIDITY
+
+            x = target_x + offset_x + random.gauss(0, GAZE_NOISE) / ASPECT_RATIO
+            y = target_y + offset_y + random.gauss(0, GAZE_NOISE)
+
+            return (x, y) if valid else (math.nan, math.nan), int(valid)
+
+        for index in range(count):
+            (left_point, left_validity), (right_point, right_validity) = gaze_point(), gaze_point()
+            time_stamp = int((now - (count - 1 - index) / eyetracker.gaze_frequency) * 1_000_000)
+
+            self.callback({
+                'device_time_stamp': time_stamp,
+                'system_time_stamp': time_stamp,
+                'left_gaze_point_on_display_area': left_point,
+                'left_gaze_point_validity': left_validity,
+                'right_gaze_point_on_display_area': right_point,
+                'right_gaze_point_validity': right_validity,
+            })
+
 class MockEyeTracker:
     """
     Drop-in replacement for tobii_research.EyeTracker
     """
-    def __init__(self):
-        self.serial_number = "MOCK SERIAL NUMBER"
+    def __init__(self, seed=None, virtual_time=False, success_rate=0.75, head_drift='random_walk', index=0,
+                 weak_points=(), weak_success_rate=0.2, gaze_frequency=600, gaze_error=0.01, position_noise=0.0):
+        self.serial_number = "MOCK SERIAL NUMBER" if index == 0 else f"MOCK SERIAL NUMBER {index}"
+        self.success_rate = success_rate
+        self.weak_points = [tuple(point) for point in weak_points]
+        self.weak_success_rate = weak_success_rate
+        self.recovered_points = set()  # Weak points the user has since been told to look at properly
+        self.head_drift = head_drift_profiles[head_drift]
+        self.gaze_frequency = gaze_frequency
+        self.gaze_error = gaze_error
+        self.position_noise = position_noise
+
+        # TobiiEyeTracker picks this up, so its own sleeps and waits run on
+        # the same (possibly virtual) time as the simulated device
+        self.clock = VirtualClock() if virtual_time else RealClock()
+
+        # Separate streams, so head movement and collect_data outcomes stay
+        # reproducible even when they are consumed from different threads
+        if seed is not None and index > 0:
+            seed = f"{seed}-{index}"  # Every device gets its own reproducible streams
+
+        self.head_random = Random(f"{seed}-head") if seed is not None else Random()
+        self.calibration_random = Random(f"{seed}-calibration") if seed is not None else Random()
+        self.gaze_random = Random(f"{seed}-gaze") if seed is not None else Random()
+
+        self.subscriptions = {}  # Stream -> (worker, virtual timer or None)
+
+        self.calibration_data = None  # What the last compute_and_apply (or apply_calibration_data) left applied
+        self.calibration_quality = {}  # Calibrated (x, y) -> (fraction of samples used, direction of its gaze error)
+        self.gaze_target = (0.5, 0.5)  # Where the simulated user is looking
+        self.in_calibration_mode = False
+
+    def look_at(self, position):
+        """Not in tobii_research: TobiiEyeTracker calls it to tell the simulated user what is on screen"""
+        self.gaze_target = position
+
+    def gaze_offset(self, position):
+        """How far off the gaze is, looking at a normalized position"""
+        if not self.calibration_quality:
+            return UNCALIBRATED_GAZE_ERROR / ASPECT_RATIO, UNCALIBRATED_GAZE_ERROR
+
+        # Only as good as the nearest calibration point
+        nearest = min(self.calibration_quality, key=lambda point: math.hypot(point[0] - position[0], point[1] - position[1]))
+        quality, direction = self.calibration_quality[nearest]
+
+        error = min(self.gaze_error / max(quality, 0.01), UNCALIBRATED_GAZE_ERROR)
+
+        return error * math.cos(direction) / ASPECT_RATIO, error * math.sin(direction)
+
+    def set_calibration_quality(self, qualities):
+        self.calibration_quality = {
+            tuple(point): (quality, self.gaze_random.uniform(0, 2 * math.pi))
+            for point, quality in qualities
+        }
+
+    def retrieve_calibration_data(self):
+        return self.calibration_data
+
+    def apply_calibration_data(self, calibration_data):
+        points = json.loads(calibration_data.decode('utf-8'))['points']  # Malformed data raises, as on a device
+
+        self.clock.sleep(APPLY_CALIBRATION_DATA_TIME)
+
+        self.calibration_data = calibration_data
+        self.recovered_points.update((x, y) for x, y, _ in points)
+        self.set_calibration_quality(((x, y), quality) for x, y, quality in points)
+
+    def subscribe_to(self, stream, callback, as_dictionary=True):
+        if stream == EYETRACKER_GAZE_DATA:
+            worker = MockGazeThread(callback, self)
+            interval = GAZE_DATA_BURST_INTERVAL
+        else:
+            worker = MockUserPositionThread(callback, self.head_random, self.clock, self.head_drift, self.position_noise)
+            interval = USER_POSITION_GUIDE_INTERVAL
+
+        timer = None
+
+        if isinstance(self.clock, VirtualClock):
+            # Samples are produced on demand as the consumer's clock advances
+            timer = self.clock.call_every(interval, worker.step)
+        else:
+            worker.start()
 
-    def subscribe_to(self, guide, callback, as_dictionary=True):
-        self.worker = MockUserPositionThread(callback)
-        self.worker.start()
+        self.subscriptions[stream] = (worker, timer)
 
-    def unsubscribe_from(self, guide, callback):
-        self.worker.keep_running = False
+    def unsubscribe_from(self, stream, callback):
+        worker, timer = self.subscriptions.pop(stream)
+        worker.keep_running = False
+
+        if timer:
+            timer.cancel()
+
+class MockCalibrationEyeData:
+    def __init__(self, position_on_display_area, validity):
+        self.position_on_display_area = position_on_display_area
+        self.validity = validity
+
+class MockCalibrationSample:
+    def __init__(self, left_eye, right_eye):
+        self.left_eye = left_eye
+        self.right_eye = right_eye
+
+class MockCalibrationPoint:
+    def __init__(self, position_on_display_area, calibration_samples):
+        self.position_on_display_area = position_on_display_area
+        self.calibration_samples = calibration_samples
 
 class MockCalibrationResult:
-    def __init__(self):
-        self.status = "calibration_status_success"
-        self.calibration_points = ((0.5, 0.5),)
+    def __init__(self, status, calibration_points):
+        self.status = status
+        self.calibration_points = calibration_points
 
 class ScreenBasedCalibration:
     def __init__(self, eyetracker):
-        pass
+        self.eyetracker = eyetracker
+        self.collected_samples = {}  # (x, y) -> samples collected there, in order
 
     def enter_calibration_mode(self):
-        pass
+        self.collected_samples = {}
+        self.eyetracker.in_calibration_mode = True
 
     def leave_calibration_mode(self):
-        pass
+        self.eyetracker.in_calibration_mode = False
+
+    def is_weak(self, point):
+        return point in self.eyetracker.weak_points and point not in self.eyetracker.recovered_points
 
     def collect_data(self, x, y):
-        # Succeeds more often than not
-        if randint(0, 3) == 0:
-            return "calibration_status_failure"
-        else:
-            return "calibration_status_success"
+        eyetracker = self.eyetracker
+        weak = self.is_weak((x, y))
+
+        # Succeeds more often than not (by default), except at weak points
+        success_rate = eyetracker.weak_success_rate if weak else eyetracker.success_rate
+
+        if eyetracker.calibration_random.random() >= success_rate:
+            return CALIBRATION_STATUS_FAILURE
+
+        sample_validity = eyetracker.weak_success_rate if weak else CALIBRATION_SAMPLE_VALIDITY
+
+        def eye_data():
+            used = eyetracker.calibration_random.random() < sample_validity
+            return MockCalibrationEyeData((x, y), VALIDITY_VALID_AND_USED if used else VALIDITY_INVALID_AND_NOT_USED)
+
+        samples = self.collected_samples.setdefault((x, y), [])
+
+        for _ in range(CALIBRATION_SAMPLES_PER_COLLECTION):
+            samples.append(MockCalibrationSample(left_eye=eye_data(), right_eye=eye_data()))
+
+        return CALIBRATION_STATUS_SUCCESS
+
+    def discard_data(self, x, y):
+        self.collected_samples.pop((x, y), None)
 
     def compute_and_apply(self):
-        time.sleep(1)  # Simulate finalization of calibration
-        return MockCalibrationResult()
+        self.eyetracker.clock.sleep(1)  # Simulate finalization of calibration
+
+        calibration_points = tuple(
+            MockCalibrationPoint(point, tuple(samples))
+            for point, samples in self.collected_samples.items()
+        )
+
+        # The result shows up the weak points, so the user looks at them properly from now on
+        self.eyetracker.recovered_points.update(self.eyetracker.weak_points)
+
+        status = CALIBRATION_STATUS_SUCCESS if calibration_points else CALIBRATION_STATUS_FAILURE
+
+        if calibration_points:
+            # Gaze is as accurate near each point as the share of its samples both eyes were used from
+            qualities = [
+                ((x, y), sum(
+                    1 for sample in samples
+                    if sample.left_eye.validity == VALIDITY_VALID_AND_USED and sample.right_eye.validity == VALIDITY_VALID_AND_USED
+                ) / len(samples))
+                for (x, y), samples in self.collected_samples.items()
+            ]
+            self.eyetracker.set_calibration_quality(qualities)
+
+            # Opaque bytes to callers, like a real device's calibration data
+            self.eyetracker.calibration_data = json.dumps({
+                'serial_number': self.eyetracker.serial_number,
+                'points': [[x, y, quality] for (x, y), quality in qualities],
+            }).encode('utf-8')
+
+        return MockCalibrationResult(status, calibration_points)
 
 def find_all_eyetrackers():
-    return [MockEyeTracker()]
+    return [
+        MockEyeTracker(
+            seed=settings.seed,
+            virtual_time=settings.virtual_time,
+            success_rate=settings.success_rate,
+            head_drift=settings.head_drift,
+            index=index,
+            weak_points=settings.weak_points,
+            weak_success_rate=settings.weak_success_rate,
+            gaze_frequency=settings.gaze_frequency,
+            gaze_error=settings.gaze_error,
+            position_noise=settings.position_noise,
+        )
+        for index in range(settings.tracker_count)
+    ]
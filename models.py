@@ -1,3 +1,4 @@
+import math
 from enum import Enum, auto
 
 class Display:
@@ -7,18 +8,62 @@ class Display:
         self.height = height
 
 class UserPosition:
+    # Slotted, as one is refilled for every sample while positioning the user
+    __slots__ = ('x', 'y', 'z', 'valid', 'vx', 'vy', 'vz')
+
     def __init__(self, x, y, z, valid):
         self.x = x
         self.y = y
         self.z = z
         self.valid = valid
 
+        # Per second, as estimated by a filters.HeadFilter (0 when unfiltered)
+        self.vx = 0.0
+        self.vy = 0.0
+        self.vz = 0.0
+
+    def predicted(self, seconds):
+        """Where this position will be after seconds, at its current velocity"""
+        position = UserPosition(
+            x=self.x + self.vx * seconds,
+            y=self.y + self.vy * seconds,
+            z=self.z + self.vz * seconds,
+            valid=self.valid,
+        )
+
+        position.vx, position.vy, position.vz = self.vx, self.vy, self.vz
+
+        return position
+
+    def load(self, xyz, valid):
+        """Refills this position from a sample, in place"""
+        self.x, self.y, self.z = xyz
+        self.valid = valid
+        self.vx = self.vy = self.vz = 0.0
+
+    def copy_from(self, position):
+        self.x, self.y, self.z = position.x, position.y, position.z
+        self.valid = position.valid
+        self.vx, self.vy, self.vz = position.vx, position.vy, position.vz
+
 class UserPositionGuide:
+    __slots__ = ('left_position', 'right_position', 'score', 'time', 'trace')
+
     def __init__(self, left_position=None, right_position=None):
         self.left_position = left_position
         self.right_position = right_position
 
         self.score = 0
+        self.time = None  # On the tracker's clock, when the sample arrived
+        self.trace = None  # Stamps from a tracing.LatencyTracer, when tracing
+
+    def predicted(self, seconds):
+        """This guide as it will be after seconds, for drawing ahead of pipeline latency"""
+        guide = UserPositionGuide(self.left_position.predicted(seconds), self.right_position.predicted(seconds))
+        guide.score = self.score
+        guide.time = self.time + seconds
+
+        return guide
 
     def to_dict(self):
         guide_dict = {}
@@ -59,34 +104,159 @@ class UserPositionGuide:
 
         return guide_dict
 
+    def load(self, guide_dict):
+        """Refills this guide from an SDK guide dictionary, in place. Returns the guide"""
+        self.left_position.load(guide_dict['left_user_position'], guide_dict['left_user_position_validity'] == 1)
+        self.right_position.load(guide_dict['right_user_position'], guide_dict['right_user_position_validity'] == 1)
+
+        self.score = 0
+        self.time = None
+
+        return self
+
+    def copy_from(self, guide):
+        """Makes this guide a copy of another, in place (with a trace of its own). Returns the guide"""
+        self.left_position.copy_from(guide.left_position)
+        self.right_position.copy_from(guide.right_position)
+
+        self.score = guide.score
+        self.time = guide.time
+
+        if guide.trace is None:
+            self.trace = None
+        elif self.trace is None:
+            self.trace = list(guide.trace)
+        else:
+            self.trace[:] = guide.trace
+
+        return self
+
+    @staticmethod
+    def empty():
+        return UserPositionGuide(UserPosition(0.0, 0.0, 0.0, False), UserPosition(0.0, 0.0, 0.0, False))
+
     @staticmethod
     def from_dict(guide_dict):
-        left_guide = guide_dict['left_user_position']
-        left_valid = guide_dict['left_user_position_validity'] == 1
-
-        left_user_position = UserPosition(
-            x=left_guide[0],
-            y=left_guide[1],
-            z=left_guide[2],
-            valid=left_valid,
-        )
+        return UserPositionGuide.empty().load(guide_dict)
+
+class UserPositionGuideRing:
+    """
+    Preallocated guides for the tracking hot path, refilled in turn from each
+    sample instead of building new objects, so steady-state tracking
+    allocates nothing per sample.
+
+    A guide is overwritten size samples after it was handed out, which at a
+    tracker's 600-1200 Hz is only about one frame. Consumers that keep a
+    guide (the GUI keeps the last one drawn) have to copy it out with
+    UserPositionGuide.copy_from as soon as they receive it.
+    """
+
+    def __init__(self, size=16):
+        self.guides = [UserPositionGuide.empty() for _ in range(size)]
+        self.next_index = 0
+
+    def load(self, guide_dict):
+        guide = self.guides[self.next_index]
+        self.next_index = (self.next_index + 1) % len(self.guides)
+
+        return guide.load(guide_dict)
+
+class CalibrationReport:
+    """Where the time went in one calibration session (seconds, on the tracker's clock)"""
+
+    def __init__(self):
+        self.time_to_position = None
+        self.points = []  # One dict per calibration point, in the order they were shown
+        self.compute_and_apply_time = None  # Summed over every compute_and_apply
+        self.recalibration_rounds = 0  # Rounds of re-collecting weak points after the first compute_and_apply
+        self.weak_points = []  # Points still weak after the last compute_and_apply
+        self.validation = []  # One dict per validation target shown, in order
+        self.validation_failures = []  # Validation targets that failed in the last round
+        self.reused_cached_calibration = False  # Cached calibration data was applied instead of calibrating
+        self.cancelled = False  # Stopped early by TobiiEyeTracker.cancellation
+        self.total_time = None
+
+    def add_point(self, point, attempts, successes, duration, outcome='accepted', recalibration_round=0):
+        self.points.append({
+            'point': point,
+            'attempts': attempts,
+            'successes': successes,
+            'duration': duration,
+            'outcome': outcome,  # 'accepted', or 'gave_up' when the point ran out of failure budget
+            'recalibration_round': recalibration_round,  # 0 for the first pass over the points
+        })
+
+    def add_validation_point(self, point, samples, accuracy, precision, passed, duration, validation_round=0):
+        self.validation.append({
+            'point': point,
+            'samples': samples,
+            'accuracy': accuracy,  # Distance of the mean gaze from the point, in screen heights
+            'precision': precision,  # RMS distance between successive samples, in screen heights
+            'passed': passed,
+            'duration': duration,
+            'validation_round': validation_round,
+        })
 
-        right_guide = guide_dict['right_user_position']
-        right_valid = guide_dict['right_user_position_validity'] == 1
+    def validation_text(self):
+        if not self.validation:
+            return ""
 
-        right_user_position = UserPosition(
-            x=right_guide[0],
-            y=right_guide[1],
-            z=right_guide[2],
-            valid=right_valid,
+        if self.validation_failures:
+            return f", {len(self.validation_failures)} failed validation"
+
+        last_round = [target for target in self.validation if target['validation_round'] == self.validation[-1]['validation_round']]
+        accuracies = [target['accuracy'] for target in last_round if target['accuracy'] is not None]
+
+        if not accuracies:
+            return ""
+
+        return f", validated to {max(accuracies):0.3f}"
+
+    def summary_text(self):
+        if self.cancelled:
+            return "cancelled"
+
+        if self.total_time is None:
+            return "did not finish"
+
+        if self.reused_cached_calibration:
+            position = "" if self.time_to_position is None else f"position {self.time_to_position:0.2f} s, "
+
+            return f"total {self.total_time:0.2f} s ({position}reused cached calibration{self.validation_text()})"
+
+        attempts = sum(point['attempts'] for point in self.points)
+        given_up = sum(1 for point in self.points if point['outcome'] == 'gave_up')
+        recollected = sum(1 for point in self.points if point['recalibration_round'] > 0)
+
+        return (
+            f"total {self.total_time:0.2f} s "
+            f"(position {self.time_to_position:0.2f} s, "
+            f"{len(self.points) - recollected} points in {attempts} attempts"
+            + (f", {given_up} given up" if given_up else "")
+            + (f", {recollected} recollected in {self.recalibration_rounds} rounds" if recollected else "")
+            + (f", {len(self.weak_points)} still weak" if self.weak_points else "")
+            + self.validation_text()
+            + f", compute {self.compute_and_apply_time:0.2f} s)"
         )
 
-        return UserPositionGuide(left_user_position, right_user_position)
+    def to_dict(self):
+        return {
+            'time_to_position': self.time_to_position,
+            'points': self.points,
+            'compute_and_apply_time': self.compute_and_apply_time,
+            'recalibration_rounds': self.recalibration_rounds,
+            'weak_points': self.weak_points,
+            'validation': self.validation,
+            'validation_failures': self.validation_failures,
+            'reused_cached_calibration': self.reused_cached_calibration,
+            'cancelled': self.cancelled,
+            'total_time': self.total_time,
+        }
 
 class PointLocation(Enum):
     CENTER = (0.5, 0.5)
     UPPER_LEFT = (0.1, 0.1)
-    UPPER_RIGHT = (0.1, 0.9)
-    LOWER_LEFT = (0.9, 0.1)
-    LOWER_RIGHT =(0.9, 0.9)
+    UPPER_RIGHT = (0.9, 0.1)
+    LOWER_LEFT = (0.1, 0.9)
+    LOWER_RIGHT = (0.9, 0.9)
 
@@ -0,0 +1,154 @@
+import json
+import threading
+import time
+
+from sinks import CalibrationSink
+
+class ProgressReporter:
+    """
+    Machine-readable progress for host applications, as newline-delimited JSON.
+
+    Events are batched and written by a background thread at most once per
+    interval, so a slow reader never holds up calibration. Discrete events
+    (phases, new points, results) are all delivered in order; updates
+    (scores, successes at the current point) are coalesced so that only the
+    latest of each kind per tracker goes out in each batch.
+    """
+
+    def __init__(self, stream, interval=0.1, on_disconnect=None):
+        self.stream = stream
+        self.interval = interval
+        self.on_disconnect = on_disconnect  # Called (on the reporter's thread) once the reader has gone away
+
+        self.lock = threading.Lock()
+        self.pending = []  # Ordered events not yet written
+        self.latest_updates = {}  # (tracker, event) -> newest unwritten update
+        self.polls = []  # Called before each flush
+        self.disconnected = False  # Set once the reader has gone away
+
+        self.closed = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def event(self, event, **fields):
+        return dict(event=event, time=time.time(), **fields)
+
+    def emit(self, event, tracker=None, **fields):
+        self.run_polls()  # Their latest values came in before this event too
+
+        with self.lock:
+            # Updates that came in before this event have to go out before it
+            for key in [key for key in self.latest_updates if key[0] == tracker]:
+                self.pending.append(self.latest_updates.pop(key))
+
+            self.pending.append(self.event(event, tracker=tracker, **fields))
+
+    def update(self, event, tracker=None, **fields):
+        with self.lock:
+            self.latest_updates[(tracker, event)] = self.event(event, tracker=tracker, **fields)
+
+    def poll(self, callback):
+        """
+        Has callback run before every flush, for sources too frequent to build
+        an update for each change (it can call update() with the latest one)
+        """
+        self.polls.append(callback)
+
+    def run(self):
+        while not self.closed.wait(self.interval):
+            self.flush()
+
+    def run_polls(self):
+        for callback in self.polls:
+            callback()
+
+    def flush(self):
+        self.run_polls()
+
+        with self.lock:
+            events = self.pending + list(self.latest_updates.values())
+
+            self.pending = []
+            self.latest_updates = {}
+
+        if not events or self.disconnected:
+            return
+
+        # A host that stops reading must not stop the calibration
+        try:
+            self.stream.write("".join(json.dumps(event) + "\n" for event in events))
+            self.stream.flush()
+        except OSError:
+            self.disconnected = True
+
+            if self.on_disconnect:
+                self.on_disconnect()
+
+    def close(self):
+        self.closed.set()
+        self.thread.join()
+        self.flush()
+
+class ProgressSink(CalibrationSink):
+    """Turns one tracker's progress into ProgressReporter events"""
+
+    def __init__(self, reporter, tracker):
+        self.reporter = reporter
+        self.tracker = tracker  # Identifies the tracker in every event (its serial number)
+        self.phase = None
+        self.points = []  # Points in the order they were first shown
+
+        # Scores arrive with every sample, so only the latest is kept, and
+        # turned into an update when the reporter flushes
+        self.score = None
+        self.reported_score = None
+        reporter.poll(self.report_score)
+
+    def enter_phase(self, phase):
+        if phase != self.phase:
+            self.phase = phase
+            self.reporter.emit('phase', tracker=self.tracker, phase=phase)
+
+    def update_user_position(self, guide):
+        self.enter_phase('positioning')
+        self.score = guide.score
+
+    def report_score(self):
+        score = self.score
+
+        # Compared by identity, as each sample's score is a new object
+        if score is None or score is self.reported_score:
+            return
+
+        self.reported_score = score
+        self.reporter.update('score', tracker=self.tracker, score=round(score, 4))
+
+    def show_point(self, point, success_count=0, progress=0.0):
+        self.enter_phase('calibrating')
+
+        # Showing a new point is an event. Progress at the same point is an update
+        if point in self.points:
+            send = self.reporter.update
+        else:
+            send = self.reporter.emit
+            self.points.append(point)
+
+        send(
+            'point',
+            tracker=self.tracker,
+            index=self.points.index(point),
+            name=point.name,
+            point=list(point.position),
+            successes=success_count,
+            progress=round(progress, 3),
+        )
+
+    def show_validation_point(self, point):
+        self.enter_phase('validating')
+        self.reporter.emit('validation_point', tracker=self.tracker, name=point.name, point=list(point.position))
+
+    def finalizing_calibration(self):
+        self.enter_phase('finalizing')
+
+    def calibration_concluded(self):
+        self.enter_phase('concluded')
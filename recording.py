@@ -0,0 +1,207 @@
+import json
+import os.path
+import threading
+
+import numpy as np
+
+# Columns of each recorded stream: name -> (dtype, values per row or None for scalars)
+streams = {
+    'user_position': {
+        'time': ('f8', None),
+        'left': ('f8', 3),
+        'right': ('f8', 3),
+        'validity': ('u1', 2),  # Left, right
+    },
+    'collect_data': {
+        'time': ('f8', None),  # When collect_data returned
+        'duration': ('f8', None),
+        'point': ('f8', 2),
+        'status': ('u1', None),  # Index into the recording's status names
+    },
+    'compute_and_apply': {
+        'time': ('f8', None),
+        'duration': ('f8', None),
+        'status': ('u1', None),
+        'point_count': ('u2', None),  # len(calibration_result.calibration_points)
+    },
+    'calibration_points': {
+        'compute': ('u2', None),  # Row of the compute_and_apply whose result had this point
+        'point': ('f8', 2),
+        'samples': ('u2', None),
+        'used_samples': ('u2', None),  # Samples used from both eyes
+    },
+}
+
+def column_file_name(stream, column):
+    return f"{stream}.{column}.bin"
+
+class ColumnWriter:
+    """Appends the values of one column to a raw binary file, a chunk at a time"""
+
+    def __init__(self, path, dtype, width=None, chunk_rows=4096):
+        shape = (chunk_rows,) if width is None else (chunk_rows, width)
+
+        self.buffer = np.empty(shape, dtype=dtype)
+        self.buffered_rows = 0
+        self.written_rows = 0
+        self.file = open(path, 'wb')
+
+    def append(self, value):
+        self.buffer[self.buffered_rows] = value
+        self.buffered_rows += 1
+
+        if self.buffered_rows == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        self.buffer[:self.buffered_rows].tofile(self.file)
+        self.written_rows += self.buffered_rows
+        self.buffered_rows = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def describe(self):
+        return {
+            'dtype': self.buffer.dtype.str,
+            'shape': [self.written_rows] + list(self.buffer.shape[1:]),
+        }
+
+class SessionRecorder:
+    """
+    Records the raw user position guides and calibration results a
+    TobiiEyeTracker sees into a directory of columnar binary files.
+
+    Rows are buffered in NumPy chunks and appended to one file per column,
+    so recording costs no more than a few array assignments per sample and
+    long sessions are never held in memory. Times are seconds on the
+    tracker's clock since the recorder was created.
+    """
+
+    def __init__(self, path, serial_number, clock):
+        os.makedirs(path, exist_ok=True)
+
+        self.path = path
+        self.serial_number = serial_number
+        self.clock = clock
+        self.started = clock.monotonic()
+
+        self.status_names = []  # Status strings, in order of first appearance
+        self.lock = threading.Lock()  # Guides arrive on the SDK's thread
+
+        self.writers = {
+            stream: {
+                column: ColumnWriter(os.path.join(path, column_file_name(stream, column)), dtype, width)
+                for column, (dtype, width) in columns.items()
+            }
+            for stream, columns in streams.items()
+        }
+
+    def now(self):
+        return self.clock.monotonic() - self.started
+
+    def status_code(self, status):
+        if status not in self.status_names:
+            self.status_names.append(status)
+
+        return self.status_names.index(status)
+
+    def record_user_position(self, guide_dict):
+        with self.lock:
+            writers = self.writers['user_position']
+
+            writers['time'].append(self.now())
+            writers['left'].append(guide_dict['left_user_position'])
+            writers['right'].append(guide_dict['right_user_position'])
+            writers['validity'].append((
+                guide_dict['left_user_position_validity'],
+                guide_dict['right_user_position_validity'],
+            ))
+
+    def record_collect_data(self, x, y, status, duration):
+        with self.lock:
+            writers = self.writers['collect_data']
+
+            writers['time'].append(self.now())
+            writers['duration'].append(duration)
+            writers['point'].append((x, y))
+            writers['status'].append(self.status_code(status))
+
+    def record_compute_and_apply(self, status, calibration_points, duration, valid_and_used):
+        """valid_and_used is the API's VALIDITY_VALID_AND_USED"""
+        with self.lock:
+            writers = self.writers['compute_and_apply']
+            compute = writers['time'].written_rows + writers['time'].buffered_rows
+
+            writers['time'].append(self.now())
+            writers['duration'].append(duration)
+            writers['status'].append(self.status_code(status))
+            writers['point_count'].append(len(calibration_points))
+
+            writers = self.writers['calibration_points']
+
+            for calibration_point in calibration_points:
+                samples = calibration_point.calibration_samples
+
+                writers['compute'].append(compute)
+                writers['point'].append(calibration_point.position_on_display_area)
+                writers['samples'].append(len(samples))
+                writers['used_samples'].append(sum(
+                    1 for sample in samples
+                    if sample.left_eye.validity == valid_and_used and sample.right_eye.validity == valid_and_used
+                ))
+
+    def close(self):
+        with self.lock:
+            columns = {}
+
+            for stream, writers in self.writers.items():
+                for column, writer in writers.items():
+                    writer.close()
+                    columns[column_file_name(stream, column)] = writer.describe()
+
+            metadata = {
+                'serial_number': self.serial_number,
+                'status_names': self.status_names,
+                'columns': columns,
+            }
+
+            with open(os.path.join(self.path, 'metadata.json'), 'w') as metadata_file:
+                json.dump(metadata, metadata_file, indent=2)
+
+class Recording:
+    """
+    A recording made by SessionRecorder. Columns are memory-mapped, so
+    opening even a multi-hour recording reads nothing but metadata.json.
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'metadata.json')) as metadata_file:
+            metadata = json.load(metadata_file)
+
+        self.serial_number = metadata['serial_number']
+        self.status_names = metadata['status_names']
+
+        self.streams = {}
+
+        for stream, columns in streams.items():
+            self.streams[stream] = {}
+
+            for column in columns:
+                file_name = column_file_name(stream, column)
+                description = metadata['columns'][file_name]
+                shape = tuple(description['shape'])
+
+                if shape[0] == 0:  # Empty files cannot be memory-mapped
+                    array = np.empty(shape, dtype=description['dtype'])
+                else:
+                    array = np.memmap(os.path.join(path, file_name), dtype=description['dtype'], mode='r', shape=shape)
+
+                self.streams[stream][column] = array
+
+    def __getitem__(self, stream):
+        return self.streams[stream]
+
+    def status_name(self, code):
+        return self.status_names[code]
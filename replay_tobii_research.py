@@ -0,0 +1,205 @@
+import logging
+import threading
+
+from clocks import RealClock, VirtualClock
+from recording import Recording
+
+EYETRACKER_USER_POSITION_GUIDE = "eyetracker_user_position_guide"
+CALIBRATION_STATUS_SUCCESS = "calibration_status_success"
+
+VALIDITY_INVALID_AND_NOT_USED = "validity_invalid_and_not_used"
+VALIDITY_VALID_AND_USED = "validity_valid_and_used"
+
+logger = logging.getLogger(__name__)
+
+class ReplaySettings:
+    """Which recording (made with app.py --record) find_all_eyetrackers() plays back"""
+
+    def __init__(self, path=None, recorded_speed=False):
+        self.path = path
+        self.recorded_speed = recorded_speed
+
+settings = ReplaySettings()
+
+def configure(path, recorded_speed=False):
+    """
+    recorded_speed replays samples with their original timing on the wall
+    clock. Otherwise the device runs on a VirtualClock and the session
+    replays as fast as the consumer can go.
+    """
+    settings.path = path
+    settings.recorded_speed = recorded_speed
+
+class ReplayUserPositionStream(threading.Thread):
+    """Feeds recorded user position guides to a subscriber, at their recorded times"""
+
+    def __init__(self, callback, recording, clock):
+        self.callback = callback
+        self.clock = clock
+        self.keep_running = True
+
+        columns = recording['user_position']
+        self.times = columns['time']
+        self.left = columns['left']
+        self.right = columns['right']
+        self.validity = columns['validity']
+
+        self.next_index = 0
+        self.started = clock.monotonic()
+        self.timer = None
+
+        threading.Thread.__init__(self)
+
+    def due(self, index):
+        # Subscribing starts the stream from its first recorded sample
+        return self.started + (self.times[index] - self.times[0])
+
+    def run(self):
+        while self.keep_running and self.next_index < len(self.times):
+            self.clock.sleep(self.due(self.next_index) - self.clock.monotonic())
+
+            if self.keep_running:
+                self.step()
+
+        if self.next_index >= len(self.times):
+            logger.warning("Replay: recorded user positions exhausted")
+
+    def schedule(self):
+        """Virtual time: chain one-shot timers instead of running a thread"""
+        if self.next_index < len(self.times):
+            self.timer = self.clock.call_at(self.due(self.next_index), self.step_and_schedule)
+
+    def step_and_schedule(self):
+        self.step()
+        self.schedule()
+
+    def step(self):
+        index = self.next_index
+        self.next_index += 1
+
+        left_validity, right_validity = self.validity[index]
+
+        self.callback({
+            'left_user_position_validity': int(left_validity),
+            'left_user_position': tuple(self.left[index].tolist()),
+            'right_user_position_validity': int(right_validity),
+            'right_user_position': tuple(self.right[index].tolist()),
+        })
+
+    def stop(self):
+        self.keep_running = False
+
+        if self.timer:
+            self.timer.cancel()
+
+class ReplayEyeTracker:
+    """
+    Drop-in replacement for tobii_research.EyeTracker
+    """
+    def __init__(self, recording, recorded_speed=False):
+        self.recording = recording
+        self.serial_number = recording.serial_number
+        self.clock = RealClock() if recorded_speed else VirtualClock()
+
+        self.next_collect_index = 0
+        self.next_compute_index = 0
+        self.stream = None
+
+    def subscribe_to(self, guide, callback, as_dictionary=True):
+        self.stream = ReplayUserPositionStream(callback, self.recording, self.clock)
+
+        if isinstance(self.clock, VirtualClock):
+            self.stream.schedule()
+        else:
+            self.stream.start()
+
+    def unsubscribe_from(self, guide, callback):
+        self.stream.stop()
+
+class ReplayEyeData:
+    def __init__(self, validity):
+        self.validity = validity
+
+class ReplayCalibrationSample:
+    def __init__(self, used):
+        validity = VALIDITY_VALID_AND_USED if used else VALIDITY_INVALID_AND_NOT_USED
+
+        self.left_eye = ReplayEyeData(validity)
+        self.right_eye = ReplayEyeData(validity)
+
+class ReplayCalibrationPoint:
+    """Only sample counts are recorded, so the samples are stand-ins with the recorded validity"""
+
+    def __init__(self, position_on_display_area, samples, used_samples):
+        self.position_on_display_area = position_on_display_area
+        self.calibration_samples = [ReplayCalibrationSample(index < used_samples) for index in range(samples)]
+
+class ReplayCalibrationResult:
+    def __init__(self, status, calibration_points):
+        self.status = status
+        self.calibration_points = calibration_points
+
+class ScreenBasedCalibration:
+    def __init__(self, eyetracker):
+        self.eyetracker = eyetracker
+
+    def enter_calibration_mode(self):
+        pass
+
+    def leave_calibration_mode(self):
+        pass
+
+    def discard_data(self, x, y):
+        pass  # The recorded results already reflect what was discarded
+
+    def collect_data(self, x, y):
+        eyetracker = self.eyetracker
+        columns = eyetracker.recording['collect_data']
+        index = eyetracker.next_collect_index
+
+        if index >= len(columns['status']):
+            raise Exception("Replay: recorded collect_data results exhausted")
+
+        eyetracker.next_collect_index += 1
+
+        recorded_x, recorded_y = columns['point'][index]
+
+        if (recorded_x, recorded_y) != (x, y):
+            logger.warning(f"Replay: collecting at {(x, y)}, but the recording collected at {(recorded_x, recorded_y)}")
+
+        eyetracker.clock.sleep(columns['duration'][index])
+
+        return eyetracker.recording.status_name(columns['status'][index])
+
+    def compute_and_apply(self):
+        eyetracker = self.eyetracker
+        columns = eyetracker.recording['compute_and_apply']
+        index = min(eyetracker.next_compute_index, len(columns['status']) - 1)
+
+        if index < 0:
+            raise Exception("Replay: the recording has no compute_and_apply result")
+
+        eyetracker.next_compute_index += 1
+
+        eyetracker.clock.sleep(columns['duration'][index])
+
+        points = eyetracker.recording['calibration_points']
+        rows = (points['compute'] == index).nonzero()[0]
+
+        return ReplayCalibrationResult(
+            eyetracker.recording.status_name(columns['status'][index]),
+            [
+                ReplayCalibrationPoint(
+                    tuple(points['point'][row].tolist()),
+                    int(points['samples'][row]),
+                    int(points['used_samples'][row]),
+                )
+                for row in rows
+            ],
+        )
+
+def find_all_eyetrackers():
+    if settings.path is None:
+        raise Exception("No recording to replay. Call configure() first")
+
+    return [ReplayEyeTracker(Recording(settings.path), recorded_speed=settings.recorded_speed)]
@@ -0,0 +1,140 @@
+import config
+
+class UserPositionScorer:
+    """
+    Rolling score over the most recent user position guides.
+
+    Each guide is scored once when it arrives and kept in a fixed-size ring
+    buffer, so adding a sample and reading the total are both O(1) no matter
+    how large the window is.
+
+    Scores use the weights and exponents of a config snapshot, which
+    use_settings() can swap between samples. The window size is fixed when
+    the scorer is created.
+    """
+
+    def __init__(self, positions_range=None, settings=None):
+        self.settings = settings or config.current()
+        self.positions_range = positions_range or self.settings.user_position_score_back_look
+
+        self.recent_scores = [0.0] * self.positions_range
+        self.next_index = 0  # Slot the next score will be written to
+
+        # Compensated (Neumaier) running sum keeps the total in step with a
+        # freshly computed sum even after millions of additions/removals
+        self.score_sum = 0.0
+        self.score_sum_error = 0.0
+
+    def use_settings(self, settings):
+        self.settings = settings
+
+    def add_positions(self, guide):
+        score = self.calculate_score_for_positions(guide)
+
+        # Slots start out at 0.0, so evicting one before the window is full
+        # leaves the sum untouched
+        evicted_score = self.recent_scores[self.next_index]
+
+        self.recent_scores[self.next_index] = score
+        self.next_index = (self.next_index + 1) % self.positions_range
+
+        self.accumulate(score)
+        self.accumulate(-evicted_score)
+
+        return score
+
+    def accumulate(self, value):
+        total = self.score_sum + value
+
+        if abs(self.score_sum) >= abs(value):
+            self.score_sum_error += (self.score_sum - total) + value
+        else:
+            self.score_sum_error += (value - total) + self.score_sum
+
+        self.score_sum = total
+
+    def calculate_total_score(self):
+        return (self.score_sum + self.score_sum_error) / self.positions_range
+
+    def calculate_score_for_positions(self, positions):
+        left = positions.left_position
+        right = positions.right_position
+
+        if not left.valid or not right.valid:
+            return 0
+
+        (x_weight, x_exponent), (y_weight, y_exponent), (z_weight, z_exponent) = self.settings.score_terms
+
+        x_score = ((left.x + right.x) ** x_exponent) * x_weight
+        y_score = ((left.y + right.y) ** y_exponent) * y_weight
+        z_score = ((left.z + right.z) ** z_exponent) * z_weight
+
+        score_sum = x_score + y_score + z_score
+
+        # print(f"{x_score} {y_score} {z_score}")
+
+        score = 1 - abs(1 - score_sum)
+
+        # TODO: Score should not fall out of 0.0-1.0 range. Fix math
+        if score > 1:
+            score = 1
+        elif score < 0:
+            score = 0
+
+        return score
+
+def score_positions(left_xyz, right_xyz, left_valid, right_valid, settings=None):
+    """
+    Vectorized UserPositionScorer.calculate_score_for_positions.
+
+    left_xyz/right_xyz are (N, 3) arrays of user positions, left_valid and
+    right_valid are length-N arrays of validity flags (bools or the SDK's 0/1).
+    Returns a float64 array of N per-sample scores.
+    """
+    # Only batch scoring needs NumPy, and it is slow to import on a startup path
+    import numpy as np
+
+    left_xyz = np.asarray(left_xyz, dtype=np.float64)
+    right_xyz = np.asarray(right_xyz, dtype=np.float64)
+    valid = np.asarray(left_valid).astype(bool) & np.asarray(right_valid).astype(bool)
+
+    (x_weight, x_exponent), (y_weight, y_exponent), (z_weight, z_exponent) = (settings or config.current()).score_terms
+
+    combined = left_xyz + right_xyz
+
+    # Invalid samples are frequently NaN. They get zeroed below anyway
+    with np.errstate(invalid='ignore', over='ignore'):
+        x_score = (combined[:, 0] ** x_exponent) * x_weight
+        y_score = (combined[:, 1] ** y_exponent) * y_weight
+        z_score = (combined[:, 2] ** z_exponent) * z_weight
+
+        scores = 1 - np.abs(1 - (x_score + y_score + z_score))
+
+    np.clip(scores, 0, 1, out=scores)
+    scores[~valid] = 0
+
+    return scores
+
+def rolling_total_scores(scores, positions_range=None):
+    """
+    Vectorized UserPositionScorer.calculate_total_score after each sample.
+
+    Like the scorer, the window sum is always divided by the full window
+    size, so the first positions_range - 1 totals ramp up from zero.
+    """
+    import numpy as np
+
+    positions_range = positions_range or config.current().user_position_score_back_look
+
+    cumulative = np.concatenate(([0.0], np.cumsum(scores, dtype=np.float64)))
+
+    window_end = np.arange(1, len(cumulative))
+    window_start = np.maximum(window_end - positions_range, 0)
+
+    return (cumulative[window_end] - cumulative[window_start]) / positions_range
+
+def batch_score(left_xyz, right_xyz, left_valid, right_valid, positions_range=None):
+    """Returns (per-sample scores, rolling total scores) for a whole recording"""
+    scores = score_positions(left_xyz, right_xyz, left_valid, right_valid)
+
+    return scores, rolling_total_scores(scores, positions_range)
@@ -0,0 +1,138 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class CalibrationSink:
+    """
+    Receives the progress of a calibration from TobiiEyeTracker.
+
+    The base class ignores everything, which makes it the null renderer.
+    The GUI's implementation is gui.CalibrationFrameSink, a MailboxSink.
+    """
+
+    def update_user_position(self, guide):
+        pass
+
+    def show_point(self, point, success_count=0, progress=0.0):
+        """progress is how far the point is towards being accepted, from 0 to 1"""
+        pass
+
+    def show_validation_point(self, point):
+        pass
+
+    def finalizing_calibration(self):
+        pass
+
+    def calibration_concluded(self):
+        pass
+
+class NullSink(CalibrationSink):
+    pass
+
+class LoggingSink(CalibrationSink):
+    """Logs progress as text. User position scores are throttled"""
+
+    def __init__(self, position_interval=1.0):
+        self.position_interval = position_interval
+        self.last_position_logged = None
+
+    def update_user_position(self, guide):
+        now = time.monotonic()
+
+        if self.last_position_logged is None or now - self.last_position_logged >= self.position_interval:
+            self.last_position_logged = now
+            logger.info(f"User position score: {guide.score:0.3f}")
+
+    def show_point(self, point, success_count=0, progress=0.0):
+        logger.info(f"Showing point {point.name} ({success_count} successes)")
+
+    def show_validation_point(self, point):
+        logger.info(f"Showing validation point {point.name}")
+
+    def finalizing_calibration(self):
+        logger.info("Finalizing calibration")
+
+    def calibration_concluded(self):
+        logger.info("Calibration concluded")
+
+class RecordingSink(CalibrationSink):
+    """Keeps every call as (monotonic time, kind, details) for later inspection"""
+
+    def __init__(self):
+        self.events = []
+
+    def record(self, kind, **details):
+        self.events.append((time.monotonic(), kind, details))
+
+    def update_user_position(self, guide):
+        self.record('user_position', score=guide.score)
+
+    def show_point(self, point, success_count=0, progress=0.0):
+        self.record('show_point', point=point, success_count=success_count, progress=progress)
+
+    def show_validation_point(self, point):
+        self.record('show_validation_point', point=point)
+
+    def finalizing_calibration(self):
+        self.record('finalizing_calibration')
+
+    def calibration_concluded(self):
+        self.record('calibration_concluded')
+
+    def summary_text(self):
+        counts = {}
+
+        for _, kind, _ in self.events:
+            counts[kind] = counts.get(kind, 0) + 1
+
+        return ", ".join(f"{kind}: {count}" for kind, count in counts.items())
+
+class MailboxSink(CalibrationSink):
+    """
+    Hands user position guides to another thread through a
+    channels.LatestValueMailbox. Samples arrive far faster than the GUI
+    repaints, so only the newest one is handed over instead of queueing each
+    """
+
+    def __init__(self, mailbox):
+        self.mailbox = mailbox
+
+    def update_user_position(self, guide):
+        self.mailbox.put(guide)
+
+class CompositeSink(CalibrationSink):
+    """Passes every call on to each of several sinks, in order"""
+
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def update_user_position(self, guide):
+        # Indexed, as a for loop would allocate an iterator for every sample
+        index = 0
+
+        while index < len(self.sinks):
+            self.sinks[index].update_user_position(guide)
+            index += 1
+
+    def show_point(self, point, success_count=0, progress=0.0):
+        for sink in self.sinks:
+            sink.show_point(point, success_count, progress)
+
+    def show_validation_point(self, point):
+        for sink in self.sinks:
+            sink.show_validation_point(point)
+
+    def finalizing_calibration(self):
+        for sink in self.sinks:
+            sink.finalizing_calibration()
+
+    def calibration_concluded(self):
+        for sink in self.sinks:
+            sink.calibration_concluded()
+
+sinks_by_name = {
+    'null': NullSink,
+    'logging': LoggingSink,
+    'recording': RecordingSink,
+}
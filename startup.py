@@ -0,0 +1,50 @@
+import importlib
+import sys
+import threading
+import time
+
+class StartupReport:
+    """
+    How long the heavy imports took and when each startup milestone was
+    reached, counted from process start (app.py --startup-report prints it)
+    """
+
+    def __init__(self, launched=None):
+        self.launched = launched or time.perf_counter()
+        self.imports = []  # (module name, seconds), in import order
+        self.milestones = {}  # Name -> seconds since launch, first time only
+        self.lock = threading.Lock()
+
+    def timed_import(self, name):
+        """importlib.import_module, noting the time taken if this is the first import"""
+        if name in sys.modules:
+            return sys.modules[name]
+
+        started = time.perf_counter()
+        module = importlib.import_module(name)
+
+        with self.lock:
+            self.imports.append((name, time.perf_counter() - started))
+
+        return module
+
+    def mark(self, milestone, when=None):
+        when = when or time.perf_counter()
+
+        with self.lock:
+            self.milestones.setdefault(milestone, when - self.launched)
+
+    def report_text(self):
+        with self.lock:
+            lines = ["Startup report (seconds):", "  Imports:"]
+            lines += [f"    {name:<28} {seconds:8.3f}" for name, seconds in self.imports]
+            lines.append("  Milestones since process start:")
+            lines += [
+                f"    {milestone:<28} {seconds:8.3f}"
+                for milestone, seconds in sorted(self.milestones.items(), key=lambda item: item[1])
+            ]
+
+        return "\n".join(lines)
+
+# Shared by every module, so each can time its own lazy imports and milestones
+report = StartupReport()
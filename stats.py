@@ -0,0 +1,69 @@
+def summarize(values):
+    """Distribution of a list of measurements, as a JSON-friendly dict"""
+    ordered = sorted(values)
+
+    if not ordered:
+        return {'count': 0}
+
+    def percentile(percent):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+    return {
+        'count': len(ordered),
+        'mean': sum(ordered) / len(ordered),
+        'min': ordered[0],
+        'p50': percentile(50),
+        'p90': percentile(90),
+        'p99': percentile(99),
+        'max': ordered[-1],
+    }
+
+class RollingStats:
+    """
+    Fixed-size window over the most recent measurements (e.g. durations in
+    seconds). Adding is O(1) and allocation-free; summaries are computed on
+    demand, so they belong in reports and debug overlays, not hot loops.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.values = [0.0] * size
+        self.next_index = 0
+        self.count = 0  # Total measurements ever added
+
+    def add(self, value):
+        self.values[self.next_index] = value
+        self.next_index = (self.next_index + 1) % self.size
+        self.count += 1
+
+    def recent(self):
+        if self.count < self.size:
+            return self.values[:self.count]
+
+        return self.values
+
+    def mean(self):
+        recent = self.recent()
+
+        return sum(recent) / len(recent) if recent else 0.0
+
+    def percentile(self, percent):
+        recent = sorted(self.recent())
+
+        if not recent:
+            return 0.0
+
+        index = min(len(recent) - 1, int(len(recent) * percent / 100))
+
+        return recent[index]
+
+    def maximum(self):
+        return max(self.recent(), default=0.0)
+
+    def summary_text(self, scale=1000, unit='ms'):
+        return (
+            f"mean {self.mean() * scale:0.2f} / "
+            f"p95 {self.percentile(95) * scale:0.2f} / "
+            f"max {self.maximum() * scale:0.2f} {unit} "
+            f"(n={self.count})"
+        )
@@ -0,0 +1,610 @@
+"""
+Offline tuning of the user position scorer and the collection rule.
+
+Replays user position and collect_data streams (simulated by the mock
+tracker, or recorded with app.py --record) through vectorized versions of
+UserPositionScorer and the collection strategies, for every combination of
+a grid of config.ini values, on a process pool across all cores. Each
+combination gets its time to position and false acceptance rates:
+
+  python sweep.py --grid user_position_score_requirement=0.75:0.95:0.01 \\
+                  --grid dot_result_minimum_success_rate=0.3,0.4,0.5
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+from random import Random
+import time
+
+import numpy as np
+
+from clocks import VirtualClock
+from collection import AdaptiveCollection, FixedCollection, PointOutcome, collection_strategies
+import config
+from filters import head_filters
+from models import UserPositionGuide
+from scoring import UserPositionScorer, rolling_total_scores, score_positions
+from stats import summarize
+import mock_tobii_research
+
+# Settings each half of the sweep depends on. The two halves are evaluated
+# separately and joined, as neither affects the other's results
+scorer_settings = [
+    'user_position_score_requirement',
+    'user_position_score_back_look',
+    'x_score_weight',
+    'y_score_weight',
+    'z_score_weight',
+    'x_score_exponent',
+    'y_score_exponent',
+    'z_score_exponent',
+]
+
+collection_settings = [
+    'collection_strategy',
+    'dot_result_back_look',
+    'dot_result_successes_requirement',
+    'dot_result_minimum_successes',
+    'dot_result_minimum_success_rate',
+    'dot_result_confidence_z',
+    'dot_result_failure_budget',
+]
+
+default_grid = [
+    'user_position_score_requirement=0.75:0.95:0.01',
+    'user_position_score_back_look=25,50,100,150,200',
+    'x_score_exponent=6,8,10,12',
+    # The dot_result settings below only apply to adaptive collection
+    'collection_strategy=adaptive',
+    'dot_result_minimum_success_rate=0.15:0.45:0.05',
+    'dot_result_confidence_z=0.75,1.0,1.645',
+    'dot_result_failure_budget=10,15,20,25',
+]
+
+# Outcome codes of collection_outcomes
+UNDECIDED = 0  # The recorded or simulated attempts ran out first
+ACCEPTED = 1
+GAVE_UP = 2
+
+class PositionStream:
+    """
+    One session's user position samples, smoothed by the head filter as the
+    tracker would, and whether the user was really in position at each
+    """
+
+    def __init__(self, times, left, right, left_valid, right_valid, in_position):
+        self.times = times  # Seconds since subscribing
+        self.left = left  # (N, 3)
+        self.right = right
+        self.left_valid = left_valid
+        self.right_valid = right_valid
+        self.in_position = in_position
+
+class PointAttempts:
+    """
+    collect_data outcomes at many calibration points, one row per point,
+    padded with failures past each point's number of attempts
+    """
+
+    def __init__(self, outcomes, lengths, bad):
+        self.outcomes = outcomes  # (points, attempts) bools
+        self.lengths = lengths
+        self.bad = bad  # Points that should not be accepted: weak, or with too few samples used in the end
+
+        self.successes = np.cumsum(outcomes, axis=1)  # After each attempt
+        self.attempts = np.arange(1, outcomes.shape[1] + 1)
+
+def parse_grid(specs):
+    """{setting: [values]} from "name=a,b,c" or "name=start:stop:step" (inclusive)"""
+    grid = {}
+
+    for spec in specs:
+        name, _, values = spec.partition('=')
+        name = name.strip().lower()
+
+        if name not in scorer_settings + collection_settings:
+            raise ValueError(f"Cannot sweep {name}: only {', '.join(scorer_settings + collection_settings)}")
+
+        value_type = type(config.constants_and_defaults[name.upper()])
+
+        if ':' in values:
+            start, stop, step = (float(value) for value in values.split(':'))
+            count = int(round((stop - start) / step)) + 1
+            grid[name] = [value_type(round(start + step * index, 10)) for index in range(count)]
+        else:
+            grid[name] = [value_type(value.strip()) for value in values.split(',')]
+
+    return grid
+
+def combinations(grid, names):
+    """Every combination of the grid's values for the given settings, as dicts"""
+    names = [name for name in names if name in grid]
+
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+def in_position(left, right, tolerance):
+    """Whether each (N, 3) pair of eye positions is within tolerance of ideal, as the scorer sums them"""
+    return np.all(np.abs(left + right - 1) <= tolerance, axis=1)
+
+def filtered(times, left, right, left_valid, right_valid, head_filter):
+    """The positions after the head filter, sample by sample as the tracker applies it"""
+    head_filter = head_filters[head_filter](config.current())
+    guide = UserPositionGuide.empty()
+    left_filtered = np.empty_like(left)
+    right_filtered = np.empty_like(right)
+
+    for index in range(len(times)):
+        guide.left_position.load(left[index], bool(left_valid[index]))
+        guide.right_position.load(right[index], bool(right_valid[index]))
+        head_filter.update(guide, times[index])
+
+        left_filtered[index] = (guide.left_position.x, guide.left_position.y, guide.left_position.z)
+        right_filtered[index] = (guide.right_position.x, guide.right_position.y, guide.right_position.z)
+
+    return left_filtered, right_filtered
+
+def simulate_position_streams(args):
+    """Mock user position sessions for each head drift, with the true head position behind each sample"""
+    streams = []
+
+    for head_drift, session in itertools.product(args.head_drifts, range(args.sessions)):
+        samples = []
+        truths = []
+
+        def callback(guide_dict):
+            samples.append((guide_dict['left_user_position'], guide_dict['right_user_position']))
+            truths.append((
+                (worker.left_position.x, worker.left_position.y, worker.left_position.z),
+                (worker.right_position.x, worker.right_position.y, worker.right_position.z),
+            ))
+
+        worker = mock_tobii_research.MockUserPositionThread(
+            callback,
+            Random(f"{args.seed + session}-head"),
+            VirtualClock(),
+            mock_tobii_research.head_drift_profiles[head_drift],
+            args.position_noise,
+        )
+
+        for _ in range(args.samples):
+            worker.step()
+
+        samples = np.array(samples)
+        truths = np.array(truths)
+        times = mock_tobii_research.USER_POSITION_GUIDE_INTERVAL * np.arange(1, args.samples + 1)
+        valid = np.ones(args.samples, dtype=bool)
+
+        left, right = filtered(times, samples[:, 0], samples[:, 1], valid, valid, args.head_filter)
+
+        streams.append(PositionStream(
+            times, left, right, valid, valid,
+            in_position(truths[:, 0], truths[:, 1], args.position_tolerance),
+        ))
+
+    return streams
+
+def simulate_point_attempts(args):
+    """collect_data outcomes as the mock draws them, at every layout point, weak points last"""
+    point_count = len(config.current().layout)
+    rows = []
+    bad = []
+
+    for success_rate, session in itertools.product(args.success_rates, range(args.sessions)):
+        random = Random(f"{args.seed + session}-calibration-{success_rate}")
+
+        for point in range(point_count):
+            weak = point >= point_count - args.weak_points
+            rate = args.weak_success_rate if weak else success_rate
+
+            rows.append([random.random() < rate for _ in range(args.max_attempts)])
+            bad.append(weak)
+
+    return PointAttempts(np.array(rows), np.full(len(rows), args.max_attempts), np.array(bad))
+
+def recorded_inputs(args):
+    """Position streams and point attempts from recordings made with app.py --record"""
+    # Only needed for recordings, like in app.py --replay
+    from recording import Recording
+    import replay_tobii_research
+
+    streams = []
+    rows = []
+    lengths = []
+    bad = []
+
+    minimum_fraction = config.current().recalibration_minimum_valid_fraction
+
+    for path in args.recordings:
+        recording = Recording(path)
+
+        columns = recording['user_position']
+        times = columns['time'] - columns['time'][0] if len(columns['time']) else columns['time']
+        left_valid = columns['validity'][:, 0] == 1
+        right_valid = columns['validity'][:, 1] == 1
+        left, right = filtered(times, np.array(columns['left']), np.array(columns['right']), left_valid, right_valid, args.head_filter)
+
+        # Without the true head position, the valid raw samples averaged around each one stand in for it
+        valid = left_valid & right_valid
+        kernel = np.ones(args.truth_window)
+        counts = np.convolve(valid, kernel, mode='same')
+        centred = np.column_stack([
+            np.convolve(np.where(valid, columns['left'][:, axis] + columns['right'][:, axis], 0), kernel, mode='same')
+            for axis in range(3)
+        ]) / np.maximum(counts, 1)[:, None]
+        truth = np.all(np.abs(centred - 1) <= args.position_tolerance, axis=1) & valid
+
+        streams.append(PositionStream(times, left, right, left_valid, right_valid, truth))
+
+        # Consecutive collect_data calls at one point are one point's attempts
+        columns = recording['collect_data']
+        success = [status == replay_tobii_research.CALIBRATION_STATUS_SUCCESS for status in recording.status_names]
+
+        # A point is bad if the last compute_and_apply used too few of its samples
+        computes = recording['calibration_points']
+        last_compute = computes['compute'].max() if len(computes['compute']) else None
+        used_fractions = {
+            tuple(point): used / samples if samples else 0.0
+            for compute, point, samples, used in zip(computes['compute'], computes['point'], computes['samples'], computes['used_samples'])
+            if compute == last_compute
+        }
+
+        for point, group in itertools.groupby(zip(map(tuple, columns['point']), columns['status']), key=lambda row: row[0]):
+            outcomes = [success[status] for _, status in group]
+
+            rows.append(outcomes)
+            lengths.append(len(outcomes))
+            bad.append(used_fractions.get(point, 0.0) < minimum_fraction)
+
+    outcomes = np.zeros((len(rows), max(lengths, default=0)), dtype=bool)
+
+    for index, row in enumerate(rows):
+        outcomes[index, :len(row)] = row
+
+    return streams, PointAttempts(outcomes, np.array(lengths), np.array(bad))
+
+def wilson_lower_bounds(successes, attempts, z):
+    """collection.wilson_lower_bound over arrays (attempts all at least 1)"""
+    rate = successes / attempts
+    z_squared = z * z
+
+    centre = rate + z_squared / (2 * attempts)
+    spread = z * np.sqrt(rate * (1 - rate) / attempts + z_squared / (4 * attempts * attempts))
+
+    return (centre - spread) / (1 + z_squared / attempts)
+
+def collection_outcomes(points, settings):
+    """
+    What the collection strategy in settings decides at every point at once:
+    (outcome codes, attempts made). Matches running collection.collection_strategies
+    on each point's attempts in turn
+    """
+    successes = points.successes
+    attempts = points.attempts
+
+    if settings.collection_strategy == 'fixed':
+        # FixedCollection keeps up to back_look + 1 successes
+        accepted = np.minimum(successes, settings.dot_result_back_look + 1) >= settings.dot_result_successes_requirement
+        gave_up = np.zeros_like(accepted)
+    else:
+        lower_bounds = wilson_lower_bounds(successes, attempts, settings.dot_result_confidence_z)
+
+        accepted = (successes >= settings.dot_result_minimum_successes) & (lower_bounds >= settings.dot_result_minimum_success_rate)
+        gave_up = ~accepted & (attempts - successes >= settings.dot_result_failure_budget)
+
+    decided = (accepted | gave_up) & (attempts <= points.lengths[:, None])
+    first = decided.argmax(axis=1)
+    rows = np.arange(len(first))
+
+    outcomes = np.where(decided[rows, first], np.where(accepted[rows, first], ACCEPTED, GAVE_UP), UNDECIDED)
+    made = np.where(outcomes == UNDECIDED, points.lengths, first + 1)
+
+    return outcomes, made
+
+def collection_metrics(points, settings):
+    outcomes, made = collection_outcomes(points, settings)
+    good = ~points.bad
+
+    def rate(selected, outcome):
+        return float(np.mean(outcomes[selected] == outcome)) if selected.any() else None
+
+    return {
+        'attempts': float(made.mean()),
+        'point_false_acceptance': rate(points.bad, ACCEPTED),  # Bad points accepted
+        'point_false_rejection': rate(good, GAVE_UP),  # Good points given up on
+        'undecided': float(np.mean(outcomes == UNDECIDED)),
+    }
+
+def running_maxima(streams, settings):
+    """Highest total score so far at each sample of each stream"""
+    return [
+        np.maximum.accumulate(rolling_total_scores(
+            score_positions(stream.left, stream.right, stream.left_valid, stream.right_valid, settings),
+            settings.user_position_score_back_look,
+        ))
+        for stream in streams
+    ]
+
+def position_metrics(streams, maxima, requirement):
+    times = []
+    false_acceptances = 0
+
+    for stream, stream_maxima in zip(streams, maxima):
+        # The first sample whose total reaches the requirement
+        index = np.searchsorted(stream_maxima, requirement)
+
+        if index < len(stream_maxima):
+            times.append(float(stream.times[index]))
+            false_acceptances += not stream.in_position[index]
+
+    time_to_position = summarize(times)
+
+    return {
+        'time_to_position_p50': time_to_position.get('p50'),
+        'time_to_position_p90': time_to_position.get('p90'),
+        'never_in_position': 1 - len(times) / len(streams),  # Within the stream
+        'position_false_acceptance': false_acceptances / len(times) if times else None,
+    }
+
+# Each worker's copy of the streams, set by use_inputs
+inputs = None
+
+def use_inputs(streams, points):
+    global inputs
+    inputs = (streams, points)
+
+def evaluate_scorer_chunk(chunk):
+    """(index, metrics) for (index, values) scorer combinations, sorted so scores are reused"""
+    streams, _ = inputs
+    base = config.current()
+    results = []
+    key = None
+
+    for index, values in chunk:
+        settings = base.replace(**values)
+
+        # Only the requirement changes within most runs of combinations
+        if (settings.score_terms, settings.user_position_score_back_look) != key:
+            key = (settings.score_terms, settings.user_position_score_back_look)
+            maxima = running_maxima(streams, settings)
+
+        results.append((index, position_metrics(streams, maxima, settings.user_position_score_requirement)))
+
+    return results
+
+def evaluate_collection_chunk(chunk):
+    _, points = inputs
+    base = config.current()
+
+    return [(index, collection_metrics(points, base.replace(**values))) for index, values in chunk]
+
+def chunks(combinations, size):
+    indexed = list(enumerate(combinations))
+
+    return [indexed[start:start + size] for start in range(0, len(indexed), size)]
+
+def verify(streams, points, scorer_combinations, collection_combinations, count, seed):
+    """
+    Checks the vectorized results against UserPositionScorer and the
+    collection strategy classes, on a few combinations and streams
+    """
+    random = Random(seed)
+    base = config.current()
+    mismatches = 0
+
+    for values in random.sample(scorer_combinations, min(count, len(scorer_combinations))):
+        settings = base.replace(**values)
+
+        for stream, stream_maxima in zip(streams[:3], running_maxima(streams[:3], settings)):
+            expected = np.searchsorted(stream_maxima, settings.user_position_score_requirement)
+
+            scorer = UserPositionScorer(settings.user_position_score_back_look, settings)
+            guide = UserPositionGuide.empty()
+            index = len(stream.times)
+
+            for sample in range(len(stream.times)):
+                guide.left_position.load(stream.left[sample], bool(stream.left_valid[sample]))
+                guide.right_position.load(stream.right[sample], bool(stream.right_valid[sample]))
+                scorer.add_positions(guide)
+
+                total = scorer.calculate_total_score()
+
+                if total >= settings.user_position_score_requirement:
+                    index = sample
+                    break
+
+            # Summed differently, the two can only disagree on a total right at the requirement
+            if index != expected and abs(total - settings.user_position_score_requirement) > 1e-9:
+                mismatches += 1
+
+    for values in random.sample(collection_combinations, min(count, len(collection_combinations))):
+        settings = base.replace(**values)
+        outcomes, made = collection_outcomes(points, settings)
+
+        for row in range(len(points.lengths)):
+            collection = collection_strategies[settings.collection_strategy](settings)
+            outcome, attempts = UNDECIDED, points.lengths[row]
+
+            for attempt in range(points.lengths[row]):
+                decision = collection.add_result(bool(points.outcomes[row, attempt]))
+
+                if decision != PointOutcome.COLLECTING:
+                    outcome = ACCEPTED if decision == PointOutcome.ACCEPTED else GAVE_UP
+                    attempts = attempt + 1
+                    break
+
+            if (outcome, attempts) != (outcomes[row], made[row]):
+                mismatches += 1
+
+    return mismatches
+
+def sweep(args):
+    base = config.current()
+    grid = parse_grid(args.grid or default_grid)
+
+    started = time.perf_counter()
+
+    if args.recordings:
+        streams, points = recorded_inputs(args)
+    else:
+        streams = simulate_position_streams(args)
+        points = simulate_point_attempts(args)
+
+    print(f"{len(streams)} position streams, {len(points.lengths)} calibration points ({time.perf_counter() - started:.1f} s)")
+
+    # The current config.ini settings go first, for comparison
+    current_scorer = {name: getattr(base, name) for name in scorer_settings}
+    current_collection = {name: getattr(base, name) for name in collection_settings}
+
+    scorer_combinations = [current_scorer] + [
+        {**current_scorer, **values} for values in combinations(grid, scorer_settings)
+    ]
+    collection_combinations = [current_collection] + [
+        {**current_collection, **values} for values in combinations(grid, collection_settings)
+    ]
+
+    # Runs of combinations with the same scores next to each other, so workers reuse them
+    scorer_order = sorted(
+        range(1, len(scorer_combinations)),
+        key=lambda index: [scorer_combinations[index][name] for name in scorer_settings[1:]],
+    )
+    scorer_tasks = chunks([scorer_combinations[0]] + [scorer_combinations[index] for index in scorer_order], args.chunk_size)
+
+    combination_count = (len(scorer_combinations) - 1) * (len(collection_combinations) - 1)
+    print(f"Sweeping {combination_count} combinations on {args.processes or os.cpu_count()} processes")
+
+    started = time.perf_counter()
+
+    with multiprocessing.Pool(args.processes, initializer=use_inputs, initargs=(streams, points)) as pool:
+        scorer_results = pool.map_async(evaluate_scorer_chunk, scorer_tasks)
+        collection_results = pool.map_async(evaluate_collection_chunk, chunks(collection_combinations, args.chunk_size))
+
+        position = {}
+
+        for chunk in scorer_results.get():
+            for task_index, metrics in chunk:
+                # Back to the index in scorer_combinations
+                position[0 if task_index == 0 else scorer_order[task_index - 1]] = metrics
+
+        collection = dict(result for chunk in collection_results.get() for result in chunk)
+
+    elapsed = time.perf_counter() - started
+
+    point_count = len(base.layout)
+
+    def row(scorer_index, collection_index):
+        values = {**scorer_combinations[scorer_index], **collection_combinations[collection_index]}
+        metrics = {**position[scorer_index], **collection[collection_index]}
+
+        # Rough session time: positioning, then collecting at every point
+        if metrics['time_to_position_p50'] is not None:
+            metrics['estimated_time'] = (
+                metrics['time_to_position_p50']
+                + point_count * (base.dot_settle_time + metrics['attempts'] * base.dot_collection_interval)
+            )
+        else:
+            metrics['estimated_time'] = None
+
+        return {'settings': values, 'metrics': metrics}
+
+    rows = [
+        row(scorer_index, collection_index)
+        for scorer_index in range(1, len(scorer_combinations))
+        for collection_index in range(1, len(collection_combinations))
+    ]
+
+    print(f"Evaluated in {elapsed:.1f} s ({combination_count / elapsed:.0f} combinations/s)")
+
+    if args.verify:
+        mismatches = verify(streams, points, scorer_combinations, collection_combinations, args.verify, args.seed)
+        print(f"Checked up to {args.verify} combinations of each kind against UserPositionScorer and {FixedCollection.__name__}/{AdaptiveCollection.__name__}: {mismatches} mismatches")
+
+        if mismatches:
+            raise Exception("Vectorized sweep results diverged from the tracker's")
+
+    def acceptable(metrics):
+        def within(names, maximum):
+            # None where there was nothing to accept or reject wrongly
+            return all(metrics[name] is None or metrics[name] <= maximum for name in names)
+
+        # Users never let through, and points never decided on, count as rejections too
+        return metrics['estimated_time'] is not None \
+            and within(['position_false_acceptance', 'point_false_acceptance'], args.max_false_acceptance) \
+            and within(['point_false_rejection', 'never_in_position', 'undecided'], args.max_false_rejection)
+
+    best = sorted((row for row in rows if acceptable(row['metrics'])), key=lambda row: row['metrics']['estimated_time'])
+    swept = [name for name in scorer_settings + collection_settings if name in grid]
+
+    def print_row(label, row):
+        metrics = row['metrics']
+
+        def number(value, width, precision):
+            return f"{'-':>{width}}" if value is None else f"{value:>{width}.{precision}f}"
+
+        print(
+            f"{label:>8} {number(metrics['estimated_time'], 9, 2)} {number(metrics['time_to_position_p50'], 9, 2)} "
+            f"{number(metrics['position_false_acceptance'], 9, 3)} {number(metrics['never_in_position'], 6, 3)} "
+            f"{number(metrics['attempts'], 9, 2)} {number(metrics['point_false_acceptance'], 9, 3)} "
+            f"{number(metrics['point_false_rejection'], 9, 3)}  "
+            + " ".join(f"{name}={row['settings'][name]}" for name in swept)
+        )
+
+    print(
+        f"\n{'':>8} {'est. (s)':>9} {'pos p50':>9} {'pos FA':>9} {'never':>6} "
+        f"{'attempts':>9} {'point FA':>9} {'point FR':>9}  settings"
+    )
+    print_row('current', row(0, 0))
+
+    for rank, best_row in enumerate(best[:args.top]):
+        print_row(f"#{rank + 1}", best_row)
+
+    print(
+        f"{len(best)} of {len(rows)} combinations keep false acceptance at or under {args.max_false_acceptance} "
+        f"and false rejection at or under {args.max_false_rejection}"
+    )
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({'grid': grid, 'current': row(0, 0), 'rows': rows}, output_file)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sweep scorer and collection settings over simulated or recorded sessions')
+    parser.add_argument(
+        '--grid',
+        action='append',
+        metavar='SETTING=VALUES',
+        help='Values to sweep, as "a,b,c" or "start:stop:step" (repeatable). Default: a grid of about 45,000 combinations',
+    )
+    parser.add_argument('--recordings', nargs='+', metavar='DIRECTORY', help='Sessions recorded with app.py --record, instead of simulating')
+    parser.add_argument('--sessions', type=int, default=50, help='Simulated sessions per head drift and success rate')
+    parser.add_argument('--samples', type=int, default=1500, help='User position samples per simulated session')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--head-drifts',
+        nargs='+',
+        choices=sorted(mock_tobii_research.head_drift_profiles),
+        default=['wandering', 'settling', 'restless'],
+    )
+    parser.add_argument('--position-noise', type=float, default=0.005)
+    parser.add_argument('--head-filter', choices=sorted(head_filters), default=config.current().head_filter)
+    parser.add_argument(
+        '--position-tolerance',
+        type=float,
+        default=0.05,
+        help='How far off ideal the summed eye positions may be (per axis) for the user to count as in position',
+    )
+    parser.add_argument('--truth-window', type=int, default=25, help='Recordings: samples averaged for the true head position')
+    parser.add_argument('--success-rates', type=float, nargs='+', default=[0.5, 0.75, 0.95])
+    parser.add_argument('--weak-points', type=int, default=1, help='Simulated points (counting from the last) the user can barely see')
+    parser.add_argument('--weak-success-rate', type=float, default=0.2)
+    parser.add_argument('--max-attempts', type=int, default=100, help='Simulated collect_data attempts per point')
+    parser.add_argument('--max-false-acceptance', type=float, default=0.05, help='Of users out of position, and of weak points')
+    parser.add_argument('--max-false-rejection', type=float, default=0.15, help='Of good points, and of sessions never in position')
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--processes', type=int, help='Default: one per core')
+    parser.add_argument('--chunk-size', type=int, default=50)
+    parser.add_argument('--verify', type=int, default=5, help='Combinations of each kind to check against the tracker\'s classes (0 to skip)')
+    parser.add_argument('--output', help='Write every combination\'s settings and metrics as JSON to this file')
+
+    sweep(parser.parse_args())
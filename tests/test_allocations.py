@@ -0,0 +1,52 @@
+"""
+Tracking the user's position allocates nothing per sample once warmed up,
+from the tracker's callback through filtering and scoring to the sinks.
+python benchmark.py allocations prints the same measurements
+"""
+import tracemalloc
+import types
+
+import pytest
+
+from benchmark import head_track, tracking_allocations
+from channels import LatestValueMailbox
+from filters import head_filters
+
+SAMPLES = 3000
+WARMUP = 1000
+
+@pytest.fixture(scope='module')
+def guide_dicts():
+    guide_dicts, _ = head_track(WARMUP + SAMPLES, seed=0, head_drift='wandering', position_noise=0.005)
+
+    return guide_dicts
+
+@pytest.fixture
+def tracing():
+    tracemalloc.start()
+
+    try:
+        yield
+    finally:
+        tracemalloc.stop()
+
+@pytest.mark.parametrize('in_position', [False, True], ids=['positioning', 'in position'])
+@pytest.mark.parametrize('head_filter', sorted(head_filters))
+def test_tracking_allocates_nothing(guide_dicts, tracing, head_filter, in_position):
+    held, peak = tracking_allocations(guide_dicts, WARMUP, head_filter, in_position)
+
+    assert held == 0
+    assert peak == 0
+
+@pytest.mark.parametrize('in_position', [False, True], ids=['positioning', 'in position'])
+def test_frame_sink_allocates_nothing(guide_dicts, tracing, in_position):
+    gui = pytest.importorskip('gui', reason='needs wx')
+
+    # All the sink needs of a CalibrationFrame for user positions is its mailbox
+    frame = types.SimpleNamespace(user_position_mailbox=LatestValueMailbox())
+
+    held, peak = tracking_allocations(guide_dicts, WARMUP, 'kalman', in_position, gui.CalibrationFrameSink(frame))
+
+    assert held == 0
+    assert peak == 0
+    assert frame.user_position_mailbox.take() is not None
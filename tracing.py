@@ -0,0 +1,117 @@
+import bisect
+import time
+
+from stats import RollingStats
+
+class LatencyHistogram:
+    """Counts of durations in power-of-two microsecond buckets (1 us to ~16 s)"""
+
+    bounds = [2 ** exponent / 1_000_000 for exponent in range(25)]  # Upper bounds, in seconds
+
+    def __init__(self):
+        self.counts = [0] * (len(self.bounds) + 1)  # Last bucket catches everything slower
+        self.count = 0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+
+    def percentile(self, percent):
+        """Upper bound of the bucket holding the given percentile"""
+        target = self.count * percent / 100
+        seen = 0
+
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+
+            if bucket_count and seen >= target:
+                return self.bounds[min(index, len(self.bounds) - 1)]
+
+        return 0.0
+
+    def report_text(self):
+        lines = []
+
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count:
+                upper = self.bounds[index] * 1000 if index < len(self.bounds) else float('inf')
+                lines.append(f"    <= {upper:9.3f} ms: {bucket_count}")
+
+        return "\n".join(lines)
+
+class LatencyTracer:
+    """
+    Follows user position samples from the SDK callback to the screen.
+
+    Each traced guide carries a list of perf_counter stamps, one per stage it
+    has passed. As a stage completes, the time since the previous stamp goes
+    into that stage's rolling window (for the --debug overlay) and into its
+    histogram (dumped at exit).
+    """
+
+    # Stage name -> index of the stamp that stage ends with
+    stages = {
+        'parse': 1,  # SDK callback to UserPositionGuide
+        'score': 2,  # Filtering and scoring
+        'post': 3,  # Handing the guide to the sink
+        'queue': 4,  # Waiting in the mailbox for the next frame tick
+        'paint': 5,  # Frame tick until it has been painted
+    }
+
+    def __init__(self, window=600):
+        self.recent = {stage: RollingStats(window) for stage in list(self.stages) + ['total']}
+        self.histograms = {stage: LatencyHistogram() for stage in list(self.stages) + ['total']}
+
+    def now(self):
+        return time.perf_counter()
+
+    def start(self, guide, received):
+        """received is the now() the raw sample arrived at, before guide was filled in"""
+        # Guides are reused from a models.UserPositionGuideRing, and so are their traces
+        if guide.trace is None:
+            guide.trace = []
+
+        guide.trace.clear()
+        guide.trace.append(received)
+
+    def stamp(self, guide, stage):
+        trace = getattr(guide, 'trace', None)
+
+        # Only the first paint of a guide counts; later frames redraw a stale sample
+        if trace is None or len(trace) != self.stages[stage]:
+            return
+
+        now = time.perf_counter()
+        trace.append(now)
+
+        self.record(stage, now - trace[-2])
+
+        if stage == 'paint':
+            self.record('total', now - trace[0])
+
+    def record(self, stage, seconds):
+        self.recent[stage].add(seconds)
+        self.histograms[stage].add(seconds)
+
+    def overlay_text(self):
+        return "\n".join(
+            f"{stage}: {stats.summary_text()}"
+            for stage, stats in self.recent.items()
+        )
+
+    def report_text(self):
+        sections = []
+
+        for stage, histogram in self.histograms.items():
+            if histogram.count == 0:
+                sections.append(f"  {stage}: no samples")
+                continue
+
+            sections.append(
+                f"  {stage} (n={histogram.count}, "
+                f"p50 <= {histogram.percentile(50) * 1000:0.3f} ms, "
+                f"p99 <= {histogram.percentile(99) * 1000:0.3f} ms)\n"
+                f"{histogram.report_text()}"
+            )
+
+        return "User position latency by stage:\n" + "\n".join(sections)
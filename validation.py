@@ -0,0 +1,84 @@
+import threading
+
+import numpy as np
+
+from layouts import ASPECT_RATIO
+
+class GazeRingBuffer:
+    """
+    The most recent gaze points, in preallocated arrays. Appended to from the
+    tracker's gaze data callback (hundreds of times a second) and measured
+    from the calibrating thread, so both sides hold the lock only briefly.
+    """
+
+    def __init__(self, capacity):
+        self.x = np.empty(capacity)
+        self.y = np.empty(capacity)
+        self.capacity = capacity
+        self.next = 0  # Where the next point goes
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def clear(self):
+        with self.lock:
+            self.next = 0
+            self.count = 0
+
+    def append(self, x, y):
+        with self.lock:
+            self.x[self.next] = x
+            self.y[self.next] = y
+            self.next = (self.next + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+
+    def ordered(self):
+        """Copies of the x and y arrays, oldest point first"""
+        with self.lock:
+            if self.count < self.capacity:
+                return self.x[:self.count].copy(), self.y[:self.count].copy()
+
+            return np.roll(self.x, -self.next), np.roll(self.y, -self.next)
+
+def combined_gaze_point(gaze_data):
+    """
+    Average of the valid eyes' gaze points on the display area (normalized),
+    from a gaze data dictionary. None if neither eye is valid.
+    """
+    left_valid = gaze_data['left_gaze_point_validity']
+    right_valid = gaze_data['right_gaze_point_validity']
+
+    if left_valid and right_valid:
+        left_x, left_y = gaze_data['left_gaze_point_on_display_area']
+        right_x, right_y = gaze_data['right_gaze_point_on_display_area']
+
+        return (left_x + right_x) / 2, (left_y + right_y) / 2
+
+    if left_valid:
+        return gaze_data['left_gaze_point_on_display_area']
+
+    if right_valid:
+        return gaze_data['right_gaze_point_on_display_area']
+
+    return None
+
+def measure(buffer, target):
+    """
+    (samples, accuracy, precision) of the buffered gaze at a target, in the
+    screen heights layouts.gaze_distance uses. Accuracy is how far the mean
+    gaze point is from the target, and precision the RMS distance between
+    successive samples. Both are None without at least two samples.
+    """
+    x, y = buffer.ordered()
+
+    if len(x) < 2:
+        return len(x), None, None
+
+    # Scaled, so a distance across counts as much as the same distance down
+    x = x * ASPECT_RATIO
+    target_x = target[0] * ASPECT_RATIO
+    target_y = target[1]
+
+    accuracy = float(np.hypot(x.mean() - target_x, y.mean() - target_y))
+    precision = float(np.sqrt(np.mean(np.diff(x) ** 2 + np.diff(y) ** 2)))
+
+    return len(x), accuracy, precision